@@ -22,22 +22,162 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import argparse
+import signal
+import threading
 from wsgiref import simple_server
 
 import falcon
+import tracing
+from binary_frame import Keyboard_Frame_Api
+from effects import Effect_Engine
+from event_stream import Keyboard_Event_Stream_Api, Stream_Limit
+from hotplug import Hotplug_Watcher
 from keyboard import *
+from keyboard_manager import Keyboard_Manager, Keyboard_Manager_Api, Serial_Router
+from metrics import Metrics_Api
+from profiler import Profiler_Api
+from threaded_server import Thread_Pool_WSGI_Server
 
-# The falcon api instance
-app = falcon.API()
+# The WebSocket API needs the websockets package, the HTTP API works without it
+try:
+    from websocket_server import Keyboard_WebSocket_Server
+except ImportError:
+    Keyboard_WebSocket_Server = None
 
-# The api instance to handle requests for the keyboard
-keyboard_api = Keyboard_Falcon_Api(Keyboard())
+# The falcon api instance, the middleware samples the requests to trace when tracing is turned on
+app = falcon.API(middleware=[tracing.Tracing_Middleware()])
+
+
+def create_keyboard_resources(keyboard, stream_limit: Stream_Limit):
+    """This function creates the API resources for an open keyboard, and returns them in a dict, stream_limit is shared by the event streams of all keyboards."""
+
+    # The api instance to handle requests for the keyboard
+    keyboard_api = Keyboard_Falcon_Api(keyboard, enter_keyboard=False)
+
+    # The engine that renders effects on the server, its commands are part of the /keyboard API
+    effect_engine = Effect_Engine(keyboard)
+    effect_engine.add_api_commands(keyboard_api)
+
+    return {
+        "api": keyboard_api,
+        "effects": effect_engine,
+        # The resource that applies binary frames
+        "frame": Keyboard_Frame_Api(keyboard),
+        # The resource that streams the notifications of the keyboard as server-sent events
+        "events": Keyboard_Event_Stream_Api(keyboard, stream_limit=stream_limit),
+    }
 
-# We direct /keyboard to the keyboard object
-app.add_route("/keyboard", keyboard_api)
 
 if __name__ == "__main__":
-    httpd = simple_server.make_server("", 42069, app)
+    # We parse the command line options
+    parser = argparse.ArgumentParser(description="Serves the keyboard API on port 42069.")
+    parser.add_argument("--threads", type=int, default=16, help="the number of requests that are handled at the same time")
+    parser.add_argument("--timeout", type=float, default=10, help="the number of seconds a request may take to arrive, and an idle connection is kept open")
+    parser.add_argument("--single-threaded", action="store_true", help="use wsgiref's simple server, which handles one request at a time")
+    parser.add_argument("--websocket-port", type=int, default=42070, help="the port of the WebSocket API, 0 disables it")
+    parser.add_argument("--max-event-streams", type=int, default=8, help="the number of event streams that may be open at the same time, for all keyboards together, it's always lower than --threads")
+    parser.add_argument("--frame-scheduler", action="store_true", help="merge the color changes made during a frame into one rgb command per frame")
+    parser.add_argument("--diff-rendering", action="store_true", help="only send the keys whose color has changed since the last colors sent to the daemon")
+    parser.add_argument("--serial", action="append", help="the serial number of a keyboard to use, can be used several times (default: all supported keyboards)")
+    parser.add_argument("--device-prefix", help="the directory that ckb-daemon creates its device nodes in (default: /dev/input/ on linux, /var/run/ on macOS)")
+    parser.add_argument("--hotplug-interval", type=float, default=1.0, help="the number of seconds between the checks for unplugged and replugged keyboards, 0 disables reattaching")
+    parser.add_argument("--trace-file", help="write traces of sampled requests to this file, in the Chrome trace format (default: no tracing)")
+    parser.add_argument("--trace-sample-rate", type=float, default=0.01, help="the fraction of the requests that are traced (default 0.01)")
+    parser.add_argument("--profiler", action="store_true", help="serve an on-demand sampling profiler at /debug/profile")
+    args = parser.parse_args()
+
+    # We turn on tracing if a trace file was given
+    trace_writer = tracing.configure(args.trace_file, args.trace_sample_rate) if args.trace_file else None
+
+    # We open all the keyboards, without asking anything
+    keyboard_manager = Keyboard_Manager(serials=args.serial, device_prefix=args.device_prefix,
+                                        frame_scheduler=args.frame_scheduler, diff_rendering=args.diff_rendering).__enter__()
+
+    # Every open event stream uses a server thread, so we always leave threads for the other requests
+    stream_limit = Stream_Limit(max(0, min(args.max_event_streams, (1 if args.single_threaded else args.threads) - 1)))
+    keyboard_resources = {serial: create_keyboard_resources(keyboard, stream_limit)
+                          for serial, keyboard in keyboard_manager.get_keyboards().items()}
+
+    # We direct /keyboard (and /keyboard/frame and /keyboard/events) to the first keyboard
+    default_resources = next(iter(keyboard_resources.values()))
+    app.add_route("/keyboard", default_resources["api"])
+    app.add_route("/keyboard/frame", default_resources["frame"])
+    app.add_route("/keyboard/events", default_resources["events"])
+
+    # We direct /keyboards to the list of keyboards, and /keyboards/<serial> (or /keyboards/all) to the keyboard with that serial number (or all of them)
+    keyboard_apis = {serial: resources["api"] for serial, resources in keyboard_resources.items()}
+    frame_resources = {serial: resources["frame"] for serial, resources in keyboard_resources.items()}
+    event_resources = {serial: resources["events"] for serial, resources in keyboard_resources.items()}
+    keyboard_manager_api = Keyboard_Manager_Api(keyboard_manager, keyboard_apis)
+    app.add_route("/keyboards", keyboard_manager_api)
+    app.add_route("/keyboards/{serial}", keyboard_manager_api)
+    app.add_route("/keyboards/{serial}/frame", Serial_Router(frame_resources))
+    app.add_route("/keyboards/{serial}/events", Serial_Router(event_resources))
+
+    # We serve the metrics of all keyboards in the Prometheus text format
+    app.add_route("/metrics", Metrics_Api(lambda: [keyboard.metrics for keyboard in keyboard_manager.get_keyboards().values()]))
+
+    # The profiler shows the code of the server, so it's only served if it's asked for
+    if args.profiler:
+        app.add_route("/debug/profile", Profiler_Api())
+
+    def open_new_keyboard(serial, device_path):
+        """This function opens a keyboard that was plugged in while the server is running, and adds it to /keyboards/<serial>."""
+
+        if args.serial is not None and serial not in args.serial:
+            return
+
+        resources = create_keyboard_resources(keyboard_manager.open_keyboard(device_path), stream_limit)
+        keyboard_resources[serial] = resources
+        keyboard_apis[serial] = resources["api"]
+        frame_resources[serial] = resources["frame"]
+        event_resources[serial] = resources["events"]
+
+    # We watch for keyboards that are unplugged and plugged back in (or a restart of ckb-daemon), and reattach them
+    hotplug_watcher = None
+    if args.hotplug_interval:
+        hotplug_watcher = Hotplug_Watcher(keyboard_manager, poll_interval=args.hotplug_interval, on_new_device=open_new_keyboard)
+        hotplug_watcher.start()
+
+    # We start the WebSocket API next to the HTTP API, for the first keyboard
+    websocket_server = None
+    if args.websocket_port:
+        if Keyboard_WebSocket_Server is None:
+            print("The websockets package isn't installed, so the WebSocket API is disabled.")
+        else:
+            websocket_server = Keyboard_WebSocket_Server(default_resources["api"], port=args.websocket_port)
+            websocket_server.start()
+
+    if args.single_threaded:
+        httpd = simple_server.make_server("", 42069, app)
+    else:
+        httpd = Thread_Pool_WSGI_Server(("", 42069), app, threads=args.threads, request_timeout=args.timeout)
+
+    def stop_server(signal_number, frame):
+        """This function makes serve_forever return when we get SIGINT or SIGTERM, from another thread as shutdown waits for serve_forever to return."""
+        threading.Thread(target=httpd.shutdown).start()
+
+    signal.signal(signal.SIGINT, stop_server)
+    signal.signal(signal.SIGTERM, stop_server)
+
     httpd.serve_forever()
 
-    keyboard_api.keyboard.__exit__()
\ No newline at end of file
+    # We stop reattaching and opening keyboards first, so nothing is opened while we close everything
+    if hotplug_watcher is not None:
+        hotplug_watcher.stop()
+
+    # We end the event streams, close the connections and wait for the requests that are being handled before we return the keyboards to hardware control
+    for resources in list(keyboard_resources.values()):
+        resources["events"].close()
+    if not args.single_threaded:
+        httpd.shutdown_gracefully()
+    if websocket_server is not None:
+        websocket_server.stop()
+
+    for resources in list(keyboard_resources.values()):
+        resources["effects"].close()
+    keyboard_manager.__exit__()
+
+    if trace_writer is not None:
+        trace_writer.close()
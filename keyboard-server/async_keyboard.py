@@ -0,0 +1,365 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import asyncio
+import os
+import time
+
+from keyboard import Keyboard
+
+
+class AsyncKeyboard(Keyboard):
+    """This class represents a keyboard connected to the ckb-daemon, for use with asyncio.
+    It does the same things as the Keyboard class, but it doesn't use any threads, everything happens on the event loop.
+    Use it with an async with statement, and await the methods that talk to the daemon, like await keyboard.set_multiple_colors(...).
+    Key events can be read with async for event in keyboard.key_events().
+    """
+
+    def __init__(self, diff_rendering: bool = False, notification_buffer_size: int = 1024, device_path: str = None, device_prefix: str = None):
+        """This method stores the options for the keyboard, the actual device is opened by __aenter__.
+        The options mean the same as for the Keyboard class, the frame scheduler isn't supported.
+        """
+
+        super().__init__(diff_rendering=diff_rendering, notification_buffer_size=notification_buffer_size, device_path=device_path, device_prefix=device_prefix)
+
+    async def __aenter__(self):
+        """Creates a keyboard object if there is one connected, in the same way as Keyboard.__enter__ does."""
+
+        # We save the event loop, everything happens on it
+        self.loop = asyncio.get_running_loop()
+
+        # We find the keyboard and read the info about it, and create the locks, buffers, and color stores
+        self._open_device()
+        self._create_state()
+
+        # The bytes that are waiting to be written to the cmd node, and the futures of the commands in them
+        self.cmd_buffer = bytearray()
+        self.cmd_waiters = []
+
+        # Variables that tell if a write is scheduled, and if we're waiting for the cmd node to be writable
+        self.cmd_flush_scheduled = False
+        self.cmd_waiting_for_writer = False
+
+        # The lock that makes sure only one get command is waiting for its responses at a time
+        self.get_async_lock = asyncio.Lock()
+
+        # The event that is set when new notifications have arrived
+        self.notification_signal = asyncio.Event()
+
+        # The part of a line that has been read from the notification node without its newline
+        self.partial_notification_line = b""
+
+        # We open the cmd node once and keep it open, it's non-blocking so a full pipe never blocks the event loop
+        self.cmd_fd = os.open(self.keyboard_path + "cmd", os.O_WRONLY | os.O_NONBLOCK)
+
+        # We found a notify node, so we register it to the daemon for this keyboard
+        await self.execute_command("notifyon " + str(self.notify_node_nr))
+
+        # We wait for the notification file to exist
+        timeout = time.time() + 2
+        while not os.path.exists(self.notify_path) and time.time() < timeout:
+            await asyncio.sleep(0.01)
+        if not os.path.exists(self.notify_path):
+            # The daemon didn't create the notification file fast enough
+            print("Failed to create notification file before timeout.")
+            exit()
+
+        # We make this device go into software controlled mode
+        await self.execute_command("active")
+
+        # We open the notification node and let the event loop tell us when there is something to read
+        self.notify_fd = os.open(self.notify_path, os.O_RDONLY | os.O_NONBLOCK)
+        self.loop.add_reader(self.notify_fd, self._on_notify_readable)
+
+        # We get the current colors of the keyboard from the daemon, so our copy starts out correct
+        await self.sync_colors_from_daemon()
+
+        return self
+
+    async def __aexit__(self, *args):
+        """This method is called when the instance exits the async with statement and needs to be closed again."""
+
+        # We stop reading the notification node and wake up everything that waits for notifications
+        self._stop_reading()
+
+        # We stop calling the subscribed handlers
+        self._shutdown_dispatcher()
+
+        # We stop rendering the transitions
+        with self.transition_condition:
+            if self.transition_thread is not None:
+                self.transition_thread.cancel()
+                self.transition_thread = None
+
+        # We close the notifying node for this device and make it go back to hardware controlled mode
+        self.execute_command("notifyoff " + str(self.notify_node_nr))
+        await self.execute_command("idle")
+
+        # We close the cmd node
+        if self.cmd_waiting_for_writer:
+            self.loop.remove_writer(self.cmd_fd)
+        os.close(self.cmd_fd)
+
+    def execute_command(self, cmd: str, wait: bool = True):
+        """This method is used to use a string as a command to the daemon, only use this if you know what you're doing.
+        The command is queued and all commands queued during the same event loop iteration are written together.
+        It returns a future that is done when the command has been written, the wait argument is only there to match the Keyboard class.
+        """
+
+        # We add the command to the buffer
+        self.cmd_buffer += (cmd + "\n").encode("utf-8")
+        self.cmd_queued_count += 1
+
+        future = self.loop.create_future()
+        self.cmd_waiters.append(future)
+
+        # We schedule a write, unless one is already scheduled or we're waiting for the cmd node to be writable
+        if not self.cmd_flush_scheduled and not self.cmd_waiting_for_writer:
+            self.cmd_flush_scheduled = True
+            self.loop.call_soon(self._flush_commands)
+
+        return future
+
+    def _wait_for_command(self, command_number):
+        """This method does nothing, the asynchronous methods await drain instead, as waiting would block the event loop."""
+
+    async def drain(self):
+        """This method waits until all queued commands have been written."""
+
+        if self.cmd_waiters:
+            await self.cmd_waiters[-1]
+
+    def _flush_commands(self):
+        """This method writes as much of the command buffer as the cmd node accepts, and waits for it to be writable if something is left."""
+
+        self.cmd_flush_scheduled = False
+
+        try:
+            written = os.write(self.cmd_fd, self.cmd_buffer)
+        except BlockingIOError:
+            written = 0
+
+        if written:
+            del self.cmd_buffer[:written]
+            self.cmd_write_count += 1
+
+        if self.cmd_buffer:
+            # The pipe is full, so we let the event loop tell us when we can write the rest
+            if not self.cmd_waiting_for_writer:
+                self.cmd_waiting_for_writer = True
+                self.loop.add_writer(self.cmd_fd, self._flush_commands)
+
+            return
+
+        if self.cmd_waiting_for_writer:
+            self.cmd_waiting_for_writer = False
+            self.loop.remove_writer(self.cmd_fd)
+
+        # Everything has been written, so we tell everyone that waits for their commands
+        self.cmd_written_count = self.cmd_queued_count
+        for future in self.cmd_waiters:
+            if not future.done():
+                future.set_result(None)
+        self.cmd_waiters = []
+
+    def _on_notify_readable(self):
+        """This method is called by the event loop when there is data to read from the notification node."""
+
+        notify_data = self._read_available_notifications()
+
+        if notify_data is None:
+            # The daemon has closed the notification node, so we print an error and stop reading
+            print(
+                "Could not read the notification node, please make sure that ckb-daemon is running and that the keyboard hasn't been unplugged and try again")
+            self._stop_reading()
+            return
+
+        # We parse and store the data, and wake up everything that waits for notifications
+        self.partial_notification_line = self._handle_notification_data(self.partial_notification_line + notify_data)
+        self.notification_signal.set()
+
+    def _stop_reading(self):
+        """This method stops reading the notification node and wakes up everything that waits for notifications."""
+
+        if self.exiting:
+            return
+
+        self.exiting = True
+        self.loop.remove_reader(self.notify_fd)
+        os.close(self.notify_fd)
+        self.notification_signal.set()
+
+    async def key_events(self):
+        """This method is an async iterator of key events, as (timestamp, key, pressed) tuples like get_key_events returns.
+        It ends when the keyboard is closed. The events are taken from the same buffer as get_key_events, so only use one of them.
+        """
+
+        while True:
+            # We clear the signal before we look for events, so we can't miss events that arrive while we wait
+            self.notification_signal.clear()
+
+            for event in self.get_key_events():
+                yield event
+
+            if self.exiting:
+                return
+
+            await self.notification_signal.wait()
+
+    async def get_parameter(self, parameter: str, timeout: float = 1):
+        """This method is the asynchronous version of Keyboard.get_parameter."""
+
+        return (await self.get_parameters([parameter], timeout))[parameter]
+
+    async def get_parameters(self, parameters: list, timeout: float = 1):
+        """This method is the asynchronous version of Keyboard.get_parameters."""
+
+        # We check that the parameter names are valid, if they're invalid we raise a ValueError
+        if len(parameters) == 0 or not all([x.replace("_", "").isalnum() for x in parameters]):
+            raise ValueError
+
+        # The responses we've gotten
+        responses = {}
+
+        async with self.get_async_lock:
+            # We remove old responses to the same parameters (from get commands that timed out) so we don't mistake them for ours
+            with self.notify_lock:
+                self._take_responses(parameters)
+
+            # We send the get command
+            await self.execute_command("@" + str(self.notify_node_nr) + " get " + " ".join([":" + x for x in parameters]))
+
+            # We wait for the responses until the deadline
+            deadline = self.loop.time() + timeout
+            while True:
+                self.notification_signal.clear()
+
+                with self.notify_lock:
+                    responses.update(self._take_responses([x for x in parameters if x not in responses]))
+
+                # We check if we've gotten every response or if we've run out of time
+                remaining_time = deadline - self.loop.time()
+                if len(responses) == len(parameters) or remaining_time <= 0 or self.exiting:
+                    break
+
+                try:
+                    await asyncio.wait_for(self.notification_signal.wait(), remaining_time)
+                except asyncio.TimeoutError:
+                    pass
+
+        return {x: responses.get(x, []) for x in parameters}
+
+    async def get_all_color_pairs(self):
+        """This method is the asynchronous version of Keyboard.get_all_color_pairs."""
+
+        return self._parse_color_pairs(await self.get_parameter("rgb"))
+
+    async def sync_colors_from_daemon(self):
+        """This method is the asynchronous version of Keyboard.sync_colors_from_daemon."""
+
+        return self._store_daemon_colors(await self.get_all_color_pairs())
+
+    async def set_key_color(self, key: str, rgb: tuple):
+        """This method is the asynchronous version of Keyboard.set_key_color."""
+
+        result = Keyboard.set_key_color(self, key, rgb)
+        await self.drain()
+        return result
+
+    async def set_full_color(self, rgb: tuple):
+        """This method is the asynchronous version of Keyboard.set_full_color."""
+
+        result = Keyboard.set_full_color(self, rgb)
+        await self.drain()
+        return result
+
+    async def set_multiple_colors(self, keys_and_colors: list, background: tuple = None):
+        """This method is the asynchronous version of Keyboard.set_multiple_colors."""
+
+        result = Keyboard.set_multiple_colors(self, keys_and_colors, background)
+        await self.drain()
+        return result
+
+    async def fade_colors(self, keys_and_colors: list, duration: float, background: tuple = None, easing: str = "linear"):
+        """This method is the asynchronous version of Keyboard.fade_colors, it returns when the fade has started."""
+
+        result = Keyboard.fade_colors(self, keys_and_colors, duration, background, easing)
+        await self.drain()
+        return result
+
+    def _start_transition_timer(self):
+        """This method schedules the first frame of the transitions on the event loop, instead of starting a thread like Keyboard does.
+        The transition_thread variable holds the handle of the next scheduled frame, it's None when no frame is scheduled.
+        """
+
+        self.transition_thread = self.loop.call_soon(self._render_transition_frame)
+
+    def _render_transition_frame(self):
+        """This method renders one frame of the transitions, and schedules the next frame if there are transitions left."""
+
+        _, transitions_left = self._render_transitions()
+
+        with self.transition_condition:
+            if self.exiting or (not transitions_left and not self.transitions):
+                self.transition_thread = None
+                return
+
+            self.transition_thread = self.loop.call_later(1 / self.fps, self._render_transition_frame)
+
+    async def set_frame(self, colors, slots: list = None):
+        """This method is the asynchronous version of Keyboard.set_frame."""
+
+        result = Keyboard.set_frame(self, colors, slots)
+        await self.drain()
+        return result
+
+    async def cmd_set_fps(self, fps: int):
+        """This method is the asynchronous version of Keyboard.cmd_set_fps."""
+
+        Keyboard.cmd_set_fps(self, fps)
+        await self.drain()
+
+    async def cmd_set_notification(self, keys: list):
+        """This method is the asynchronous version of Keyboard.cmd_set_notification."""
+
+        Keyboard.cmd_set_notification(self, keys)
+        await self.drain()
+
+    async def cmd_unset_notification(self, keys: list):
+        """This method is the asynchronous version of Keyboard.cmd_unset_notification."""
+
+        Keyboard.cmd_unset_notification(self, keys)
+        await self.drain()
+
+    async def enable_notifications(self, keys: list):
+        """This method is the asynchronous version of Keyboard.enable_notifications."""
+
+        Keyboard.enable_notifications(self, keys)
+        await self.drain()
+
+    async def disable_notifications(self, keys: list):
+        """This method is the asynchronous version of Keyboard.disable_notifications."""
+
+        Keyboard.disable_notifications(self, keys)
+        await self.drain()
@@ -0,0 +1,174 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+
+import falcon
+
+# A binary frame is the colors of the keys of a keyboard as 3 bytes (R, G, B) per key, in the order of the model's key layout in keyboard_server_config.json
+# It can start with a header, the magic bytes, the format version (1 byte), and flags (1 byte)
+# If the key mask flag is set, the header is followed by a bit mask with a bit for every key in the layout (bit i of byte i // 8 is key i),
+# and there are only colors for the keys whose bit is set
+# A frame that is exactly 3 bytes per key is always a frame without a header, so the padding flag adds a byte after the header (and mask)
+# to frames with a header that would have that length
+FRAME_MAGIC = b"CKBF"
+FRAME_FORMAT_VERSION = 1
+FRAME_FLAG_KEY_MASK = 1
+FRAME_FLAG_PADDING = 2
+FRAME_HEADER_SIZE = len(FRAME_MAGIC) + 2
+
+
+def encode_frame(keycodes: list, key_colors: dict, background: tuple = None):
+    """This function encodes colors as a binary frame for a keyboard with the layout keycodes.
+    key_colors is a dict of keycode to color (as a tuple of 3 ints), keys that aren't in the layout are ignored.
+    If background is a color, a frame without a header with a color for every key is returned, the keys that aren't in key_colors get the background.
+    Else a frame with a key mask is returned, so only the keys in key_colors are changed.
+    """
+
+    if background is not None:
+        background = bytes(background)
+        return b"".join([bytes(key_colors[key]) if key in key_colors else background for key in keycodes])
+
+    # We set the bits of the keys that we have colors for
+    mask = bytearray((len(keycodes) + 7) // 8)
+    colors = []
+    for slot, key in enumerate(keycodes):
+        if key in key_colors:
+            mask[slot // 8] |= 1 << (slot % 8)
+            colors.append(bytes(key_colors[key]))
+
+    # We pad the frame if it would be mistaken for a frame without a header
+    flags, padding = FRAME_FLAG_KEY_MASK, b""
+    if FRAME_HEADER_SIZE + len(mask) + 3 * len(colors) == 3 * len(keycodes):
+        flags, padding = flags | FRAME_FLAG_PADDING, b"\x00"
+
+    return FRAME_MAGIC + bytes((FRAME_FORMAT_VERSION, flags)) + bytes(mask) + padding + b"".join(colors)
+
+
+def decode_frame(frame, key_count: int):
+    """This function decodes a binary frame for a keyboard with key_count keys in its layout, without copying the colors.
+    It returns a tuple of a memoryview of the colors and the list of slot indices they're for, or None if the frame has a color for every key.
+    It raises ValueError if the frame is invalid.
+    """
+
+    frame = memoryview(frame)
+
+    # A frame without a header has a color for every key, we check the length first as the colors may start with the magic bytes
+    if len(frame) == 3 * key_count:
+        return frame, None
+
+    if frame[:len(FRAME_MAGIC)] != FRAME_MAGIC:
+        raise ValueError("The frame has to be 3 bytes per key")
+
+    if len(frame) < FRAME_HEADER_SIZE or frame[len(FRAME_MAGIC)] != FRAME_FORMAT_VERSION:
+        raise ValueError("Unsupported frame format version")
+
+    flags = frame[len(FRAME_MAGIC) + 1]
+    colors = frame[FRAME_HEADER_SIZE:]
+
+    # We find the slots whose bits are set in the mask, or use all of them
+    if flags & FRAME_FLAG_KEY_MASK:
+        mask_size = (key_count + 7) // 8
+        mask, colors = bytes(colors[:mask_size]), colors[mask_size:]
+        if len(mask) != mask_size:
+            raise ValueError("The key mask is too short")
+
+    # We skip the padding byte
+    if flags & FRAME_FLAG_PADDING:
+        if not len(colors):
+            raise ValueError("The frame is too short")
+        colors = colors[1:]
+
+    if not flags & FRAME_FLAG_KEY_MASK:
+        if len(colors) != 3 * key_count:
+            raise ValueError("The frame has to be 3 bytes per key")
+
+        return colors, None
+
+    slots = [slot for slot in range(key_count) if mask[slot // 8] >> (slot % 8) & 1]
+    if len(colors) != 3 * len(slots):
+        raise ValueError("The frame has to be 3 bytes per key in the key mask")
+
+    return colors, slots
+
+
+class Keyboard_Frame_Api(object):
+    """This class is a falcon resource that lets clients set the colors of the whole keyboard (or many keys) with one binary frame.
+    A GET request returns the key layout that frames use, and a POST request with an application/octet-stream body applies a frame (see encode_frame).
+    A full frame is 3 bytes per key, a few hundred bytes instead of the kilobytes of JSON that set_rgb_multiple needs, and it's applied without parsing any text.
+    """
+
+    def __init__(self, keyboard):
+        """This method creates the resource for keyboard, which must already be opened."""
+
+        self.keyboard = keyboard
+
+        # The layout doesn't change while the keyboard is open, so we encode it once
+        self.key_layout = self.keyboard.get_key_layout()
+        self.layout_body = json.dumps({
+            "model": self.keyboard.model_identifier,
+            "keycodes": self.key_layout,
+            "format_version": FRAME_FORMAT_VERSION,
+        })
+
+        # The largest valid frame, a header and a key mask with every key set
+        self.max_frame_size = FRAME_HEADER_SIZE + (len(self.key_layout) + 7) // 8 + 3 * len(self.key_layout)
+
+    def on_get(self, req, resp):
+        """This method handles getting the key layout that frames use."""
+
+        # The requester has to be able to accept json
+        if req.client_accepts_json:
+            resp.status = falcon.HTTP_200
+            resp.body = self.layout_body
+
+        else:
+            resp.status = falcon.HTTP_417
+            resp.body = json.dumps({"message": "Client doesn't accept JSON"})
+
+    def on_post(self, req, resp):
+        """This method handles applying a binary frame."""
+
+        # We check the length before we read anything, so a huge body isn't read into memory
+        if req.content_length in (0, None) or req.content_length > self.max_frame_size:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": "Invalid frame size"})
+            return
+
+        frame = req.stream.read(req.content_length)
+
+        try:
+            colors, slots = decode_frame(frame, len(self.key_layout))
+        except ValueError as e:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": str(e)})
+            return
+
+        if self.keyboard.set_frame(colors, slots):
+            resp.status = falcon.HTTP_200
+            resp.body = json.dumps({"message": "Command successfully executed"})
+
+        else:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": "Invalid frame"})
@@ -0,0 +1,467 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import collections
+import os
+import select
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+from keyboard import load_config
+
+
+class Emulated_Device(object):
+    """This class is one device of a Ckb_Daemon_Emulator, a ckbN directory with the same nodes as ckb-daemon creates for a keyboard.
+    It reads the commands written to its cmd node, keeps the colors of the keys in a framebuffer, and writes notifications to the notify nodes.
+    """
+
+    def __init__(self, prefix: str, number: int, model: str, serial: str, keys: list, on_command=None):
+        """This method creates the device nodes in prefix, the commands are read once start is called.
+        model is a supported device from the config (like "corsair k70"), and keys is its key layout.
+        on_command(device, line, timestamp) is called from the reader thread for every command line, with the time.perf_counter() it was read at.
+        """
+
+        self.number = number
+        self.model = model
+        self.serial = serial
+        self.keys = keys
+        self.on_command = on_command
+        self.path = os.path.join(prefix, "ckb" + str(number), "")
+
+        # The lock of the state of the device, which is changed by the reader thread and read by everyone else
+        self.lock = threading.Lock()
+
+        # The color of every key, all keys are white when the device is created like on a real keyboard
+        self.framebuffer = {key: "ffffff" for key in keys}
+
+        # The state that the commands change
+        self.active = False
+        self.fps = 30
+
+        # The open notify nodes, node number to write fd, and the keys that every node gets key events for
+        self.notify_fds = {}
+        self.notify_keys = {}
+
+        # Counters of what the device has done
+        self.command_count = 0
+        self.rgb_command_count = 0
+        self.unknown_command_count = 0
+        self.bytes_read = 0
+        self.notification_count = 0
+        self.dropped_notification_count = 0
+
+        # We create the directory and the info nodes, ckb-daemon writes one line to every one of them
+        os.makedirs(self.path)
+        for name, content in (("model", model.title() + " RGB Gaming Keyboard"),
+                              ("serial", serial),
+                              ("features", model + " rgb pollrate bind notify fwversion"),
+                              ("pollrate", "1 ms")):
+            with open(self.path + name, "w") as info_file:
+                info_file.write(content + "\n")
+
+        # We create the cmd node and keep it open for reading and writing, so it never reaches the end of the file when a writer closes it
+        os.mkfifo(self.path + "cmd")
+        self.cmd_fd = os.open(self.path + "cmd", os.O_RDWR | os.O_NONBLOCK)
+
+        # ckb-daemon always has notify node 0
+        self._open_notify_node(0)
+
+        self.exiting = False
+        self.wake_read_fd, self.wake_write_fd = os.pipe()
+        self.thread = threading.Thread(target=self._command_read_thread, daemon=True)
+
+    def start(self):
+        """This method starts reading the commands."""
+
+        self.thread.start()
+
+    def close(self):
+        """This method stops reading the commands and removes the device nodes, like ckb-daemon does when the keyboard is unplugged."""
+
+        self.exiting = True
+        os.write(self.wake_write_fd, b"\0")
+        if self.thread.ident is not None:
+            self.thread.join()
+
+        with self.lock:
+            for notify_fd in self.notify_fds.values():
+                os.close(notify_fd)
+            self.notify_fds.clear()
+
+        for fd in (self.cmd_fd, self.wake_read_fd, self.wake_write_fd):
+            os.close(fd)
+
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def get_colors(self):
+        """This method returns a copy of the framebuffer, a dict of key to hex color."""
+
+        with self.lock:
+            return dict(self.framebuffer)
+
+    def press_key(self, key: str, pressed: bool = True):
+        """This method sends a key event for the key to the notify nodes that have notifications turned on for it."""
+
+        line = "key " + ("+" if pressed else "-") + key
+
+        with self.lock:
+            for node, keys in self.notify_keys.items():
+                if key in keys:
+                    self._write_notification(node, line)
+
+    def get_stats(self):
+        """This method returns a dict of counters of what the device has done."""
+
+        with self.lock:
+            return {"serial": self.serial, "commands": self.command_count, "rgb_commands": self.rgb_command_count,
+                    "unknown_commands": self.unknown_command_count, "bytes_read": self.bytes_read, "notifications": self.notification_count,
+                    "dropped_notifications": self.dropped_notification_count, "active": self.active, "fps": self.fps,
+                    "notify_nodes": sorted(self.notify_fds)}
+
+    def handle_command(self, line: str):
+        """This method runs one line of commands, like "rgb w:ff0000" or "@1 get :rgb". Commands that aren't emulated are counted and ignored."""
+
+        words = line.split()
+
+        # A command can start with the notify node that its output goes to, like "@1 get :rgb"
+        node = 0
+        if words and words[0].startswith("@") and words[0][1:].isdigit():
+            node = int(words[0][1:])
+            words = words[1:]
+
+        if not words:
+            return
+
+        command, arguments = words[0], words[1:]
+
+        with self.lock:
+            self.command_count += 1
+
+            if command == "rgb":
+                self.rgb_command_count += 1
+                self._set_colors(arguments)
+
+            elif command == "notifyon" and arguments and arguments[0].isdigit():
+                self._open_notify_node(int(arguments[0]))
+
+            elif command == "notifyoff" and arguments and arguments[0].isdigit():
+                self._close_notify_node(int(arguments[0]))
+
+            elif command in ("active", "idle"):
+                self.active = command == "active"
+
+            elif command == "fps" and arguments and arguments[0].isdigit():
+                self.fps = int(arguments[0])
+
+            elif command == "notify":
+                self._set_notify_keys(node, arguments)
+
+            elif command == "get":
+                self._get(node, arguments)
+
+            else:
+                self.unknown_command_count += 1
+
+    def _set_colors(self, arguments: list):
+        """This method changes the framebuffer with the arguments of an rgb command, a color alone sets all keys. It must be called with the lock."""
+
+        for argument in arguments:
+            keys, _, color = argument.rpartition(":")
+            color = color.lower()
+
+            # We ignore colors that ckb-daemon wouldn't accept
+            if len(color) != 6 or not all(character in "0123456789abcdef" for character in color):
+                continue
+
+            if keys in ("", "all"):
+                for key in self.framebuffer:
+                    self.framebuffer[key] = color
+            else:
+                for key in keys.split(","):
+                    if key in self.framebuffer:
+                        self.framebuffer[key] = color
+
+    def _set_notify_keys(self, node: int, arguments: list):
+        """This method turns key notifications on (like "w") or off (like "w:off") for a notify node. It must be called with the lock."""
+
+        keys = self.notify_keys.setdefault(node, set())
+        for argument in arguments:
+            key, _, state = argument.partition(":")
+            changed_keys = self.keys if key == "all" else [key]
+            if state == "off":
+                keys.difference_update(changed_keys)
+            else:
+                keys.update(changed_keys)
+
+    def _get(self, node: int, arguments: list):
+        """This method writes the responses of a get command to a notify node, only :rgb is emulated. It must be called with the lock."""
+
+        for argument in arguments:
+            if argument != ":rgb":
+                continue
+
+            # ckb-daemon groups the keys with the same color, and only writes the color if all keys have it
+            keys_by_color = collections.OrderedDict()
+            for key, color in self.framebuffer.items():
+                keys_by_color.setdefault(color, []).append(key)
+
+            if len(keys_by_color) == 1:
+                colors = next(iter(keys_by_color))
+            else:
+                colors = " ".join(",".join(keys) + ":" + color for color, keys in keys_by_color.items())
+
+            self._write_notification(node, "mode 1 rgb " + colors)
+
+    def _open_notify_node(self, node: int):
+        """This method creates a notify node and keeps it open for writing. It must be called with the lock, or before the device is started."""
+
+        if node in self.notify_fds or not 0 <= node <= 9:
+            return
+
+        os.mkfifo(self.path + "notify" + str(node))
+
+        # We open it for reading and writing, so opening doesn't wait for a reader, and writes are dropped instead of blocking when nobody reads
+        self.notify_fds[node] = os.open(self.path + "notify" + str(node), os.O_RDWR | os.O_NONBLOCK)
+        self.notify_keys.setdefault(node, set())
+
+    def _close_notify_node(self, node: int):
+        """This method removes a notify node. It must be called with the lock."""
+
+        if node == 0 or node not in self.notify_fds:
+            return
+
+        os.close(self.notify_fds.pop(node))
+        self.notify_keys.pop(node, None)
+        os.remove(self.path + "notify" + str(node))
+
+    def _write_notification(self, node: int, line: str):
+        """This method writes a line to a notify node, and drops it if the node doesn't exist or is full. It must be called with the lock."""
+
+        if node not in self.notify_fds:
+            self.dropped_notification_count += 1
+            return
+
+        try:
+            os.write(self.notify_fds[node], (line + "\n").encode("utf-8"))
+            self.notification_count += 1
+        except BlockingIOError:
+            self.dropped_notification_count += 1
+
+    def _command_read_thread(self):
+        """This method is the thread that reads the cmd node and runs the commands, line by line."""
+
+        partial_line = b""
+
+        while not self.exiting:
+            read, _, _ = select.select([self.cmd_fd, self.wake_read_fd], [], [])
+            if self.cmd_fd not in read:
+                continue
+
+            try:
+                data = os.read(self.cmd_fd, 65536)
+            except BlockingIOError:
+                continue
+            timestamp = time.perf_counter()
+
+            with self.lock:
+                self.bytes_read += len(data)
+
+            *lines, partial_line = (partial_line + data).split(b"\n")
+            for line in lines:
+                line = line.decode("utf-8", errors="replace")
+                if self.on_command is not None:
+                    self.on_command(self, line, timestamp)
+                self.handle_command(line)
+
+
+class Ckb_Daemon_Emulator(object):
+    """This class emulates ckb-daemon in a directory (a temporary one by default), so Keyboard can be tested and benchmarked without a keyboard.
+    It creates the ckb0/connected node and a ckbN directory for every emulated device, and can send key events at a fixed rate.
+    Use it with a with statement, and give its prefix to Keyboard (or the --device-prefix option of the server) as the device_prefix.
+    """
+
+    def __init__(self, prefix: str = None, devices: int = 1, model: str = "corsair k70", key_event_rate: float = 0, on_command=None):
+        """This method stores the options of the emulator, the devices are created by __enter__.
+        prefix is the directory to create the nodes in, if it's None a temporary directory is created and removed by __exit__.
+        devices is the number of devices of the model to create, more can be added with add_device.
+        key_event_rate is the number of key events per second that every device sends (a press and a release are two events), 0 means none.
+        Key events are only sent to the notify nodes that have turned on notifications for the key, like ckb-daemon does.
+        on_command(device, line, timestamp) is passed to every device, see Emulated_Device.
+        """
+
+        self.prefix = None if prefix is None else os.path.join(prefix, "")
+        self.temporary_prefix = prefix is None
+        self.initial_devices = devices
+        self.initial_model = model
+        self.key_event_rate = key_event_rate
+        self.on_command = on_command
+
+        self.config = load_config()
+
+        # The lock and dict of device number to emulated device
+        self.lock = threading.Lock()
+        self.devices = {}
+
+        self.exiting = False
+        self.key_event_thread = None
+
+    def __enter__(self):
+        """This method creates the ckb0 node and the devices, and starts sending key events."""
+
+        if self.temporary_prefix:
+            self.prefix = tempfile.mkdtemp(prefix="ckb-emulator-") + os.sep
+
+        os.makedirs(self.prefix + "ckb0", exist_ok=True)
+        with open(self.prefix + "ckb0/version", "w") as version_file:
+            version_file.write("emulated\n")
+        self._write_connected()
+
+        for _ in range(self.initial_devices):
+            self.add_device(self.initial_model)
+
+        self.key_event_thread = threading.Thread(target=self._key_event_thread, daemon=True)
+        self.key_event_thread.start()
+
+        return self
+
+    def __exit__(self, *args):
+        """This method stops the key events, removes the devices and ckb0, and the directory if it was a temporary one."""
+
+        self.exiting = True
+        self.key_event_thread.join()
+
+        with self.lock:
+            devices, self.devices = list(self.devices.values()), {}
+        for device in devices:
+            device.close()
+
+        if self.temporary_prefix:
+            shutil.rmtree(self.prefix, ignore_errors=True)
+        else:
+            shutil.rmtree(self.prefix + "ckb0", ignore_errors=True)
+
+    def add_device(self, model: str = "corsair k70", serial: str = None):
+        """This method plugs in a device of the model, with the lowest free device number, and returns it.
+        The serial number is made from the device number if it isn't given.
+        """
+
+        if model not in self.config["supported_devices"]:
+            raise ValueError("Unsupported model: " + model)
+
+        with self.lock:
+            number = min(set(range(1, len(self.devices) + 2)) - set(self.devices))
+            device = Emulated_Device(self.prefix, number, model, serial or "EMULATED{0:04d}".format(number),
+                                     self.config["key_layouts"][model], on_command=self.on_command)
+            self.devices[number] = device
+            device.start()
+            self._write_connected()
+
+        return device
+
+    def remove_device(self, device: Emulated_Device):
+        """This method unplugs a device, its nodes are removed."""
+
+        with self.lock:
+            del self.devices[device.number]
+            self._write_connected()
+
+        device.close()
+
+    def get_devices(self):
+        """This method returns the list of devices, in device number order."""
+
+        with self.lock:
+            return [self.devices[number] for number in sorted(self.devices)]
+
+    def get_device(self, serial: str):
+        """This method returns the device with the serial number, or None if there is none."""
+
+        with self.lock:
+            return next((device for device in self.devices.values() if device.serial == serial), None)
+
+    def get_stats(self):
+        """This method returns a list of the counters of every device."""
+
+        return [device.get_stats() for device in self.get_devices()]
+
+    def _write_connected(self):
+        """This method writes the ckb0/connected node, with a line for every device like ckb-daemon. It must be called with the lock, or before __enter__ returns."""
+
+        # We write a new file and move it over the old one, so readers never see half of it
+        with open(self.prefix + "ckb0/connected.tmp", "w") as connected_file:
+            for number in sorted(self.devices):
+                device = self.devices[number]
+                with open(device.path + "model") as model_file:
+                    connected_file.write("{0:s} {1:s} {2:s}\n".format(device.path.rstrip(os.sep), device.serial, model_file.read().strip()))
+
+        os.replace(self.prefix + "ckb0/connected.tmp", self.prefix + "ckb0/connected")
+
+    def _key_event_thread(self):
+        """This method is the thread that sends key events at key_event_rate, it presses and releases the keys of every device one by one."""
+
+        event_number = 0
+        next_event_time = time.perf_counter()
+
+        while not self.exiting:
+            if self.key_event_rate <= 0:
+                time.sleep(0.05)
+                next_event_time = time.perf_counter()
+                continue
+
+            # We wait until the next event is due, and send the events we're behind on at once
+            next_event_time += 1 / self.key_event_rate
+            delay = next_event_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            for device in self.get_devices():
+                device.press_key(device.keys[(event_number // 2) % len(device.keys)], pressed=event_number % 2 == 0)
+            event_number += 1
+
+
+if __name__ == "__main__":
+    # We parse the command line options
+    parser = argparse.ArgumentParser(description="Emulates ckb-daemon, so the keyboard server can run without a keyboard.")
+    parser.add_argument("--prefix", help="the directory to create the device nodes in (default: a temporary directory)")
+    parser.add_argument("--devices", type=int, default=1, help="the number of keyboards to emulate")
+    parser.add_argument("--model", default="corsair k70", help="the model of the keyboards")
+    parser.add_argument("--key-event-rate", type=float, default=0, help="the number of key events per second that every keyboard sends")
+    args = parser.parse_args()
+
+    with Ckb_Daemon_Emulator(prefix=args.prefix, devices=args.devices, model=args.model, key_event_rate=args.key_event_rate) as emulator:
+        print("Emulating ckb-daemon in " + emulator.prefix + ", start the server with --device-prefix " + emulator.prefix)
+
+        # We run until we get SIGINT or SIGTERM
+        stop_event = threading.Event()
+        signal.signal(signal.SIGINT, lambda signal_number, frame: stop_event.set())
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: stop_event.set())
+        while not stop_event.wait(1):
+            pass
+
+        for stats in emulator.get_stats():
+            print(stats)
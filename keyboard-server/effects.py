@@ -0,0 +1,577 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import abc
+import json
+import math
+import threading
+import time
+import traceback
+
+import falcon
+
+
+class Effect(abc.ABC):
+    """This class is the base of the effects that Effect_Engine renders, every effect renders the colors of a list of keys as a function of time.
+    An effect precomputes everything that only depends on the key positions and its parameters in prepare, so rendering a frame is one pass over the keys.
+    """
+
+    # The parameters of the effect and their default values, a parameter that isn't given gets its default value
+    default_parameters = {}
+
+    # The type of every parameter, "color" is a hex color, "colors" a list of hex colors, "number" a positive number, and "direction" one of the directions
+    parameter_types = {}
+
+    # The largest value of every "number" parameter, the ones that aren't here can be at most max_number
+    # Larger values (or Infinity from JSON) make the effects compute with numbers that don't fit in floats
+    parameter_limits = {}
+    max_number = 1000
+
+    # The directions that effects can move in, as the (x, y) unit vector they move along
+    directions = {"right": (1, 0), "left": (-1, 0), "down": (0, 1), "up": (0, -1)}
+
+    # If this is True, handle_key_event is called with every key press
+    uses_key_events = False
+
+    def __init__(self, positions: list, parameters: dict):
+        """This method creates the effect for keys at positions, a list of (x, y) tuples in key units, and raises ValueError if the parameters are invalid."""
+
+        self.positions = positions
+        self.parameters = dict(self.default_parameters)
+        self.update(parameters)
+
+        # The time the effect started, the effects render relative to it
+        self.start_time = time.time()
+
+    def update(self, parameters: dict):
+        """This method changes some of the parameters of the effect, it raises ValueError if any of them is invalid, and then changes none of them."""
+
+        new_parameters = dict(self.parameters)
+        for name, value in parameters.items():
+            if name not in self.parameter_types or not self._is_valid_parameter(name, value):
+                raise ValueError("Invalid parameter " + str(name))
+
+            new_parameters[name] = value
+
+        self.parameters = new_parameters
+        self.prepare()
+
+    def prepare(self):
+        """This method precomputes what the effect needs to render frames, it's called when the parameters change."""
+        pass
+
+    @abc.abstractmethod
+    def render(self, t: float):
+        """This method returns the colors of the keys at t seconds after the effect started, as 3 bytes (R, G, B) per key."""
+
+    def handle_key_event(self, timestamp: float, position: tuple):
+        """This method is called with the time and position of every key press if the effect uses key events."""
+        pass
+
+    def _is_valid_parameter(self, name: str, value):
+        """This method returns True if value is a valid value for the parameter called name."""
+
+        parameter_type = self.parameter_types[name]
+        if parameter_type == "color":
+            return _is_hex_color(value)
+        if parameter_type == "colors":
+            return type(value) == list and len(value) >= 2 and all([_is_hex_color(color) for color in value])
+        if parameter_type == "number":
+            return type(value) in (int, float) and 0 < value <= self.parameter_limits.get(name, self.max_number) and math.isfinite(value)
+        if parameter_type == "direction":
+            return type(value) == str and value in self.directions
+
+        return False
+
+    def _distances(self):
+        """This method returns the distance of every key along the direction parameter, from the edge of the keyboard that the effect moves from."""
+
+        direction = self.directions[self.parameters["direction"]]
+        distances = [x * direction[0] + y * direction[1] for x, y in self.positions]
+
+        start = min(distances) if distances else 0
+        return [distance - start for distance in distances]
+
+
+class Wave_Effect(Effect):
+    """This effect moves a sine wave of color over the keys, from the background color to the color and back."""
+
+    default_parameters = {"color": "ffffff", "background": "000000", "speed": 10, "wavelength": 8, "direction": "right"}
+    parameter_types = {"color": "color", "background": "color", "speed": "number", "wavelength": "number", "direction": "direction"}
+
+    def prepare(self):
+        self.color = bytes.fromhex(self.parameters["color"])
+        self.background = bytes.fromhex(self.parameters["background"])
+
+        # The phase of every key in the wave
+        self.phases = [2 * math.pi * distance / self.parameters["wavelength"] for distance in self._distances()]
+
+    def render(self, t: float):
+        offset = 2 * math.pi * self.parameters["speed"] * t / self.parameters["wavelength"]
+        return _blend(self.background, self.color, [(1 - math.cos(phase - offset)) / 2 for phase in self.phases])
+
+
+class Breathe_Effect(Effect):
+    """This effect fades all keys from the background color to the color and back, once every period seconds."""
+
+    default_parameters = {"color": "ffffff", "background": "000000", "period": 4}
+    parameter_types = {"color": "color", "background": "color", "period": "number"}
+    parameter_limits = {"period": 3600}
+
+    def prepare(self):
+        self.color = bytes.fromhex(self.parameters["color"])
+        self.background = bytes.fromhex(self.parameters["background"])
+
+    def render(self, t: float):
+        # All keys have the same color, so we only compute it once
+        return _blend(self.background, self.color, [(1 - math.cos(2 * math.pi * t / self.parameters["period"])) / 2]) * len(self.positions)
+
+
+class Ripple_Effect(Effect):
+    """This effect sends a ring of color out from every key that is pressed, that fades out over duration seconds."""
+
+    default_parameters = {"color": "ffffff", "background": "000000", "speed": 15, "width": 1.5, "duration": 1}
+    parameter_types = {"color": "color", "background": "color", "speed": "number", "width": "number", "duration": "number"}
+    parameter_limits = {"duration": 60}
+
+    # This effect needs the key presses
+    uses_key_events = True
+
+    def __init__(self, positions: list, parameters: dict):
+        # The lock and list of (start time, distances of every key from the pressed key) of the ripples that haven't faded out
+        self.ripple_lock = threading.Lock()
+        self.ripples = []
+
+        Effect.__init__(self, positions, parameters)
+
+    def prepare(self):
+        self.color = bytes.fromhex(self.parameters["color"])
+        self.background = bytes.fromhex(self.parameters["background"])
+
+    def handle_key_event(self, timestamp: float, position: tuple):
+        # We compute the distances once for every ripple, so rendering it only has to compare them to its radius
+        distances = [math.hypot(x - position[0], y - position[1]) for x, y in self.positions]
+
+        with self.ripple_lock:
+            self.ripples.append((timestamp, distances))
+
+    def render(self, t: float):
+        now = self.start_time + t
+        speed, width, duration = self.parameters["speed"], self.parameters["width"], self.parameters["duration"]
+
+        # We remove the ripples that have faded out
+        with self.ripple_lock:
+            self.ripples = [ripple for ripple in self.ripples if now - ripple[0] < duration]
+            ripples = list(self.ripples)
+
+        intensities = [0.0] * len(self.positions)
+        for start_time, distances in ripples:
+            radius, fade = speed * (now - start_time), 1 - (now - start_time) / duration
+            intensities = [max(intensity, (1 - abs(distance - radius) / width) * fade)
+                           for intensity, distance in zip(intensities, distances)]
+
+        return _blend(self.background, self.color, intensities)
+
+
+class Gradient_Sweep_Effect(Effect):
+    """This effect moves a repeating gradient through the colors over the keys, the gradient is width keys long."""
+
+    default_parameters = {"colors": ["ff0000", "00ff00", "0000ff"], "speed": 5, "width": 22, "direction": "right"}
+    parameter_types = {"colors": "colors", "speed": "number", "width": "number", "direction": "direction"}
+
+    def prepare(self):
+        self.colors = [bytes.fromhex(color) for color in self.parameters["colors"]]
+
+        # The position of every key in the gradient, where the gradient is 1 long
+        self.offsets = [distance / self.parameters["width"] for distance in self._distances()]
+
+    def render(self, t: float):
+        shift = self.parameters["speed"] * t / self.parameters["width"]
+        colors = self.colors
+
+        # Every key is between two of the colors, the gradient wraps around from the last color to the first
+        frame = bytearray()
+        for offset in self.offsets:
+            position = ((offset - shift) % 1) * len(colors)
+            index = int(position) % len(colors)
+            frame += _blend(colors[index], colors[(index + 1) % len(colors)], [position - int(position)])
+
+        return bytes(frame)
+
+
+def _blend(background: bytes, color: bytes, intensities: list):
+    """This function returns a color for every intensity (from 0 to 1) that is that far from background to color, as 3 bytes (R, G, B) per color."""
+
+    (r0, g0, b0), (r1, g1, b1) = background, color
+    return bytes([int(channel + 0.5) for intensity in intensities
+                  for channel in (r0 + (r1 - r0) * intensity, g0 + (g1 - g0) * intensity, b0 + (b1 - b0) * intensity)])
+
+
+def _is_hex_color(value):
+    """This function returns True if value is a properly formatted (lower case) hex color."""
+    return type(value) == str and len(value) == 6 and all([c in "0123456789abcdef" for c in value])
+
+
+class Effect_Engine(object):
+    """This class renders effects on a keyboard on the server, so clients don't have to send a frame for every step of an animation.
+    It renders all running effects at the fps of the keyboard (see Keyboard.cmd_set_fps) on one thread, and sends every frame with Keyboard.set_frame.
+    Every effect covers a list of keys, when effects cover the same keys the one that was started last wins, and keys that no effect covers aren't changed.
+    When an effect stops, its keys keep the last colors it rendered.
+    """
+
+    # The effects that can be started, by name
+    effect_types = {
+        "wave": Wave_Effect,
+        "breathe": Breathe_Effect,
+        "ripple": Ripple_Effect,
+        "gradient_sweep": Gradient_Sweep_Effect,
+    }
+
+    def __init__(self, keyboard):
+        """This method creates an engine for keyboard, which must already be opened. The render thread is started when the first effect starts."""
+
+        self.keyboard = keyboard
+
+        # The keycodes in slot order, and the position of every key in key units, keys without a position in the config are put in a row below the keyboard
+        self.key_layout = self.keyboard.get_key_layout()
+        config_positions = self.keyboard.config.get("key_positions", {})
+        self.key_positions = {key: tuple(config_positions.get(key, (slot, 8))) for slot, key in enumerate(self.key_layout)}
+
+        # The condition that protects the effects and wakes up the render thread, and the dict of effect id to (name, effect, slot list)
+        self.condition = threading.Condition()
+        self.effects = {}
+        self.next_effect_id = 1
+
+        # The render thread, and a variable to signal that it should exit
+        self.render_thread = None
+        self.exiting = False
+
+        # The id of the key event subscription that the effects which use key events need
+        self.subscription_id = None
+
+        # The frame that the effects are rendered into, with 3 bytes per key in slot order
+        self.frame = bytearray(3 * len(self.key_layout))
+
+        # The number of frames rendered, the number of frames skipped because rendering fell behind, and the total time spent rendering
+        self.rendered_frames = 0
+        self.skipped_frames = 0
+        self.render_time = 0.0
+
+    def start_effect(self, name: str, keys: list = None, parameters: dict = None):
+        """This method starts the effect called name on keys, a list of keycodes (None means all keys), with parameters that replace its default parameters.
+        It returns the id of the effect, which can be used with update_effect and stop_effect, and raises ValueError if the arguments are invalid.
+        """
+
+        if type(name) != str or name not in self.effect_types:
+            raise ValueError("Unknown effect " + str(name))
+
+        # We find the slots of the keys, keys that the keyboard doesn't have are ignored
+        if keys is None:
+            slots = list(range(len(self.key_layout)))
+        else:
+            key_set = set(keys)
+            slots = [slot for slot, key in enumerate(self.key_layout) if key in key_set]
+            if not slots:
+                raise ValueError("No valid keys")
+
+        effect = self.effect_types[name]([self.key_positions[self.key_layout[slot]] for slot in slots], parameters or {})
+
+        with self.condition:
+            effect_id = self.next_effect_id
+            self.next_effect_id += 1
+            self.effects[effect_id] = (name, effect, slots)
+
+            # We start the render thread if it isn't running
+            if self.render_thread is None:
+                self.exiting = False
+                self.render_thread = threading.Thread(target=self._render_thread, daemon=True)
+                self.render_thread.start()
+
+            self.condition.notify()
+
+        self._update_key_event_subscription()
+
+        return effect_id
+
+    def update_effect(self, effect_id: int, parameters: dict):
+        """This method changes some of the parameters of a running effect, it returns False if there is no effect with that id.
+        It raises ValueError if any of the parameters is invalid, and then changes none of them.
+        """
+
+        with self.condition:
+            if effect_id not in self.effects:
+                return False
+
+            self.effects[effect_id][1].update(parameters)
+            return True
+
+    def stop_effect(self, effect_id: int):
+        """This method stops an effect, it returns False if there is no effect with that id."""
+
+        with self.condition:
+            if self.effects.pop(effect_id, None) is None:
+                return False
+
+        self._update_key_event_subscription()
+        return True
+
+    def stop_all_effects(self):
+        """This method stops all effects."""
+
+        with self.condition:
+            self.effects.clear()
+
+        self._update_key_event_subscription()
+
+    def get_effects(self):
+        """This method returns a list of dicts that describe the running effects, with their id, name, keys, and parameters."""
+
+        with self.condition:
+            return [{"effect_id": effect_id, "effect": name, "keys": [self.key_layout[slot] for slot in slots], "parameters": effect.parameters}
+                    for effect_id, (name, effect, slots) in self.effects.items()]
+
+    def get_stats(self):
+        """This method returns a dict with the number of running effects, rendered and skipped frames, and the average time it takes to render a frame."""
+
+        with self.condition:
+            return {
+                "effects": len(self.effects),
+                "rendered_frames": self.rendered_frames,
+                "skipped_frames": self.skipped_frames,
+                "average_render_time": self.render_time / self.rendered_frames if self.rendered_frames else 0.0,
+            }
+
+    def close(self):
+        """This method stops all effects and waits for the render thread to exit, it should be called before the keyboard is closed."""
+
+        with self.condition:
+            self.effects.clear()
+            self.exiting = True
+            render_thread, self.render_thread = self.render_thread, None
+            self.condition.notify()
+
+        if render_thread is not None:
+            render_thread.join()
+
+        self._update_key_event_subscription()
+
+    def add_api_commands(self, keyboard_api):
+        """This method adds the effect commands to a Keyboard_Falcon_Api, so clients can control effects with the same requests as the other commands.
+        The POST commands are "start_effect" (arguments "effect", and the optional "keys" and "parameters"), "update_effect" ("effect_id" and "parameters"),
+        and "stop_effect" (the optional "effect_id", all effects are stopped without it), and the GET command "get_effects" returns the running effects.
+        """
+
+        keyboard_api.post_commands.extend([
+            dict(command="start_effect", method=self.cmd_post_start_effect),
+            dict(command="update_effect", method=self.cmd_post_update_effect),
+            dict(command="stop_effect", method=self.cmd_post_stop_effect),
+        ])
+        keyboard_api.get_commands.append(dict(command="get_effects", method=self.cmd_get_get_effects))
+
+    def cmd_post_start_effect(self, req, resp, post_params):
+        """This method handles starting an effect, it sends back the id of the effect."""
+
+        arguments = post_params.get("arguments", {})
+        keys, parameters = arguments.get("keys"), arguments.get("parameters", {})
+
+        # We check the types of the arguments, the effect checks the values of the parameters
+        if (keys is not None and (type(keys) != list or not all([type(key) == str for key in keys]))) or type(parameters) != dict:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": "Invalid arguments"})
+            return
+
+        try:
+            effect_id = self.start_effect(arguments.get("effect"), keys, parameters)
+        except ValueError as e:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": str(e)})
+            return
+
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({"message": "Command successfully executed", "effect_id": effect_id})
+
+    def cmd_post_update_effect(self, req, resp, post_params):
+        """This method handles changing the parameters of a running effect."""
+
+        arguments = post_params.get("arguments", {})
+        parameters = arguments.get("parameters")
+
+        if type(arguments.get("effect_id")) != int or type(parameters) != dict:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": "Invalid arguments"})
+            return
+
+        try:
+            if not self.update_effect(arguments.get("effect_id"), parameters):
+                resp.status = falcon.HTTP_404
+                resp.body = json.dumps({"message": "No such effect"})
+                return
+        except ValueError as e:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": str(e)})
+            return
+
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({"message": "Command successfully executed"})
+
+    def cmd_post_stop_effect(self, req, resp, post_params):
+        """This method handles stopping one or all effects."""
+
+        effect_id = post_params.get("arguments", {}).get("effect_id")
+
+        if effect_id is not None and type(effect_id) != int:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": "Invalid arguments"})
+            return
+
+        if effect_id is None:
+            self.stop_all_effects()
+
+        elif not self.stop_effect(effect_id):
+            resp.status = falcon.HTTP_404
+            resp.body = json.dumps({"message": "No such effect"})
+            return
+
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({"message": "Command successfully executed"})
+
+    def cmd_get_get_effects(self, req, resp, post_params):
+        """This method handles sending back the running effects."""
+
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({"effects": self.get_effects()})
+
+    def _update_key_event_subscription(self):
+        """This method subscribes to key presses if a running effect uses them, and unsubscribes if none does."""
+
+        with self.condition:
+            uses_key_events = any([effect.uses_key_events for _, effect, _ in self.effects.values()])
+
+            if uses_key_events and self.subscription_id is None:
+                # The daemon only sends key events for the keys that notifications are enabled for
+                self.keyboard.enable_notifications(self.key_layout)
+                self.subscription_id = self.keyboard.subscribe_key_events(self._handle_key_event, pressed=True)
+
+            elif not uses_key_events and self.subscription_id is not None:
+                self.keyboard.unsubscribe_key_events(self.subscription_id)
+                self.subscription_id = None
+
+                # The notifications stay enabled for the keys that something else, like an event stream, still uses
+                self.keyboard.disable_notifications(self.key_layout)
+
+    def _handle_key_event(self, timestamp: float, key: str, pressed: bool):
+        """This method gives key presses to the effects that use them, it's called by the key event dispatcher of the keyboard."""
+
+        position = self.key_positions.get(key)
+        if position is None:
+            return
+
+        with self.condition:
+            effects = [effect for _, effect, _ in self.effects.values() if effect.uses_key_events]
+
+        for effect in effects:
+            effect.handle_key_event(timestamp, position)
+
+    def _render_thread(self):
+        """This method renders and sends a frame at the fps of the keyboard while there are effects, it's run on the render thread."""
+
+        try:
+            self._render_loop()
+        finally:
+            # We forget the thread when it ends, so the next effect starts a new one even if this one ended with an exception
+            with self.condition:
+                if self.render_thread is threading.current_thread():
+                    self.render_thread = None
+
+    def _render_loop(self):
+        """This method is the loop of the render thread, it returns when the engine is closed."""
+
+        next_frame_time = time.time()
+
+        while True:
+            with self.condition:
+                # We wait until it's time for the next frame, or until there are effects to render
+                while not self.exiting and (not self.effects or time.time() < next_frame_time):
+                    if not self.effects:
+                        self.condition.wait()
+                        next_frame_time = time.time()
+                    else:
+                        self.condition.wait(next_frame_time - time.time())
+
+                if self.exiting:
+                    return
+
+                effects = list(self.effects.items())
+
+            render_start_time = time.time()
+            self._render_frame(effects, render_start_time)
+            render_end_time = time.time()
+
+            # We schedule the next frame one frame after this one, so frames don't drift, but skip the frames we're too late for
+            frame_interval = 1 / self.keyboard.fps
+            next_frame_time += frame_interval
+            skipped_frames = 0
+            if next_frame_time < render_end_time:
+                skipped_frames = int((render_end_time - next_frame_time) / frame_interval) + 1
+                next_frame_time += skipped_frames * frame_interval
+
+            with self.condition:
+                self.rendered_frames += 1
+                self.skipped_frames += skipped_frames
+                self.render_time += render_end_time - render_start_time
+
+    def _render_frame(self, effects: list, now: float):
+        """This method renders the effects, a list of (effect id, (name, effect, slot list)) in the order they were started, and sends the colors of the keys they cover to the keyboard."""
+
+        frame = self.frame
+        covered_slots = set()
+
+        for effect_id, (name, effect, slots) in effects:
+            # An effect that fails to render is stopped, so it can't stop the other effects from rendering
+            try:
+                colors = effect.render(now - effect.start_time)
+                if len(colors) != 3 * len(slots):
+                    raise ValueError("The effect rendered the wrong number of colors")
+            except Exception:
+                print("The effect " + name + " failed to render and was stopped:")
+                traceback.print_exc()
+                self.stop_effect(effect_id)
+                continue
+
+            # An effect on all keys can be copied in one go
+            if len(slots) == len(self.key_layout):
+                frame[:] = colors
+            else:
+                for position, slot in enumerate(slots):
+                    frame[3 * slot:3 * slot + 3] = colors[3 * position:3 * position + 3]
+
+            covered_slots.update(slots)
+
+        if not covered_slots:
+            return
+        if len(covered_slots) == len(self.key_layout):
+            self.keyboard.set_frame(frame)
+        else:
+            slots = sorted(covered_slots)
+            self.keyboard.set_frame(b"".join([frame[3 * slot:3 * slot + 3] for slot in slots]), slots)
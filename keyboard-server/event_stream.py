@@ -0,0 +1,343 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import collections
+import json
+import threading
+import time
+
+import falcon
+
+
+class Keyboard_Event_Stream_Api(object):
+    """This class is a falcon resource that streams the notifications of a keyboard as server-sent events (text/event-stream).
+    Every notification line is sent as an event, key events as "key" events with {"key": ..., "pressed": ..., "timestamp": ...} as data,
+    and all other lines as "notification" events with {"line": ..., "timestamp": ...} as data.
+    The query parameter keys (like ?keys=w,a,s,d) only sends the key events of those keys, other notifications are still sent.
+    Notifications of the keys a stream sends are enabled while it's open.
+
+    All streams are fed from the notification reader of the keyboard, which adds every event to a history and to the buffer of every stream.
+    A stream's buffer is bounded, if a client reads slower than events arrive the oldest ones are dropped, and it gets a "dropped" event with the number of lost events.
+    Every event has an id, a client that reconnects with a Last-Event-ID header gets the events it missed, if they're still in the history.
+    """
+
+    def __init__(self, keyboard, stream_limit=None, buffer_size: int = 256, history_size: int = 1024, keep_alive_interval: float = 15):
+        """This method creates the resource and starts listening to the notifications of keyboard, which must already be opened.
+        stream_limit is a Stream_Limit that limits the number of open streams, every stream uses one server thread while it's open,
+        so the resources of all keyboards of a server should share one that is lower than the number of server threads. None means a limit of 8 streams.
+        buffer_size is the maximum number of events that wait to be sent to one client, and history_size the number of events that are kept for reconnecting clients.
+        keep_alive_interval is the number of seconds after which a comment is sent to a client that got no events, so dead connections are noticed.
+        """
+
+        self.keyboard = keyboard
+        self.stream_limit = Stream_Limit(8) if stream_limit is None else stream_limit
+        self.buffer_size = buffer_size
+        self.keep_alive_interval = keep_alive_interval
+
+        # The lock that protects the history and the set of streams
+        self.lock = threading.Lock()
+
+        # The history of (id, event name, data) tuples, and the number of the next event
+        self.history = collections.deque(maxlen=history_size)
+        self.next_event_number = 1
+
+        # The ids restart when the server restarts, so they include the time the server started to not be mistaken for old ones
+        self.id_prefix = format(int(time.time() * 1000), "x") + "-"
+
+        # The keys of the keyboard, a stream without keys enables notifications of all of them
+        self.key_layout = self.keyboard.get_key_layout()
+
+        # The set of open streams, and a variable to signal that all streams should be closed
+        self.streams = set()
+        self.closing = False
+
+        self.keyboard.add_notification_listener(self._add_notifications)
+
+    def on_get(self, req, resp):
+        """This method handles a request for a stream of events."""
+
+        # The requester has to be able to accept an event stream
+        if not req.client_accepts("text/event-stream"):
+            resp.status = falcon.HTTP_417
+            resp.body = json.dumps({"message": "Client doesn't accept text/event-stream"})
+            return
+
+        # We only send the key events of the requested keys, if there are any
+        keys = req.get_param_as_list("keys")
+        keys = None if not keys else set(keys)
+
+        # The daemon only sends key events of the keys that notifications are enabled for, so we enable them for the keys of the keyboard that the stream sends
+        notification_keys = self.key_layout if keys is None else [key for key in self.key_layout if key in keys]
+
+        stream = Event_Stream(keys, self.buffer_size)
+
+        with self.lock:
+            if self.closing or not self.stream_limit.acquire():
+                # Every stream uses a server thread, so we don't open more than the limit
+                resp.status = falcon.HTTP_503
+                resp.set_header("Retry-After", "5")
+                resp.body = json.dumps({"message": "Too many event streams"})
+                return
+
+            # We give the stream the events the client missed since the last event it got
+            last_event_id = req.get_header("Last-Event-ID")
+            if last_event_id is not None:
+                stream.add_events(self._get_missed_events(last_event_id))
+
+            self.streams.add(stream)
+
+        self.keyboard.enable_notifications(notification_keys)
+
+        resp.status = falcon.HTTP_200
+        resp.content_type = "text/event-stream"
+        resp.cache_control = ["no-cache"]
+        # The server closes the body when the response ends, even if it never sent it, which removes the stream
+        resp.stream = Event_Stream_Body(self._generate_stream(stream), lambda: self._remove_stream(stream, notification_keys))
+
+    def close(self):
+        """This method ends all streams and stops accepting new ones, it should be called before the server shuts down, as open streams keep their threads busy."""
+
+        self.keyboard.remove_notification_listener(self._add_notifications)
+
+        with self.lock:
+            self.closing = True
+            streams = list(self.streams)
+
+        for stream in streams:
+            stream.close()
+
+    def get_stats(self):
+        """This method returns a dict with the number of open streams, and the number of queued and dropped events of all of them."""
+
+        with self.lock:
+            streams = list(self.streams)
+
+        stream_stats = [stream.get_stats() for stream in streams]
+        return {
+            "streams": len(streams),
+            "queued_events": sum([x["queued_events"] for x in stream_stats]),
+            "dropped_events": sum([x["dropped_events"] for x in stream_stats]),
+        }
+
+    def _get_missed_events(self, last_event_id: str):
+        """This method returns the events in the history after the event with id last_event_id, it's called with the lock held.
+        If that event isn't in the history anymore, all events in the history are returned after a "dropped" event.
+        """
+
+        # We find the number of the event, ids of an earlier server mean we don't know what was missed
+        try:
+            last_event_number = int(last_event_id[len(self.id_prefix):]) if last_event_id.startswith(self.id_prefix) else 0
+        except ValueError:
+            last_event_number = 0
+
+        missed_events = [event for event in self.history if event[0] > last_event_number]
+
+        # We tell the client if it missed events that aren't in the history anymore
+        oldest_event_number = missed_events[0][0] if missed_events else self.next_event_number
+        if oldest_event_number > last_event_number + 1 and last_event_number:
+            missed_events.insert(0, (None, "dropped", {"count": oldest_event_number - last_event_number - 1}))
+
+        return missed_events
+
+    def _add_notifications(self, notify_lines: list, key_events: list):
+        """This method is the notification listener of the keyboard, it adds the notifications to the history and to every stream."""
+
+        # We create the events, the key events are the lines that start with "key " in the same order
+        key_events = iter(key_events)
+        timestamp = time.time()
+        events = []
+        for line in notify_lines:
+            if line.startswith("key ") and line[4:5] in ("+", "-"):
+                event_timestamp, key, pressed = next(key_events)
+                events.append(["key", {"key": key, "pressed": pressed, "timestamp": event_timestamp}])
+            else:
+                events.append(["notification", {"line": line, "timestamp": timestamp}])
+
+        with self.lock:
+            # We number the events
+            for event in events:
+                event.insert(0, self.next_event_number)
+                self.next_event_number += 1
+
+            events = [tuple(event) for event in events]
+            self.history.extend(events)
+            streams = list(self.streams)
+
+        for stream in streams:
+            stream.add_events(events)
+
+    def _generate_stream(self, stream):
+        """This method is a generator of the encoded events of stream, it's used as the body of the response and runs until the stream is closed."""
+
+        # We tell the client how long to wait before it reconnects
+        yield b"retry: 1000\n\n"
+
+        while True:
+            events = stream.take_events(self.keep_alive_interval)
+            if events is None:
+                return
+
+            if not events:
+                # We send a comment, so a closed connection causes a write error
+                yield b": keep-alive\n\n"
+                continue
+
+            yield "".join([self._encode_event(*event) for event in events]).encode("utf-8")
+
+    def _remove_stream(self, stream, notification_keys: list):
+        """This method removes a stream that on_get added, and gives back its slot and the notifications it enabled."""
+
+        with self.lock:
+            self.streams.discard(stream)
+        self.stream_limit.release()
+
+        self.keyboard.disable_notifications(notification_keys)
+
+    def _encode_event(self, event_number, event_name: str, data: dict):
+        """This method encodes an event in the text/event-stream format, events without a number don't get an id."""
+
+        event_id = "" if event_number is None else "id: " + self.id_prefix + str(event_number) + "\n"
+        return event_id + "event: " + event_name + "\ndata: " + json.dumps(data) + "\n\n"
+
+
+class Stream_Limit(object):
+    """This class counts the open event streams of one or more Keyboard_Event_Stream_Api resources, so together they don't open more than max_streams."""
+
+    def __init__(self, max_streams: int):
+        """This method creates a limit that allows max_streams streams to be open at the same time."""
+
+        self.max_streams = max_streams
+
+        # The lock that protects the number of open streams
+        self.lock = threading.Lock()
+        self.open_streams = 0
+
+    def acquire(self):
+        """This method counts a new stream and returns True, or returns False if max_streams streams are already open."""
+
+        with self.lock:
+            if self.open_streams >= self.max_streams:
+                return False
+
+            self.open_streams += 1
+            return True
+
+    def release(self):
+        """This method stops counting a stream that was counted by acquire."""
+
+        with self.lock:
+            self.open_streams -= 1
+
+
+class Event_Stream_Body(object):
+    """This class is the body of an event stream response, it iterates over the chunks of a generator and calls on_close once when it's closed.
+    WSGI servers close the body when the response ends, also when they never started sending it (like when the client is already gone),
+    which a generator that was never started wouldn't notice.
+    """
+
+    def __init__(self, chunks, on_close):
+        self.chunks = chunks
+        self.on_close = on_close
+
+        # The lock and variable that make sure on_close is only called once
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        """This method stops the generator and calls on_close, if it hasn't been called yet."""
+
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+
+        try:
+            self.chunks.close()
+        finally:
+            self.on_close()
+
+
+class Event_Stream(object):
+    """This class is the bounded buffer of the events that wait to be sent to one client of Keyboard_Event_Stream_Api."""
+
+    def __init__(self, keys: set, buffer_size: int):
+        """This method creates an empty stream, keys is the set of keys whose key events are sent, None means all keys."""
+
+        self.keys = keys
+
+        # The condition that is notified when events are added, the buffer of events, and the number of events that were dropped because it was full
+        self.condition = threading.Condition()
+        self.buffer = collections.deque(maxlen=buffer_size)
+        self.dropped_events = 0
+
+        # A variable to signal that the stream should end
+        self.closed = False
+
+    def add_events(self, events: list):
+        """This method adds the events that the client wants to the buffer and wakes up the thread that sends them."""
+
+        if self.keys is not None:
+            events = [event for event in events if event[1] != "key" or event[2]["key"] in self.keys]
+        if not events:
+            return
+
+        with self.condition:
+            self.dropped_events += max(0, len(self.buffer) + len(events) - self.buffer.maxlen)
+            self.buffer.extend(events)
+            self.condition.notify()
+
+    def take_events(self, timeout: float):
+        """This method waits at most timeout seconds for events and returns them, with a "dropped" event first if events were dropped.
+        It returns an empty list if there were no events, and None if the stream is closed.
+        """
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.buffer or self.closed, timeout)
+            if self.closed:
+                return None
+
+            events = list(self.buffer)
+            self.buffer.clear()
+
+            if self.dropped_events:
+                events.insert(0, (None, "dropped", {"count": self.dropped_events}))
+                self.dropped_events = 0
+
+        return events
+
+    def close(self):
+        """This method ends the stream, the thread that sends it stops waiting for events."""
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def get_stats(self):
+        """This method returns a dict with the number of events in the buffer, and the number that were dropped since the last events were sent."""
+
+        with self.condition:
+            return {"queued_events": len(self.buffer), "dropped_events": self.dropped_events}
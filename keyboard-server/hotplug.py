@@ -0,0 +1,287 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+from keyboard import find_supported_devices
+
+
+class Hotplug_Watcher(object):
+    """This class watches the ckb-daemon device nodes, and reattaches keyboards when they are plugged back in or when ckb-daemon is restarted.
+    It uses inotify on the device directory and ckb0 to notice changes right away, and also checks the devices every poll_interval seconds,
+    so it works without inotify and retries reattaching devices that weren't ready yet.
+    """
+
+    # The inotify event masks we use, from sys/inotify.h
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+
+    # The size of the header of an inotify event (wd, mask, cookie, and len)
+    inotify_event_header = struct.Struct("iIII")
+
+    def __init__(self, keyboards, poll_interval: float = 1.0, debounce_time: float = 0.05, on_attach=None, on_detach=None, on_new_device=None):
+        """This method creates the watcher, it's started by start.
+        keyboards is a Keyboard_Manager, or anything else with a get_keyboards method that returns a dict of serial number to open Keyboard.
+        poll_interval is the number of seconds between the checks of the devices when nothing happens.
+        debounce_time is the number of seconds the watcher waits after a change, so the daemon can create all of the device's nodes before they are checked.
+        on_attach(serial, keyboard) and on_detach(serial, keyboard) are called when a keyboard is reattached and when it's unplugged.
+        on_new_device(serial, device_path) is called once for a supported device that isn't one of the keyboards, every time it's plugged in.
+        """
+
+        self.keyboards = keyboards
+        self.poll_interval = poll_interval
+        self.debounce_time = debounce_time
+        self.on_attach = on_attach
+        self.on_detach = on_detach
+        self.on_new_device = on_new_device
+
+        # The serial number of every attached keyboard, to the path and cmd node inode of its device
+        # A new inode means the daemon has been restarted, so the keyboard has to be reattached even if the path is the same
+        self.attached_devices = {}
+
+        # The serial numbers of the new devices that on_new_device has been called for
+        self.reported_devices = set()
+
+        # Counters of what the watcher has done
+        self.check_count = 0
+        self.attach_count = 0
+        self.detach_count = 0
+        self.failed_attach_count = 0
+
+        self.exiting = False
+        self.thread = None
+        self.inotify_fd = None
+        self.wake_read_fd = self.wake_write_fd = None
+
+    def start(self):
+        """This method starts watching the devices."""
+
+        keyboards = self.keyboards.get_keyboards()
+        for serial, keyboard in keyboards.items():
+            device = self._stat_device(keyboard.keyboard_path)
+            if keyboard.device_connected and device is not None:
+                self.attached_devices[serial] = device
+
+        # We watch the directories of all the keyboards (they're all the same unless the keyboards are in different places)
+        prefixes = {os.path.dirname(os.path.dirname(keyboard.keyboard_path)) for keyboard in keyboards.values()}
+        self.inotify_fd = self._create_inotify(prefixes)
+
+        # A pipe that is used to wake up the watcher when we're exiting
+        self.wake_read_fd, self.wake_write_fd = os.pipe()
+
+        self.thread = threading.Thread(target=self._watch_thread, args=(prefixes,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """This method stops watching the devices, and waits for the watcher thread to exit."""
+
+        if self.thread is None:
+            return
+
+        self.exiting = True
+        os.write(self.wake_write_fd, b"\0")
+        self.thread.join()
+        self.thread = None
+
+        for fd in (self.inotify_fd, self.wake_read_fd, self.wake_write_fd):
+            if fd is not None:
+                os.close(fd)
+
+    def get_stats(self):
+        """This method returns a dict of counters of what the watcher has done, and if it uses inotify."""
+
+        return {"inotify": self.inotify_fd is not None, "checks": self.check_count, "attaches": self.attach_count,
+                "detaches": self.detach_count, "failed_attaches": self.failed_attach_count}
+
+    def check_devices(self):
+        """This method compares the connected devices with the keyboards, detaches the keyboards that are gone, and reattaches the ones that are back.
+        It's called by the watcher thread, but it can also be called directly (it isn't thread safe, so not while the watcher is running).
+        """
+
+        self.check_count += 1
+        keyboards = self.keyboards.get_keyboards()
+        if not keyboards:
+            return
+
+        # We find the connected supported devices, and their serial numbers
+        supported_devices = next(iter(keyboards.values())).config["supported_devices"]
+        prefixes = {os.path.join(os.path.dirname(os.path.dirname(keyboard.keyboard_path)), "") for keyboard in keyboards.values()}
+
+        connected_devices = {}
+        for prefix in prefixes:
+            try:
+                device_paths = find_supported_devices(prefix, supported_devices)
+            except OSError:
+                # ckb-daemon isn't running, so no devices are connected
+                continue
+
+            for device_path in device_paths:
+                try:
+                    with open(device_path + "serial") as serial_file:
+                        serial = serial_file.read().strip()
+                except OSError:
+                    continue
+
+                device = self._stat_device(device_path)
+                if device is not None:
+                    connected_devices[serial] = device
+
+        for serial, keyboard in keyboards.items():
+            device = connected_devices.get(serial)
+
+            # We detach the keyboard if its device is gone or has been replaced, or if the keyboard noticed it itself
+            if serial in self.attached_devices and (not keyboard.device_connected or device != self.attached_devices[serial]):
+                del self.attached_devices[serial]
+                keyboard.mark_device_lost()
+                self.detach_count += 1
+                self._call(self.on_detach, serial, keyboard)
+
+            # We reattach the keyboard if its device is connected, if it fails we try again at the next check
+            if serial not in self.attached_devices and device is not None:
+                try:
+                    keyboard.reattach(device[0])
+                except OSError as e:
+                    self.failed_attach_count += 1
+                    print("Could not reattach the keyboard " + serial + ", trying again later: " + str(e))
+                    continue
+
+                self.attached_devices[serial] = device
+                self.attach_count += 1
+                self._call(self.on_attach, serial, keyboard)
+
+        # We tell about the supported devices that aren't one of the keyboards
+        for serial, device in connected_devices.items():
+            if serial not in keyboards and serial not in self.reported_devices:
+                self.reported_devices.add(serial)
+                self._call(self.on_new_device, serial, device[0])
+
+        self.reported_devices.intersection_update(connected_devices)
+
+    def _watch_thread(self, prefixes: set):
+        """This method is the watcher thread, it waits for inotify events or the poll interval and then checks the devices."""
+
+        while not self.exiting:
+            watched_fds = [self.wake_read_fd] + ([self.inotify_fd] if self.inotify_fd is not None else [])
+            read, _, _ = select.select(watched_fds, [], [], self.poll_interval)
+            if self.exiting:
+                return
+
+            if self.inotify_fd in read:
+                # We only check the devices if the change was to a ckb node, the device directory also has the nodes of other devices
+                if not self._read_inotify_events(prefixes):
+                    continue
+
+                # We wait for the daemon to finish creating or removing the nodes, and take the events that happened meanwhile
+                time.sleep(self.debounce_time)
+                self._read_inotify_events(prefixes)
+
+            self.check_devices()
+
+    def _create_inotify(self, prefixes: set):
+        """This method creates an inotify instance that watches the device directories and the ckb0 directories in them.
+        It returns the inotify fd, or None if inotify isn't available, then the watcher only polls.
+        """
+
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            inotify_fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+
+        if inotify_fd < 0:
+            return None
+
+        # We remember which watch is a ckb0 directory, since every change to it is interesting
+        self.root_watches = set()
+        for prefix in prefixes:
+            if self.libc.inotify_add_watch(inotify_fd, prefix.encode(), self.IN_CREATE | self.IN_DELETE | self.IN_MOVED_TO) < 0:
+                os.close(inotify_fd)
+                return None
+            self._watch_root(inotify_fd, prefix)
+
+        return inotify_fd
+
+    def _watch_root(self, inotify_fd: int, prefix: str):
+        """This method watches the ckb0 directory in prefix, if it exists. The watch is removed by the kernel when the daemon removes the directory."""
+
+        root_watch = self.libc.inotify_add_watch(inotify_fd, os.path.join(prefix, "ckb0").encode(),
+                                                 self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_CREATE | self.IN_MOVED_TO)
+        if root_watch >= 0:
+            self.root_watches.add(root_watch)
+
+    def _read_inotify_events(self, prefixes: set):
+        """This method reads the available inotify events, and returns True if any of them was about a ckb node."""
+
+        ckb_changed = False
+        while True:
+            try:
+                data = os.read(self.inotify_fd, 65536)
+            except BlockingIOError:
+                return ckb_changed
+
+            offset = 0
+            while offset < len(data):
+                watch, mask, _, name_length = self.inotify_event_header.unpack_from(data, offset)
+                offset += self.inotify_event_header.size
+                name = data[offset:offset + name_length].rstrip(b"\0").decode(errors="replace")
+                offset += name_length
+
+                if watch in self.root_watches or name.startswith("ckb"):
+                    ckb_changed = True
+
+                # The daemon has (re)created ckb0, so we watch the new directory
+                if name == "ckb0" and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    for prefix in prefixes:
+                        self._watch_root(self.inotify_fd, prefix)
+
+    @staticmethod
+    def _stat_device(device_path: str):
+        """This method returns the path and cmd node inode of a device, or None if it doesn't exist."""
+
+        try:
+            return os.path.join(device_path, ""), os.stat(os.path.join(device_path, "cmd")).st_ino
+        except OSError:
+            return None
+
+    @staticmethod
+    def _call(callback, *args):
+        """This method calls a callback if there is one, and prints the exception if it fails, so the watcher keeps running."""
+
+        if callback is None:
+            return
+
+        try:
+            callback(*args)
+        except (Exception, SystemExit) as e:
+            # We catch SystemExit too, since Keyboard.__enter__ exits when it can't open a device
+            print("A hotplug callback failed: " + repr(e))
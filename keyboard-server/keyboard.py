@@ -22,83 +22,193 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import collections
+import concurrent.futures
 import json
+import math
 import os.path
 import select
 import stat
 import sys
 import threading
 import time
+import traceback
+import zlib
 
 import falcon
 
+import tracing
+from metrics import SIZE_BUCKETS, Metrics_Registry, Timed_Lock
+
 platform = sys.platform
 
+# The longest fade, in seconds, a longer one would keep the fade timer running for no visible change
+MAX_FADE_DURATION = 3600
+
+
+def get_device_prefix(prefix: str = None):
+    """This function returns the directory that ckb-daemon creates its device nodes in (like "/dev/input/"), it exits if ckb-daemon isn't running.
+    If prefix is given it's used instead of the directory of the OS, like the directory of a ckb_daemon_emulator.Ckb_Daemon_Emulator.
+    """
+
+    # We check if we're on mac or linux (the file-path is different on mac)
+    if prefix is not None:
+        # We were told where the device nodes are
+        prefix = os.path.join(prefix, "")
+
+    elif platform.startswith("linux"):
+        # We're on linux, FOSS FTW!
+        prefix = "/dev/input/"
+
+    elif platform.startswith("darwin"):
+        # We're on macOS, elegancy and simplicity FTW!
+        prefix = "/var/run/"
+
+    else:
+        # Who the fuck runs anything other than linux and macOS nowadays!?
+        # We exit because ckb doesn't exist on any other platforms than the ones we tested for
+        print("You're not running on a supported OS, please install gentoo and git gud.")
+        exit()
+
+    # We check if ckb-daemon is running (by checking if the keyboard info file exists)
+    if not os.path.exists(prefix + "ckb0"):
+        # ckb-daemon is not running or it isn't installed
+        print("ckb-daemon isn't running, (or isn't installed). Please install and/or run ckb-daemon and try again.")
+        exit()
+
+    return prefix
+
+
+def load_config():
+    """This function loads and returns keyboard_server_config.json."""
+
+    with open("keyboard_server_config.json", encoding="utf-8") as config_file:
+        return json.load(config_file)
+
+
+def find_supported_devices(prefix: str, supported_devices: list):
+    """This function returns the paths (like "/dev/input/ckb1/") of the connected devices whose model is in supported_devices, in device number order.
+    It doesn't ask the user anything, so it can be used to open many keyboards without a person at the computer.
+    """
+
+    # The connected file has a line for every connected device, that starts with the path of its directory
+    with open(prefix + "ckb0/connected") as connection_file:
+        device_paths = [line.split(" ")[0] for line in connection_file.read().splitlines() if line.strip()]
+
+    # We check if the features node of every device starts with a supported device name
+    supported_paths = []
+    for device_path in device_paths:
+        device_path = os.path.join(prefix, os.path.basename(device_path), "")
+        try:
+            with open(device_path + "features") as features:
+                if " ".join(features.read().split(" ")[:2]) in supported_devices:
+                    supported_paths.append(device_path)
+        except OSError:
+            # The device was unplugged while we looked at it
+            continue
+
+    return supported_paths
+
 
 class Keyboard(object):
     """This class represents a keyboard connected to the ckb-daemon.
     This class is supposed to be used quite like a file-descriptor, use it with a with statement.
     """
 
+    def __init__(self, cmd_flush_interval: float = 0, frame_scheduler: bool = False, diff_rendering: bool = False,
+                 notification_buffer_size: int = 1024, dispatch_workers: int = 4, device_path: str = None, device_prefix: str = None):
+        """This method stores the options for the keyboard, the actual device is opened by __enter__.
+        cmd_flush_interval is the number of seconds the command writer waits to collect more commands before every write,
+        0 means that commands are written as soon as the writer thread is free (they are still batched while a write is in progress).
+        If frame_scheduler is True, all color changes made during one frame (as set by cmd_set_fps) are merged and sent as one rgb command per frame.
+        If diff_rendering is True, only the keys whose color differs from the last colors sent to the daemon are sent, and nothing is sent if no key changed.
+        With diff rendering only the keys in the layout of the model (and "all") can be set, setting any other key is invalid.
+        notification_buffer_size is the maximum number of unread notifications and key events that are kept, the oldest ones are dropped when it's full.
+        dispatch_workers is the number of threads that call the handlers subscribed with subscribe_key_events.
+        device_path is the ckb-daemon directory of the keyboard to use (like "/dev/input/ckb1"), if it's None the keyboard is found like __enter__ describes.
+        device_prefix is the directory that ckb-daemon creates its device nodes in, if it's None the directory of the OS (like "/dev/input/") is used.
+        """
+
+        # We save the command writer flush window
+        self.cmd_flush_interval = cmd_flush_interval
+
+        # We save if we should use the frame scheduler and diff rendering
+        self.frame_scheduler = frame_scheduler
+        self.diff_rendering = diff_rendering
+
+        # The fps of the daemon, 30 is the ckb-daemon default until cmd_set_fps is used
+        self.fps = 30
+
+        # We save the size of the notification buffers
+        self.notification_buffer_size = notification_buffer_size
+
+        # We save the number of threads for the key event dispatcher
+        self.dispatch_workers = dispatch_workers
+
+        # We save the path of the device to use, if we should find it ourselves it's None
+        self.device_path = device_path
+        self.device_prefix = device_prefix
+
     def __enter__(self):
-        """Creates a keyboard object if there is one connected.
-        If there are multiple keyboards connected, it prompts the user to choose between them.
+        """Creates a keyboard object if there is one connected, or opens the device at device_path if it was given.
+        If there are multiple keyboards connected, it prompts the user to choose between them (use keyboard_manager.Keyboard_Manager to use all of them).
         If there are no no keyboards connected, it tells the user to connect one and then exits the program.
         """
 
-        # We check if we're on mac or linux (the file-path is different on mac)
-        if platform.startswith("linux"):
-            # We're on linux, FOSS FTW!
-            # We check if ckb-daemon is running (by checking if the keyboard info file exists)
-            if os.path.exists("/dev/input/ckb0"):
-                # ckb-daemon is running, so we store the filepath prefix
-                self.prefix = "/dev/input/"
+        # We find the keyboard and read the info about it
+        self._open_device()
 
-            else:
-                # ckb-daemon is not running or it isn't installed
-                print(
-                    "ckb-daemon isn't running, (or isn't installed). Please install and/or run ckb-daemon and try again.")
+        # We create the locks, buffers, and color stores
+        self._create_state()
 
-        elif platform.startswith("darwin"):
-            # We're on macOS, elegancy and simplicity FTW!
-            # We check if ckb-daemon is running (by checking if the keyboard info file exists)
-            if os.path.exists("/var/run/ckb0"):
-                # ckb-daemon is running, so we store the filepath prefix
-                self.prefix = "/var/run/"
+        # We open the cmd node once and keep it open for the lifetime of this object
+        self.cmd_fd = os.open(self.keyboard_path + "cmd", os.O_WRONLY)
 
-            else:
-                # ckb-daemon is not running or it isn't installed
-                print(
-                    "ckb-daemon isn't running, (or isn't installed). Please install and/or run ckb-daemon and try again.")
+        # We create and start the thread that writes the queued commands to the cmd node
+        self.cmd_thread = threading.Thread(target=self._command_write_thread)
+        self.cmd_thread.start()
 
-        else:
-            # Who the fuck runs anything other than linux and macOS nowadays!?
-            # We exit because ckb doesn't exist on any other platforms than the ones we tested for
-            print("You're not running on a supported OS, please install gentoo and git gud.")
+        # A pipe that is used to wake up the notification reader when we're exiting, so it doesn't need to poll
+        self.notify_wake_read_fd, self.notify_wake_write_fd = os.pipe()
+
+        # We turn on notifications and software control, and start reading the notifications
+        try:
+            self._attach_notifications()
+        except OSError as e:
+            print(e)
+
+            # We stop the command writer and close what we opened, so its thread doesn't keep the program running
+            self._stop_command_writer()
+            os.close(self.notify_wake_read_fd)
+            os.close(self.notify_wake_write_fd)
             exit()
 
-        # We check how many devices that are connected
-        with open(self.prefix + "ckb0/connected") as connection_file:
-            # We calculate the number of devices connected by counting the number of lines with content in the file
-            num_connected_devices = len(connection_file.read()[:-1].splitlines())
+        # We create and start the frame scheduler thread if it should be used
+        if self.frame_scheduler:
+            self.frame_thread = threading.Thread(target=self._frame_scheduler_thread)
+            self.frame_thread.start()
+
+        # We get the current colors of the keyboard from the daemon, so our copy starts out correct
+        self.sync_colors_from_daemon()
 
-        # We check if there are any connected devices at all
-        if num_connected_devices > 0:
-            # We load the keyboard_server_config file to get the list of keyboards that are supported
-            with open("keyboard_server_config.json", encoding="utf-8") as config_file:
-                config_supported_devices = json.load(config_file)["supported_devices"]
+        return self
+
+    def _open_device(self):
+        """This method finds the keyboard to use and reads the info about it, like the model, serial number, and a free notify node number.
+        It's used by __enter__ (and by the asynchronous keyboard), it doesn't open anything or send any commands to the daemon.
+        """
 
-            # The list of supported device numbers (the * in ckb*)
-            supported_devices = []
+        # We load the keyboard_server_config file to get the list of keyboards that are supported and their layouts
+        self.config = load_config()
 
-            # We loop through all devices and check if their features node starts with a supported device name
-            for i in range(1, num_connected_devices + 1):
-                # We load the features file for the current device and check if the first line is a supported device identifier
-                with open(self.prefix + "ckb" + str(i) + "/features") as features:
+        if self.device_path is not None:
+            # We were told which device to use
+            self.keyboard_path = os.path.join(self.device_path, "")
 
-                    if " ".join(features.read().split(" ")[:2]) in config_supported_devices:
-                        # The device is supported, so we append the device number
-                        supported_devices.append(i)
+        else:
+            # We find the supported keyboards, and ask the user to choose one if there are several
+            self.prefix = get_device_prefix(self.device_prefix)
+            supported_devices = find_supported_devices(self.prefix, self.config["supported_devices"])
 
             # We check how many supported devices that were detected
             if len(supported_devices) == 0:
@@ -109,11 +219,11 @@ class Keyboard(object):
 
             elif len(supported_devices) == 1:
                 # Everything is fine and dandy, the user has 1, and exactly 1, connected supported keyboard
-                # We save the path and number of the supported keyboard
-                self.keyboard_path = self.prefix + "ckb" + str(supported_devices[0]) + "/"
+                # We save the path of the supported keyboard
+                self.keyboard_path = supported_devices[0]
 
             else:
-                # We make a dict mapping user options to device numbers
+                # We make a dict mapping user options to device paths
                 choice_dict = {str(key + 1): value for (key, value) in enumerate(supported_devices)}
 
                 # We ask the user to choose between their devices
@@ -121,9 +231,8 @@ class Keyboard(object):
                     "Please input a number corresponding to which of your connected keyboards you want to use.\nHere are the connected keyboards:")
                 # We loop through all the choices and output info about that device in a user readable format
                 for key in choice_dict:
-                    with open(self.prefix + "ckb" + str(choice_dict[key])) as features:
-                        # The 38 is the number of chars between the beginning of the line and the device name
-                        print("\tNr. {0:s}: {1:s}".format(key, features.readline()[self.prefix + 38:-1]))
+                    with open(choice_dict[key] + "model") as model_file:
+                        print("\tNr. {0:s}: {1:s}".format(key, model_file.read().strip()))
 
                 # We force the user to provide proper input or exit
                 while True:
@@ -131,17 +240,24 @@ class Keyboard(object):
 
                     # We check if the choice was a valid one
                     if choice in choice_dict:
-                        # We save the path and number of the supported keyboard
-                        self.keyboard_path = self.prefix + "ckb" + str(choice_dict[choice]) + "/"
+                        # We save the path of the supported keyboard
+                        self.keyboard_path = choice_dict[choice]
 
                         # We break out of the while loop
                         break
 
-        else:
-            # There are no connected devices, so we tell the user to connect a keyboard and try again
-            print("You don't have any connected keyboards, please connect a keyboard and try again.")
+        # We read the info about the keyboard, and find a notify node for us
+        try:
+            self._read_device_info()
+        except OSError as e:
+            print(e)
             exit()
 
+    def _read_device_info(self):
+        """This method reads the info about the keyboard at keyboard_path, like the model and serial number, and finds a free notify node number.
+        It raises OSError if the info can't be read, or if all notify nodes are being used.
+        """
+
         # We have a supported keyboard with it's path, so we print out some info about it
         with open(self.keyboard_path + "model") as model_file:
             print("Using keyboard: " + model_file.read().strip())
@@ -158,8 +274,10 @@ class Keyboard(object):
 
         # We open the features file and save the list of features the device supports
         with open(self.keyboard_path + "features") as features_file:
-            # We parse and save the supported features
-            self.features = features_file.read().split(" ")[2:]
+            # We parse and save the supported features, the first two words are the model identifier (like "corsair k70")
+            features_content = features_file.read().split(" ")
+            self.model_identifier = " ".join(features_content[:2])
+            self.features = features_content[2:]
 
         # We open the serial file and save the serial number of the device
         with open(self.keyboard_path + "serial") as serial_file:
@@ -189,52 +307,207 @@ class Keyboard(object):
                 break
         else:
             # If we didn't find a notify node number that wasn't used, we tell the user to check what programs are using the keyboard and try again
-            print(
-                "All notifying nodes are being used, please check what programs are using the keyboard and try again.")
-            exit()
+            raise OSError("All notifying nodes are being used, please check what programs are using the keyboard and try again.")
 
-        # We create various Lock objects to make the whole class thread-safe
-        self.cmd_lock = threading.Lock()
-        self.notify_lock = threading.Lock()
+        # We save the notify path for the keyboard
+        self.notify_path = self.keyboard_path + "notify" + str(self.notify_node_nr)
+
+    def _attach_notifications(self):
+        """This method registers our notify node to the daemon, makes the device software controlled, and starts the notification reader.
+        It's used by __enter__ and reattach, after the cmd node has been opened. It raises OSError if the daemon doesn't create the notify node.
+        """
 
         # We found a notify node, so we register it to the daemon for this keyboard
         self.execute_command("notifyon " + str(self.notify_node_nr))
 
-        # We save the notify path for the keyboard
-        self.notify_path = self.keyboard_path + "notify" + str(self.notify_node_nr)
-
         # We wait for the notification file to exist
         timeout = time.time() + 2
         while not os.path.exists(self.notify_path) and time.time() < timeout:
             time.sleep(0.01)
         if not os.path.exists(self.notify_path):
             # The daemon didn't create the notification file fast enough
-            print("Failed to create notification file before timeout.")
-            exit()
+            raise OSError("Failed to create notification file before timeout.")
 
         # We make this device go into software controlled mode
         self.execute_command("active")
 
-        # We create a variable to signal if we're exiting
-        self.exiting = False
+        # We open the notification node once and keep it open, it's non-blocking so the reader can read everything that's available
+        self.notify_fd = os.open(self.notify_path, os.O_RDONLY | os.O_NONBLOCK)
 
-        # We create a variable that stores all unread notifications
-        self.unread_notifications = ""
-
-        # We create a thread that's going to read from the notification node
+        # We create a thread that's going to read from the notification node, and start it
         self.notification_thread = threading.Thread(target=self._notification_read_thread)
-
-        # We start the notification thread
         self.notification_thread.start()
 
-        return self
+    def _create_state(self):
+        """This method creates the locks, buffers, and color stores that the keyboard uses, it's used by __enter__ after _open_device."""
+
+        # The metrics of the keyboard, they're served by metrics.Metrics_Api at /metrics
+        self.metrics = Metrics_Registry({"serial": self.serial})
+
+        # We create various Lock objects to make the whole class thread-safe, the busy ones measure how long they're waited for and held
+        self.cmd_lock = self._create_timed_lock("cmd")
+        self.notify_lock = self._create_timed_lock("notify")
+
+        # The condition that the notification reader uses to tell get_parameters that new notifications have arrived, it shares the notify lock
+        self.notify_condition = threading.Condition(self.notify_lock)
+
+        # The lock that makes sure only one get command is waiting for its responses at a time
+        self.get_lock = threading.Lock()
+
+        # The condition that the command writer thread and execute_command use to signal each other, it shares the cmd lock
+        self.cmd_condition = threading.Condition(self.cmd_lock)
+
+        # The list of command lines that are waiting to be written to the cmd node
+        self.cmd_queue = []
+
+        # The number of commands that have been queued and written, these are used as sequence numbers so callers can wait for their command
+        self.cmd_queued_count = 0
+        self.cmd_written_count = 0
+
+        # The number of write calls made to the cmd node and the time we started writing, so we can measure the throughput
+        self.cmd_write_count = 0
+        self.cmd_start_time = time.time()
+
+        # The (command number, trace) of the queued commands of traced requests, so the command writer can add its write to their traces
+        self.traced_commands = []
+
+        # We create a variable to signal if the command writer should exit
+        self.cmd_writer_exiting = False
+
+        # We create a variable to signal if we're exiting
+        self.exiting = False
+
+        # A variable that tells if the device is connected, it's False from when the device is unplugged until it's reattached
+        # While it's False the command writer throws away the commands instead of writing them
+        self.device_connected = True
+
+        # A variable that tells if the command writer is writing, reattach waits for it to finish before it replaces the cmd node
+        self.cmd_writing = False
+
+        # The lock that makes sure only one reattach runs at a time
+        self.attach_lock = threading.Lock()
+
+        # The keys that notifications have been enabled for, so they can be enabled again when the device is reattached
+        self.notification_keys = set()
+
+        # The number of users (streams, subscriptions, effects) that need notifications of every key, and the lock that protects it
+        self.notification_users = collections.Counter()
+        self.notification_users_lock = threading.Lock()
+
+        # The notification node and the reader thread, they're opened and started by _attach_notifications
+        self.notify_fd = None
+        self.notification_thread = None
+
+        # We create buffers that store all unread notification lines and all unread key events (as (timestamp, key, pressed) tuples)
+        self.unread_notifications = collections.deque(maxlen=self.notification_buffer_size)
+        self.unread_key_events = collections.deque(maxlen=self.notification_buffer_size)
+
+        # The number of notification lines and key events that were dropped because nobody read them before the buffers were full
+        self.notification_overflows = 0
+        self.key_event_overflows = 0
+
+        # The lock and dict of subscription id to key event subscription, and the id the next subscription gets
+        self.subscription_lock = threading.Lock()
+        self.subscriptions = {}
+        self.next_subscription_id = 1
+
+        # The thread pool that calls the subscribed handlers, it's created when the first handler subscribes
+        self.dispatch_pool = None
+
+        # The list of functions that are called by the notification reader with every batch of notifications, see add_notification_listener
+        self.notification_listeners = []
+
+        # The lock and the in-process copy of the colors of the keyboard, with a slot for every key in the layout of this model
+        # It's updated by all the set_* methods, so reading colors doesn't need a round trip to the daemon
+        self.color_lock = self._create_timed_lock("color")
+        self.key_colors = Key_Color_Store(self.config["key_layouts"][self.model_identifier])
+
+        # The colors that were last sent to the daemon, diff rendering compares the key colors to these
+        self.sent_colors = self.key_colors.copy()
+
+        # The lock and pending state of the frame scheduler, the pending background and a dict of key to hex color for the next frame
+        self.frame_lock = threading.Lock()
+        self.frame_background = None
+        self.frame_key_colors = {}
+
+        # The number of color changes the frame scheduler has received, and the number of rgb commands it has sent
+        self.frame_color_writes = 0
+        self.frame_commands = 0
+
+        # The condition that protects the list of running color transitions, and the thread that renders them, it's started by fade_colors
+        self.transition_condition = threading.Condition()
+        self.transitions = []
+        self.transition_thread = None
+
+        self._create_metrics()
+
+    def _create_timed_lock(self, name: str):
+        """This method returns a metrics.Timed_Lock whose wait and hold times are in the lock metrics of the keyboard, with the lock label name."""
+
+        return Timed_Lock(self.metrics.histogram("keyboard_lock_wait_seconds", "The time spent waiting for a lock of the keyboard.", {"lock": name}),
+                          self.metrics.histogram("keyboard_lock_hold_seconds", "The time a lock of the keyboard was held.", {"lock": name}), name=name)
+
+    def _create_metrics(self):
+        """This method creates the metrics of the keyboard, most of them read the counters the keyboard already has when they are collected."""
+
+        self.command_wait_histogram = self.metrics.histogram(
+            "keyboard_command_wait_seconds", "The time callers waited for their commands to be written to the cmd node.")
+        self.cmd_write_histogram = self.metrics.histogram("keyboard_cmd_write_seconds", "The time a write to the cmd node took.")
+        self.cmd_batch_histogram = self.metrics.histogram("keyboard_cmd_write_commands", "The number of commands in a write to the cmd node.",
+                                                          buckets=SIZE_BUCKETS)
+        self.notification_lines_counter = self.metrics.counter("keyboard_notification_lines_total", "The number of lines read from the notify node.")
+
+        self.metrics.function("keyboard_commands_queued_total", "The number of commands queued for the daemon.",
+                              lambda: self.cmd_queued_count, "counter")
+        self.metrics.function("keyboard_commands_written_total", "The number of commands written to the cmd node.",
+                              lambda: self.cmd_written_count, "counter")
+        self.metrics.function("keyboard_cmd_writes_total", "The number of writes to the cmd node.", lambda: self.cmd_write_count, "counter")
+        self.metrics.function("keyboard_command_queue_depth", "The number of commands waiting to be written.", lambda: len(self.cmd_queue))
+        self.metrics.function("keyboard_unread_notifications", "The number of notification lines nobody has read yet.",
+                              lambda: len(self.unread_notifications))
+        self.metrics.function("keyboard_unread_key_events", "The number of key events nobody has read yet.", lambda: len(self.unread_key_events))
+        self.metrics.function("keyboard_notification_overflows_total", "The number of notification lines dropped because the buffer was full.",
+                              lambda: self.notification_overflows, "counter")
+        self.metrics.function("keyboard_key_event_overflows_total", "The number of key events dropped because the buffer was full.",
+                              lambda: self.key_event_overflows, "counter")
+        self.metrics.function("keyboard_subscription_queued_events", "The number of key events waiting for the subscribed handlers.",
+                              lambda: sum(stats["queued_events"] for stats in self.get_subscription_stats().values()))
+        self.metrics.function("keyboard_frame_color_writes_total", "The number of color changes the frame scheduler has received.",
+                              lambda: self.frame_color_writes, "counter")
+        self.metrics.function("keyboard_frame_commands_total", "The number of rgb commands the frame scheduler has sent.",
+                              lambda: self.frame_commands, "counter")
+        self.metrics.function("keyboard_transitions", "The number of running color fades.", lambda: len(self.transitions))
+        self.metrics.function("keyboard_device_connected", "1 if the device is connected, 0 if it's unplugged.", lambda: self.device_connected)
 
     def __exit__(self, *args):
         """This method is called when the instance exits the with statement and needs to be closed again."""
 
-        # We tell our notification thread to exit and then wait for it to do so (might take a while as it might be blocked)
+        # We tell our notification thread to exit, wake it up, and then wait for it to do so
         self.exiting = True
-        self.notification_thread.join()
+        os.write(self.notify_wake_write_fd, b"\0")
+        if self.notification_thread is not None:
+            self.notification_thread.join()
+
+        # We stop calling the subscribed handlers
+        self._shutdown_dispatcher()
+
+        # We wait for the transition thread to see that we're exiting
+        with self.transition_condition:
+            transition_thread = self.transition_thread
+            self.transition_condition.notify_all()
+        if transition_thread is not None:
+            transition_thread.join()
+
+        # We close the notification node and the wake up pipe
+        if self.notify_fd is not None:
+            os.close(self.notify_fd)
+        os.close(self.notify_wake_read_fd)
+        os.close(self.notify_wake_write_fd)
+
+        # We wait for the frame scheduler to exit and then send whatever it didn't send
+        if self.frame_scheduler:
+            self.frame_thread.join()
+            self._send_frame()
 
         # We close the notifying node for this device
         self.execute_command("notifyoff " + str(self.notify_node_nr))
@@ -242,14 +515,71 @@ class Keyboard(object):
         # We make this device go back to hardware controlled mode
         self.execute_command("idle")
 
+        self._stop_command_writer()
+
+    def _stop_command_writer(self):
+        """This method tells the command writer to exit once everything is written, waits for it, and then closes the cmd node."""
+
+        with self.cmd_condition:
+            self.cmd_writer_exiting = True
+            self.cmd_condition.notify_all()
+        self.cmd_thread.join()
+        os.close(self.cmd_fd)
+
     def __str__(self):
         """This method provides a string representation of the keyboard object."""
         return "keyboard.Keyboard object:\nKeyboard name: {0:s}\nKeyboard serial number: {1:s}\nKeyboard pollrate: {2:d} ms\nKeyboard path: {3:s}\nKeyboard notify node path: {4:s}\nKeyboard features: {5:s}".format(
             self.verbose_name.strip(), self.serial, self.pollrate, self.keyboard_path, self.notify_path,
             ", ".join(self.features))
 
-    def execute_command(self, cmd: str):
-        """This method is used to use a string as a command to the daemon, only use this if you know what you're doing."""
+    def execute_command(self, cmd: str, wait: bool = True):
+        """This method is used to use a string as a command to the daemon, only use this if you know what you're doing.
+        The command is queued and written by the command writer thread together with all other queued commands.
+        If wait is True this method returns when the command has been written to the cmd node, else it returns right away.
+        It returns the number of the command, which can be given to _wait_for_command.
+        """
+
+        trace = tracing.current_trace()
+
+        # We queue the command with the lock to ensure thread-safety
+        with self.cmd_condition:
+            # We append the command string and a newline
+            self.cmd_queue.append(cmd + "\n")
+            self.cmd_queued_count += 1
+            command_number = self.cmd_queued_count
+
+            if trace is not None:
+                self.traced_commands.append((command_number, trace))
+
+            # We wake up the writer thread
+            self.cmd_condition.notify_all()
+
+            # We wait for our command to be written if the caller wants that
+            if wait:
+                start_time = time.perf_counter()
+                while self.cmd_written_count < command_number:
+                    self.cmd_condition.wait()
+
+        if wait:
+            self.command_wait_histogram.observe(time.perf_counter() - start_time)
+
+        return command_number
+
+    def _wait_for_command(self, command_number: int):
+        """This method waits until the command with the number that execute_command returned has been written."""
+
+        start_time = time.perf_counter()
+        with tracing.span("wait_for_write"):
+            with self.cmd_condition:
+                while self.cmd_written_count < command_number:
+                    self.cmd_condition.wait()
+
+        self.command_wait_histogram.observe(time.perf_counter() - start_time)
+
+    def execute_command_unbatched(self, cmd: str):
+        """This method writes a command the old way, by opening, writing, flushing, and closing the cmd node.
+        It's only kept so the throughput of the batched writer can be compared to it, use execute_command instead.
+        """
 
         # We do the file-writing with a lock to ensure thread-safety
         with self.cmd_lock:
@@ -261,30 +591,214 @@ class Keyboard(object):
                 # We flush the file to get the command written ASAP
                 cmd_file.flush()
 
+    def get_command_stats(self):
+        """This method returns a dict with statistics about the commands written to the daemon.
+        "commands" is the number of commands written, "writes" is the number of writes they needed,
+        "commands_per_write" is the average batch size, and "commands_per_second" is the average since the keyboard was opened.
+        """
+
+        with self.cmd_lock:
+            commands = self.cmd_written_count
+            writes = self.cmd_write_count
+
+        # We calculate the time the writer has been running, it can't be 0 so we don't divide by zero
+        elapsed_time = max(time.time() - self.cmd_start_time, 1e-9)
+
+        return {
+            "commands": commands,
+            "writes": writes,
+            "commands_per_write": commands / writes if writes else 0.0,
+            "commands_per_second": commands / elapsed_time,
+        }
+
     def get_notifications(self):
         """This method is used to get the unread notifications from the keyboard notification node.
-        It gets the unread notifications from the notification poll thread, that continuously tried to read a line (a notification) from the notifying node.
+        It gets the unread notifications from the notification read thread, as a list of lines (without the newline).
         """
 
         with self.notify_lock:
-            notify_raw_content = self.unread_notifications
-            self.unread_notifications = ""
-
-        # We make a list of all the separate words in the notify file, by splitting the content by space
-        notify_content = [x.strip() for x in notify_raw_content.split("\n") if len(x.strip()) > 0]
+            notify_content = list(self.unread_notifications)
+            self.unread_notifications.clear()
 
         return notify_content
 
-    def get_parameter(self, parameter: str):
+    def get_key_events(self):
+        """This method is used to get the unread key events from the keyboard notification node.
+        It returns them as a list of (timestamp, key, pressed) tuples, where pressed is True for a key press and False for a key release.
+        Key events are only sent for the keys that notifications were enabled for with cmd_set_notification.
+        """
+
+        with self.notify_lock:
+            key_events = list(self.unread_key_events)
+            self.unread_key_events.clear()
+
+        return key_events
+
+    def subscribe_key_events(self, handler, keys=None, pressed: bool = None, queue_size: int = 256):
+        """This method subscribes a handler to key events, it's called as handler(timestamp, key, pressed) for every matching event.
+        keys is a list of keycodes or a comma separated string of keycodes (like "w,a,s,d"), None means all keys.
+        pressed is True to only get key presses, False to only get key releases, and None to get both.
+        Every subscription has its own queue of at most queue_size events, so a slow handler can't stall the notification reader or other handlers.
+        The handlers are called from a thread pool, but the events of one subscription are always handled one at a time and in order.
+        Key events are only sent for the keys that notifications were enabled for with cmd_set_notification.
+        This method returns a subscription id that can be used with unsubscribe_key_events.
+        """
+
+        # We split key groups into lists of keycodes
+        if isinstance(keys, str):
+            keys = keys.split(",")
+
+        with self.subscription_lock:
+            # We create the thread pool the first time someone subscribes
+            if self.dispatch_pool is None:
+                self.dispatch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.dispatch_workers)
+
+            subscription_id = self.next_subscription_id
+            self.next_subscription_id += 1
+            self.subscriptions[subscription_id] = Key_Event_Subscription(handler, keys, pressed, queue_size)
+
+        return subscription_id
+
+    def unsubscribe_key_events(self, subscription_id: int):
+        """This method removes a subscription made by subscribe_key_events, events that are already queued for it are still handled.
+        It returns False if there is no subscription with that id.
+        """
+
+        with self.subscription_lock:
+            return self.subscriptions.pop(subscription_id, None) is not None
+
+    def get_subscription_stats(self):
+        """This method returns a dict of subscription id to a dict with the number of queued events and the number of dropped events for that subscription."""
+
+        with self.subscription_lock:
+            subscriptions = dict(self.subscriptions)
+
+        return {subscription_id: subscription.get_stats() for subscription_id, subscription in subscriptions.items()}
+
+    def _dispatch_key_events(self, key_events: list):
+        """This method adds key events to the queues of the matching subscriptions, and schedules the subscriptions that aren't already running."""
+
+        with self.subscription_lock:
+            subscriptions = list(self.subscriptions.values())
+            dispatch_pool = self.dispatch_pool
+
+        for subscription in subscriptions:
+            # We check if the subscription needs to be scheduled, it's scheduled until its queue is empty
+            if subscription.add_events(key_events):
+                dispatch_pool.submit(subscription.run)
+
+    def _shutdown_dispatcher(self):
+        """This method removes all subscriptions and stops the dispatcher thread pool, after the events that are already queued have been handled."""
+
+        with self.subscription_lock:
+            self.subscriptions.clear()
+            dispatch_pool, self.dispatch_pool = self.dispatch_pool, None
+
+        if dispatch_pool is not None:
+            dispatch_pool.shutdown(wait=True)
+
+    def add_notification_listener(self, listener):
+        """This method adds a function that is called as listener(notify_lines, key_events) with every batch of notifications that is read,
+        where notify_lines is the list of notification lines and key_events is the list of (timestamp, key, pressed) tuples in them.
+        It's called on the notification reader thread, so it must be fast and must not block, use subscribe_key_events for anything slow.
+        """
+
+        with self.subscription_lock:
+            # We replace the list instead of changing it, so the reader can use it without the lock
+            self.notification_listeners = self.notification_listeners + [listener]
+
+    def remove_notification_listener(self, listener):
+        """This method removes a function that was added with add_notification_listener, it returns False if it wasn't added."""
+
+        with self.subscription_lock:
+            if listener not in self.notification_listeners:
+                return False
+
+            self.notification_listeners = [x for x in self.notification_listeners if x is not listener]
+            return True
+
+    def get_notification_stats(self):
+        """This method returns a dict with the number of unread notification lines and key events, and the number of them that were dropped."""
+
+        with self.notify_lock:
+            return {
+                "unread_notifications": len(self.unread_notifications),
+                "unread_key_events": len(self.unread_key_events),
+                "notification_overflows": self.notification_overflows,
+                "key_event_overflows": self.key_event_overflows,
+            }
+
+    def get_parameter(self, parameter: str, timeout: float = 1):
         """This method is used to get the current parameters of the keyboard.
-        This will return the raw ckb-daemon response, so only use this if you know what you're doing.
+        This will return the raw ckb-daemon response split into words (like ["mode", "1", "rgb", "ff0000"]), so only use this if you know what you're doing.
+        If the daemon doesn't respond within timeout seconds an empty list is returned.
         """
 
-        # We assume that all input is valid, so do not use this if you don't know what you're doing
-        self.execute_command("@" + str(self.notify_node_nr) + " get :" + parameter)
+        return self.get_parameters([parameter], timeout)[parameter]
 
-        # We return whatever is printed to our notification node
-        return self.get_notifications()
+    def get_parameters(self, parameters: list, timeout: float = 1):
+        """This method is used to get multiple parameters of the keyboard (like ["rgb", "mode", "layout"]) with a single get command.
+        It waits until the daemon has responded with all the parameters, or until timeout seconds have passed.
+        It returns a dict of parameter to the raw ckb-daemon response split into words, parameters without a response have an empty list.
+        The responses are removed from the unread notifications, all other notifications (like key events) are left there.
+        """
+
+        # We check that the parameter names are valid, if they're invalid we raise a ValueError
+        if len(parameters) == 0 or not all([x.replace("_", "").isalnum() for x in parameters]):
+            raise ValueError
+
+        # The responses we've gotten
+        responses = {}
+
+        with self.get_lock:
+            # We remove old responses to the same parameters (from get commands that timed out) so we don't mistake them for ours
+            with self.notify_lock:
+                self._take_responses(parameters)
+
+            # We send the get command
+            self.execute_command("@" + str(self.notify_node_nr) + " get " + " ".join([":" + x for x in parameters]))
+
+            # We wait for the responses until the deadline
+            deadline = time.time() + timeout
+            with self.notify_condition:
+                while True:
+                    responses.update(self._take_responses([x for x in parameters if x not in responses]))
+
+                    # We check if we've gotten every response or if we've run out of time
+                    remaining_time = deadline - time.time()
+                    if len(responses) == len(parameters) or remaining_time <= 0:
+                        break
+
+                    self.notify_condition.wait(remaining_time)
+
+        return {x: responses.get(x, []) for x in parameters}
+
+    def _take_responses(self, parameters: list):
+        """This method removes the responses to the parameters from the unread notifications and returns them as a dict of parameter to words.
+        A response is a line where the parameter name is the first word, or the third word after "mode N". It must be called with the notify lock.
+        """
+
+        responses = {}
+        remaining_notifications = []
+
+        for line in self.unread_notifications:
+            words = line.split(" ")
+
+            # We find the parameter name of the line
+            name = words[2] if words[0] == "mode" and len(words) > 2 else words[0]
+
+            # We take the first response to every parameter, and keep everything else
+            if name in parameters and name not in responses:
+                responses[name] = words
+            else:
+                remaining_notifications.append(line)
+
+        # We only rebuild the buffer if we took something from it
+        if responses:
+            self.unread_notifications.clear()
+            self.unread_notifications.extend(remaining_notifications)
+
+        return responses
 
     def get_all_color_pairs(self):
         """This method is used to get the current rgb colors of all keys.
@@ -293,8 +807,14 @@ class Keyboard(object):
         The color tuples are of length 3 and contain 3 255 >= ints >= 0 .
         """
 
-        # We get the "rgb" parameter and remove the first three entries (those are "mode", "mode_number", and "rgb")
-        rgb_raw_list = self.get_parameter("rgb")[3:]
+        # We get the "rgb" parameter and parse it
+        return self._parse_color_pairs(self.get_parameter("rgb"))
+
+    def _parse_color_pairs(self, rgb_response: list):
+        """This method parses the words of an rgb get response into the form that get_all_color_pairs returns."""
+
+        # We remove the first three entries (those are "mode", "mode_number", and "rgb")
+        rgb_raw_list = rgb_response[3:]
 
         # The list for saving what we're going to output
         rgb_key_color_list = []
@@ -319,47 +839,64 @@ class Keyboard(object):
         return rgb_key_color_list
 
     def get_all_key_color_pairs(self):
-        """This method simply parses the 'get_all_color_pairs' list
-        and returns it in the form of {"key": (color_tuple)}
-        where key is a ckb-daemon keycode and color_is a tuple of the same form as 'get_all_color_pairs'
+        """This method returns the current colors of all keys in the form of {"key": (color_tuple)}
+        where key is a ckb-daemon keycode and color_is a tuple of the same form as 'get_all_color_pairs'.
+        Every key in the layout of the keyboard model is in the dict.
+        The colors are read from our in-process copy, use sync_colors_from_daemon if something else might have changed them.
+        """
+
+        with self.color_lock:
+            return self.key_colors.to_dict()
+
+    def get_color_version(self):
+        """This method returns the version of the key colors, it's increased every time the colors change."""
+
+        with self.color_lock:
+            return self.key_colors.version
+
+    def get_versioned_key_color_pairs(self):
+        """This method returns a tuple of the version of the key colors and the colors in the form that get_all_key_color_pairs returns."""
+
+        with self.color_lock:
+            return self.key_colors.version, self.key_colors.to_dict()
+
+    def sync_colors_from_daemon(self):
+        """This method replaces our in-process copy of the key colors with the colors the daemon reports.
+        It returns the new colors in the same form as get_all_key_color_pairs.
         """
 
-        # We get the rgb keys' colors
-        rgb_key_color_pairs = self.get_all_color_pairs()
+        # We get the rgb keys' colors and store them
+        return self._store_daemon_colors(self.get_all_color_pairs())
 
-        # The dict with key to colors mappings
-        key_color_dict = {}
+    def _store_daemon_colors(self, rgb_key_color_pairs: list):
+        """This method replaces our copy of the key colors with colors in the form that get_all_color_pairs returns, and returns them as a dict."""
 
-        # We loop through all the pairs and append the add the pairs' keys to the dictionary that we're going to return
-        for keys_color_pair in rgb_key_color_pairs:
-            # We split the key string by the commas that separate the keycodes
-            pair_key_list = keys_color_pair[0].split(",")
-            # We loop through the keys in the current pair and add that key with it's color to the dictionary
-            for key in pair_key_list:
-                key_color_dict[key] = keys_color_pair[1]
+        with self.color_lock:
+            # We loop through all the pairs and put their colors into our copy
+            for keys, color in rgb_key_color_pairs:
+                # The "all" key means that the whole keyboard has the same color, set_keys fills the keyboard for it
+                self.key_colors.set_keys(keys.split(","), color)
 
-        return key_color_dict
+            # The daemon has these colors, so diff rendering should compare to them
+            self.sent_colors.copy_from(self.key_colors)
+
+            return self.key_colors.to_dict()
 
     def set_key_color(self, key: str, rgb: tuple):
         """This method is used to set a key to a certain rgb (represented as a tuple of ints) color."""
 
         # We check that the input is valid, else we return False
-        if key.replace("_", "").replace(",", "").isalnum():
-            # Check if the rgb values are valid
-            if not all([256 > int(x) > -1 for x in rgb]) or len(rgb) != 3:
-                # The colour values are invalid so we return False
+        with tracing.span("validate_colors"):
+            if not key.replace("_", "").replace(",", "").isalnum() or len(rgb) != 3 or not all([256 > int(x) > -1 for x in rgb]) or self._has_unknown_keys(key):
                 return False
 
-            else:
-                # All arguments are valid, so we execute the command
-                self.execute_command("rgb " + key + ":" + "".join([str(format(int(x), "02x")) for x in rgb]))
+            color = "".join([str(format(int(x), "02x")) for x in rgb])
 
-                # We return True to indicate success
-                return True
+        # All arguments are valid, so we execute the command
+        self._apply_colors([(key, color)], None)
 
-        else:
-            # We return False
-            return False
+        # We return True to indicate success
+        return True
 
     def set_full_color(self, rgb: tuple):
         """This method is used to set the whole keyboard to a certain rgb (represented as a tuple of ints) color."""
@@ -371,7 +908,7 @@ class Keyboard(object):
 
         else:
             # The rgb values are valid, so we execute the command
-            self.execute_command("rgb " + "".join([str(format(int(x), "02x")) for x in rgb]))
+            self._apply_colors([], "".join([str(format(int(x), "02x")) for x in rgb]))
             # We return True to indicate success
             return True
 
@@ -384,50 +921,389 @@ class Keyboard(object):
         if len(keys_and_colors) == 0 and background is None:
             return
 
-        # The part of the finished command that is going to be the individual or groups of keys
-        keys_and_colors_command = ""
+        # We validate the colors and convert them to hex strings
+        with tracing.span("validate_colors"):
+            colors = self._validate_colors(keys_and_colors, background)
+        if colors is None:
+            return False
+
+        # We execute the command, with the background part if there is one
+        self._apply_colors(*colors)
+
+        # We return True to indicate success
+        return True
 
-        # We got valid arguments, so we check if we should use the key list
-        if len(keys_and_colors) != 0:
+    def _validate_colors(self, keys_and_colors: list, background: tuple = None):
+        """This method validates the arguments of set_multiple_colors and fade_colors.
+        It returns a tuple of the list of (keys, hex color) pairs and the background as a hex color (or None), or None if the arguments are invalid.
+        """
 
-            # We loop through the list to validate all the key and color pairs
-            for pair in keys_and_colors:
-                if pair[0].replace("_", "").replace(",", "").isalnum():
-                    # Check if the rgb values are valid
-                    if not all([256 > int(x) > -1 for x in pair[1]]) or len(pair[1]) != 3:
-                        # The colour values are invalid so we return False
-                        return False
+        # The list of (keys, hex color) pairs that is going to be the individual or groups of keys part of the command
+        keys_and_colors_command = []
 
-                    else:
-                        # If the arguments were valid we append a string for the pair to the individual key part of the command
-                        keys_and_colors_command += " " + pair[0] + ":" + "".join(
-                            [str(format(int(x), "02x")) for x in pair[1]])
+        # We loop through the list to validate all the key and color pairs
+        for pair in keys_and_colors:
+            if pair[0].replace("_", "").replace(",", "").isalnum() and not self._has_unknown_keys(pair[0]):
+                # Check if the rgb values are valid
+                if not all([256 > int(x) > -1 for x in pair[1]]) or len(pair[1]) != 3:
+                    # The colour values are invalid so we return None
+                    return None
 
                 else:
-                    # We return False because the key name is not valid
-                    return False
+                    # If the arguments were valid we append the pair to the individual key part of the command
+                    keys_and_colors_command.append((pair[0], "".join([str(format(int(x), "02x")) for x in pair[1]])))
+
+            else:
+                # We return None because the key name is not valid
+                return None
 
         # We check if the user specified a background color for the command
-        if background is not None:
+        if background is None:
+            return keys_and_colors_command, None
 
-            # We check that the background rgb values are valid
-            if not all([256 > int(x) > -1 for x in background]) or len(background) != 3:
-                # We return False because the background rgb values are invalid
-                return False
+        # We check that the background rgb values are valid
+        if not all([256 > int(x) > -1 for x in background]) or len(background) != 3:
+            # We return None because the background rgb values are invalid
+            return None
 
-            # We execute the command with the background part
-            self.execute_command(
-                "rgb " + "".join([str(format(int(x), "02x")) for x in background]) + keys_and_colors_command)
+        return keys_and_colors_command, "".join([str(format(int(x), "02x")) for x in background])
 
-            # We return True to indicate success
+    def _has_unknown_keys(self, keys: str):
+        """This method returns True if diff rendering is used and keys (comma separated keycodes) has a key that isn't in the layout of the model.
+        Diff rendering only sends the changes of the key colors, which only has the keys of the layout, so the colors of other keys would never be sent.
+        """
+
+        return self.diff_rendering and not all([key in self.key_colors or key == "all" for key in keys.split(",")])
+
+    def fade_colors(self, keys_and_colors: list, duration: float, background: tuple = None, easing: str = "linear"):
+        """This method fades keys from their current colors to new colors over duration seconds, the arguments are like for set_multiple_colors.
+        easing is the name of one of the functions in Color_Transition.easing_functions, which give the progress of the fade over time.
+        The fade is rendered on the server, with one frame per frame of the daemon (see cmd_set_fps), and all running fades share one timer.
+        Setting the colors of keys in any other way stops their fades. This method returns right away, and returns False if the arguments are invalid.
+        The duration has to be finite and at most MAX_FADE_DURATION, a duration of 0 sets the colors right away.
+        """
+
+        # We check that the arguments are valid, a fade that never ends (like one with an infinite duration) would never reach its colors
+        if len(keys_and_colors) == 0 and background is None:
+            return False
+        if easing not in Color_Transition.easing_functions or not (math.isfinite(duration) and 0 <= duration <= MAX_FADE_DURATION):
+            return False
+
+        colors = self._validate_colors(keys_and_colors, background)
+        if colors is None:
+            return False
+
+        # Without a duration there is nothing to fade
+        if duration == 0:
+            self._apply_colors(*colors)
             return True
 
-        else:
-            # We execute the command without the background part
-            self.execute_command("rgb " + keys_and_colors_command)
-            # We return True to indicate success
+        keys_and_colors, background = colors
+
+        with self.color_lock:
+            # We find the colors the keys fade to by applying the new colors to a copy of the key colors
+            target_colors = self.key_colors.copy()
+            if background is not None:
+                target_colors.fill(bytes.fromhex(background))
+            for keys, color in keys_and_colors:
+                target_colors.set_keys(keys.split(","), bytes.fromhex(color))
+
+            # A background fades every key, else only the keys that get a color
+            if background is not None:
+                slots = list(range(len(self.key_colors)))
+            else:
+                slots = sorted(set(self.key_colors.get_slots(",".join([keys for keys, _ in keys_and_colors]).split(","))))
+
+            if not slots:
+                return True
+
+            start_buffer, target_buffer = self.key_colors.buffer, target_colors.buffer
+            transition = Color_Transition(slots, b"".join([start_buffer[3 * slot:3 * slot + 3] for slot in slots]),
+                                          b"".join([target_buffer[3 * slot:3 * slot + 3] for slot in slots]), time.time(), duration, easing)
+
+            # A new fade replaces the fades of the same keys
+            self._cancel_transitions(slots)
+
+            with self.transition_condition:
+                self.transitions.append(transition)
+
+                # We start the timer if it isn't running
+                if self.transition_thread is None:
+                    self._start_transition_timer()
+
+        return True
+
+    def get_transition_count(self):
+        """This method returns the number of fades that are running."""
+
+        with self.transition_condition:
+            return len(self.transitions)
+
+    def _start_transition_timer(self):
+        """This method starts the thread that renders the transitions, it's called with the transition condition when the first transition is added."""
+
+        self.transition_thread = threading.Thread(target=self._transition_thread)
+        self.transition_thread.start()
+
+    def _cancel_transitions(self, slots: list = None):
+        """This method stops the transitions of the keys in slots (None means all keys), it must be called with the color lock."""
+
+        with self.transition_condition:
+            if slots is None:
+                self.transitions = []
+                return
+
+            slot_set = set(slots)
+            for transition in self.transitions:
+                transition.remove_slots(slot_set)
+
+            self.transitions = [transition for transition in self.transitions if transition.slots]
+
+    def _render_transitions(self):
+        """This method renders one frame of all running transitions and sends it, and removes the transitions that have finished.
+        It returns a tuple of the number of the command it queued (or None), and True if there are transitions left.
+        """
+
+        with self.color_lock:
+            with self.transition_condition:
+                transitions = list(self.transitions)
+
+            if not transitions:
+                return None, False
+
+            # The transitions cover different keys, so their colors can be sent together
+            now = time.time()
+            slots, colors = [], []
+            for transition in transitions:
+                slots.extend(transition.slots)
+                colors.append(transition.render(now))
+
+            command_number = self._set_slot_colors(memoryview(b"".join(colors)), slots)
+
+            # The transitions that have reached their end colors are done, transitions that were added or changed while we rendered are kept
+            with self.transition_condition:
+                self.transitions = [transition for transition in self.transitions if not transition.is_finished(now)]
+                return command_number, bool(self.transitions)
+
+    def _transition_thread(self):
+        """This method renders the transitions once per frame until there are none left, it's run on the transition thread."""
+
+        next_frame_time = time.time()
+
+        while not self.exiting:
+            command_number, transitions_left = self._render_transitions()
+            if command_number is not None:
+                self._wait_for_command(command_number)
+
+            with self.transition_condition:
+                if not transitions_left and not self.transitions:
+                    self.transition_thread = None
+                    return
+
+                # We wait until the next frame, and skip the frames we're too late for
+                next_frame_time += 1 / self.fps
+                if next_frame_time < time.time():
+                    next_frame_time = time.time()
+                self.transition_condition.wait_for(lambda: self.exiting, next_frame_time - time.time())
+
+        with self.transition_condition:
+            self.transition_thread = None
+
+    def set_frame(self, colors, slots: list = None):
+        """This method sets the colors of many keys from raw color bytes, with 3 bytes (R, G, B) per key, like a frame uploaded by binary_frame.Keyboard_Frame_Api.
+        If slots is None colors has a color for every key in the order of get_key_layout, else it has a color for every slot index in slots, in the same order.
+        The colors are copied straight from colors into the key color buffer, without converting them to hex strings first.
+        It returns False if the length of colors doesn't match, or if a slot index is out of range.
+        """
+
+        # We use a memoryview so slicing the colors doesn't copy them
+        colors = memoryview(colors).cast("B")
+
+        key_count = len(self.key_colors) if slots is None else len(slots)
+        if len(colors) != 3 * key_count or (slots and not 0 <= min(slots) <= max(slots) < len(self.key_colors)):
+            return False
+
+        # We check that there is something to change
+        if key_count == 0:
             return True
 
+        with self.color_lock:
+            # The new colors replace the fades of the keys
+            if self.transitions:
+                self._cancel_transitions(slots)
+
+            command_number = self._set_slot_colors(colors, slots)
+
+        # We wait for the command to be written, without holding the color lock
+        if command_number is not None:
+            self._wait_for_command(command_number)
+
+        return True
+
+    def _set_slot_colors(self, colors, slots: list = None):
+        """This method copies colors into the key colors and sends or schedules them, like set_frame, it must be called with the color lock.
+        It returns the number of the command that was queued, or None if no command was queued.
+        """
+
+        if slots is None:
+            self.key_colors.set_buffer(colors)
+        else:
+            self.key_colors.set_slots(slots, colors)
+
+        # Diff rendering finds the changes by itself, else we group the keys by color to keep the command short
+        keys_and_colors = [] if self.diff_rendering else self.key_colors.group_slots(range(len(self.key_colors)) if slots is None else slots)
+
+        return self._queue_colors(keys_and_colors, None)
+
+    def get_key_layout(self):
+        """This method returns the list of keycodes of this keyboard's model, in the order that set_frame and binary frames use."""
+        return list(self.key_colors.keycodes)
+
+    def get_frame_scheduler_stats(self):
+        """This method returns a dict with statistics about the frame scheduler.
+        "color_writes" is the number of color changes it has received, "frame_commands" is the number of rgb commands it has sent,
+        and "coalesced_writes" is the number of color changes that were merged into another frame's command instead of being sent separately.
+        """
+
+        with self.frame_lock:
+            return {
+                "color_writes": self.frame_color_writes,
+                "frame_commands": self.frame_commands,
+                "coalesced_writes": self.frame_color_writes - self.frame_commands,
+            }
+
+    def _apply_colors(self, keys_and_colors: list, background: str = None):
+        """This method sends already validated colors to the daemon, or to the next frame if the frame scheduler is used.
+        keys_and_colors shall be structured like [("w,a,s,d", "ffff00"), ("esc,caps", "0000ff")] and background is a hex color or None.
+        """
+
+        # We update our copy of the key colors, and send or schedule the colors while we hold the color lock
+        # That way the colors of concurrent calls reach the daemon in the same order as they were put into our copy
+        with self.color_lock, tracing.span("update_colors"):
+            # The new colors replace the fades of the keys, a background replaces all of them
+            if self.transitions:
+                self._cancel_transitions(None if background is not None else self.key_colors.get_slots(",".join([keys for keys, _ in keys_and_colors]).split(",")))
+
+            # A background overwrites every key
+            if background is not None:
+                self.key_colors.fill(bytes.fromhex(background))
+
+            for keys, color in keys_and_colors:
+                self.key_colors.set_keys(keys.split(","), bytes.fromhex(color))
+
+            command_number = self._queue_colors(keys_and_colors, background)
+
+        # We wait for the command to be written, without holding the color lock
+        if command_number is not None:
+            self._wait_for_command(command_number)
+
+    def _queue_colors(self, keys_and_colors: list, background: str = None):
+        """This method sends or schedules colors that have already been put into the key colors, it must be called with the color lock.
+        The arguments are the same as for _apply_colors, keys_and_colors isn't used with diff rendering, as the changes are found from the key colors.
+        It returns the number of the command that was queued, or None if no command was queued.
+        """
+
+        # We check if the frame scheduler should take care of the colors
+        if self.frame_scheduler:
+            with self.frame_lock:
+                self.frame_color_writes += 1
+
+                # With diff rendering the frame is made from the key colors, so we don't need to collect the changes
+                if not self.diff_rendering:
+                    # A background overwrites every key, so the keys that were set before it in this frame don't matter anymore
+                    if background is not None:
+                        self.frame_background = background
+                        self.frame_key_colors.clear()
+
+                    # We split the key groups so the last write of every key wins, a group with "all" in it works like a background
+                    for keys, color in keys_and_colors:
+                        key_list = keys.split(",")
+                        if "all" in key_list:
+                            self.frame_background = color
+                            self.frame_key_colors.clear()
+                        else:
+                            for key in key_list:
+                                self.frame_key_colors[key] = color
+
+            return None
+
+        # We send the changed keys right away if we use diff rendering without the frame scheduler
+        if self.diff_rendering:
+            diff_command = self._diff_command()
+            return None if diff_command is None else self.execute_command(diff_command, wait=False)
+
+        # We build and queue the command, the background has to come before the keys
+        command_parts = ["rgb"] if background is None else ["rgb", background]
+        return self.execute_command(" ".join(command_parts + [keys + ":" + color for keys, color in keys_and_colors]), wait=False)
+
+    def _diff_command(self):
+        """This method returns an rgb command that changes the colors the daemon has into the current key colors, or None if they're the same.
+        The changed keys are grouped by color, or the whole keyboard is sent with a background if that makes a shorter command.
+        The colors are marked as sent, so this must be called with the color lock and the command must be executed.
+        """
+
+        # We group the changed keys by their new color
+        color_keys = self.key_colors.diff(self.sent_colors)
+        if not color_keys:
+            return None
+
+        self.sent_colors.copy_from(self.key_colors)
+
+        diff_command = "rgb " + " ".join([",".join(keys) + ":" + color.hex() for color, keys in color_keys.items()])
+
+        # When most keys have changed (like when the whole keyboard gets a new background) a command that sets the whole keyboard,
+        # with the most common color as the background, is probably shorter
+        if sum([len(keys) for keys in color_keys.values()]) * 2 < len(self.key_colors):
+            return diff_command
+
+        full_command = self._full_command()
+
+        return diff_command if len(diff_command) <= len(full_command) else full_command
+
+    def _full_command(self):
+        """This method returns an rgb command that sets every key to its current color, with the most common color as the background.
+        It must be called with the color lock.
+        """
+
+        color_pairs = sorted(self.key_colors.color_pairs(), key=lambda pair: len(pair[0]), reverse=True)
+        return "rgb " + " ".join([bytes(color_pairs[0][1]).hex()] + [keys + ":" + bytes(color).hex() for keys, color in color_pairs[1:]])
+
+    def _send_frame(self):
+        """This method sends the colors that the frame scheduler has collected as one rgb command, if there are any."""
+
+        # With diff rendering the frame is the difference between the key colors and the last colors sent
+        if self.diff_rendering:
+            with self.color_lock:
+                diff_command = self._diff_command()
+                if diff_command is None:
+                    return
+
+                self.execute_command(diff_command, wait=False)
+
+            with self.frame_lock:
+                self.frame_commands += 1
+
+            return
+
+        with self.frame_lock:
+            # We check if anything has changed since the last frame
+            if self.frame_background is None and not self.frame_key_colors:
+                return
+
+            # We take the pending colors and reset them for the next frame
+            background, key_colors = self.frame_background, self.frame_key_colors
+            self.frame_background, self.frame_key_colors = None, {}
+            self.frame_commands += 1
+
+        # We group the keys by color to keep the command short
+        color_keys = {}
+        for key, color in key_colors.items():
+            color_keys.setdefault(color, []).append(key)
+
+        # We build and execute the command, the background has to come before the keys
+        command_parts = ["rgb"] if background is None else ["rgb", background]
+        self.execute_command(" ".join(command_parts + [",".join(keys) + ":" + color for color, keys in color_keys.items()]))
+
     def cmd_set_fps(self, fps: int):
         """This method is used to set the driver update frequence in updates per second (the fps argument)"""
 
@@ -436,6 +1312,9 @@ class Keyboard(object):
             # The input is valid, so we execute the fps command
             self.execute_command("fps {0:d}".format(int(fps)))
 
+            # We save the fps so the frame scheduler renders at the same rate as the daemon
+            self.fps = int(fps)
+
         else:
             # The input is invalid so we raise a ValueError
             raise ValueError
@@ -449,64 +1328,606 @@ class Keyboard(object):
             raise ValueError
         else:
             # The list of keys is valid, so we execute the notify command
-            self.execute_command("@" + str(self.notify_node_nr) + " notify " + "".join(keys))
+            self.execute_command("@" + str(self.notify_node_nr) + " notify " + " ".join(keys))
+
+            # We remember the keys, so notifications can be enabled again if the device is reattached
+            self.notification_keys.update(keys)
 
     def cmd_unset_notification(self, keys: list):
         """This method is used to disable notifications to the keyboard object's notifying node of all the keys in argument keys."""
 
         # We check that the key list only contains valid strings, if it's invalid we raise a ValueError
-        if len(keys) == 0 or all([x.replace("_", "").isalnum() for x in keys]):
+        if len(keys) == 0 or not all([x.replace("_", "").isalnum() for x in keys]):
             # The keys list is invalid, we raise a ValueError
             raise ValueError
         else:
             # The list of keys is valid, so we execute the notify command
             self.execute_command("@" + str(self.notify_node_nr) + " notify " + ":off ".join(keys) + ":off")
+            self.notification_keys.difference_update(keys)
 
-    def _notification_read_thread(self):
-        """This method is used as a thread target and is what reads the notification node."""
+    def enable_notifications(self, keys: list):
+        """This method enables notifications of the keys in keys for one user of them, like a stream or a subscription.
+        Notifications of a key stay enabled until every user that enabled them has called disable_notifications with it.
+        """
+
+        with self.notification_users_lock:
+            keys = list(dict.fromkeys(keys))
+
+            # We only send a command for the keys that had no users, we call the synchronous version as subclasses (like AsyncKeyboard) override it
+            new_keys = [key for key in keys if not self.notification_users[key]]
+            if new_keys:
+                Keyboard.cmd_set_notification(self, new_keys)
+
+            self.notification_users.update(keys)
+
+    def disable_notifications(self, keys: list):
+        """This method removes one user of the notifications of the keys in keys, they're disabled for the keys that have no users left."""
+
+        with self.notification_users_lock:
+            keys = [key for key in dict.fromkeys(keys) if self.notification_users[key]]
+            self.notification_users.subtract(keys)
+
+            # We only send a command for the keys that have no users left
+            unused_keys = [key for key in keys if not self.notification_users[key]]
+            for key in unused_keys:
+                del self.notification_users[key]
+            if unused_keys:
+                Keyboard.cmd_unset_notification(self, unused_keys)
+
+    def mark_device_lost(self):
+        """This method marks the device as unplugged, it's called when the cmd or notification node is closed by the daemon (or by a hotplug.Hotplug_Watcher).
+        Until reattach is called, commands are thrown away and the notification reader is stopped, but the colors are still kept up to date.
+        """
+
+        with self.cmd_condition:
+            if not self.device_connected:
+                return
+
+            self.device_connected = False
+
+        print("The keyboard " + self.serial + " has been unplugged or ckb-daemon has stopped, waiting for it to come back.")
+
+        # We wake up the notification reader so it stops
+        os.write(self.notify_wake_write_fd, b"\0")
+
+    def reattach(self, device_path: str):
+        """This method opens the keyboard again after it has been plugged back in (or ckb-daemon has been restarted), device_path can be a new path.
+        It finds a free notify node, turns on notifications and software control again, and sends the fps, key notifications, and colors that the keyboard had.
+        It raises OSError if the device can't be opened, then the keyboard stays unplugged and reattach can be called again.
+        """
+
+        with self.attach_lock:
+            # We stop the notification reader of the old device and close its notify node
+            self.mark_device_lost()
+            if self.notification_thread is not None:
+                self.notification_thread.join()
+                self.notification_thread = None
+            if self.notify_fd is not None:
+                os.close(self.notify_fd)
+                self.notify_fd = None
+
+            # We read the info of the device and find a free notify node, like __enter__ does
+            self.keyboard_path = os.path.join(device_path, "")
+            self._read_device_info()
+
+            # We replace the cmd node when the command writer isn't writing to it
+            cmd_fd = os.open(self.keyboard_path + "cmd", os.O_WRONLY)
+            with self.cmd_condition:
+                self.cmd_condition.wait_for(lambda: not self.cmd_writing)
+                cmd_fd, self.cmd_fd = self.cmd_fd, cmd_fd
+                self.device_connected = True
+            os.close(cmd_fd)
+
+            try:
+                self._attach_notifications()
+            except OSError:
+                self.mark_device_lost()
+                raise
+
+            self._replay_state()
+
+    def _replay_state(self):
+        """This method sends the fps, the key notifications, and the colors of every key to the daemon, so a reattached device looks like it did before."""
+
+        self.execute_command("fps {0:d}".format(self.fps), wait=False)
+
+        if self.notification_keys:
+            self.execute_command("@" + str(self.notify_node_nr) + " notify " + " ".join(sorted(self.notification_keys)), wait=False)
+
+        with self.color_lock:
+            self.sent_colors.copy_from(self.key_colors)
+            command_number = self.execute_command(self._full_command(), wait=False)
+
+        self._wait_for_command(command_number)
+
+    def _command_write_thread(self):
+        """This method is used as a thread target and is what writes the queued commands to the cmd node.
+        Every command that is queued while the thread is busy is written together in the next write.
+        """
 
         while True:
-            # We check if we should exit
-            if not self.exiting:
-                # We read and save the contents of the notify file for the keyboards
-                with open(self.notify_path, buffering=1) as notify_file:
-                    if os.path.exists(self.notify_path):
-                        # We check and wait for data to be read, but we timeout after one second as to not miss if we should exit
-                        read, _, _ = select.select([notify_file], [], [], 1 / 60)
-                        if read:
-                            # We read the data and add it to the unread_notifications variable
-                            notify_temp_content = notify_file.readline()
-
-                            # We acquire the lock for notifications
-                            with self.notify_lock:
-                                self.unread_notifications += notify_temp_content
-
-                    else:
-                        # We don't have a notification node, so we print an error and exit
-                        print(
-                            "Could not find notification node, please make sure that ckb-daemon is running and that the keyboard hasn't been unplugged and try again")
-                        exit()
+            with self.cmd_condition:
+                # We wait until there are commands to write, or until we should exit
+                while not self.cmd_queue and not self.cmd_writer_exiting:
+                    self.cmd_condition.wait()
 
+                # We check if we should exit, we only do that when everything has been written
+                if not self.cmd_queue:
+                    return
+
+            # We wait for the flush window so more commands can be collected into this write
+            if self.cmd_flush_interval > 0:
+                time.sleep(self.cmd_flush_interval)
+
+            with self.cmd_condition:
+                # We take all the queued commands and remember how many commands we've taken in total
+                cmd_batch = self.cmd_queue
+                self.cmd_queue = []
+                batch_end = self.cmd_queued_count
+
+                # We take the cmd node while we hold the lock, reattach waits for us to finish writing before it replaces it
+                cmd_fd, device_connected = self.cmd_fd, self.device_connected
+                self.cmd_writing = True
+
+                # We take the traces of the commands in the batch
+                traced_commands = []
+                if self.traced_commands:
+                    traced_commands = [trace for number, trace in self.traced_commands if number <= batch_end]
+                    self.traced_commands = [(number, trace) for number, trace in self.traced_commands if number > batch_end]
+
+            # We write the whole batch, os.write might not write everything at once so we loop until it has
+            # While the device is unplugged we throw the commands away, reattach sends the current state when it's back
+            if device_connected:
+                write_start_time = time.perf_counter()
+                cmd_data = memoryview("".join(cmd_batch).encode("utf-8"))
+                try:
+                    while cmd_data:
+                        cmd_data = cmd_data[os.write(cmd_fd, cmd_data):]
+                except OSError:
+                    # The daemon has closed the cmd node, the device has been unplugged or the daemon has stopped
+                    self.mark_device_lost()
+
+                write_end_time = time.perf_counter()
+                self.cmd_write_histogram.observe(write_end_time - write_start_time)
+                self.cmd_batch_histogram.observe(len(cmd_batch))
+
+                for trace in traced_commands:
+                    trace.add_span("cmd_write", write_start_time, write_end_time, {"commands": len(cmd_batch)})
+
+            with self.cmd_condition:
+                # We tell the waiting callers that their commands have been written
+                self.cmd_written_count = batch_end
+                self.cmd_write_count += 1
+                self.cmd_writing = False
+                self.cmd_condition.notify_all()
+
+    def _frame_scheduler_thread(self):
+        """This method is used as a thread target and is what sends the collected colors once per frame."""
+
+        # The time the next frame should be sent
+        next_frame_time = time.time()
+
+        while not self.exiting:
+            # We wait for the next frame, the fps is read every frame so cmd_set_fps takes effect right away
+            next_frame_time += 1 / self.fps
+            sleep_time = next_frame_time - time.time()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
             else:
+                # We're behind (the writes took longer than a frame), so we don't try to catch up
+                next_frame_time = time.time()
+
+            self._send_frame()
+
+    def _notification_read_thread(self):
+        """This method is used as a thread target and is what reads the notification node.
+        It sleeps until there is data to read (or until __exit__ wakes it up), and then reads everything that's available at once.
+        """
+
+        # The part of a line that has been read without its newline
+        partial_line = b""
+
+        while not self.exiting and self.device_connected:
+            # We wait for data to be read, or for the wake up pipe to tell us that we're exiting or that the device is gone
+            read, _, _ = select.select([self.notify_fd, self.notify_wake_read_fd], [], [])
+            if self.notify_wake_read_fd in read:
+                os.read(self.notify_wake_read_fd, 4096)
+            if self.notify_fd not in read:
+                continue
+
+            # We read all the data that is available
+            notify_data = self._read_available_notifications()
+
+            if notify_data is None:
+                # The daemon has closed the notification node, so the keyboard has been unplugged or the daemon has stopped
+                self.mark_device_lost()
                 return
 
+            # We parse and store the data
+            partial_line = self._handle_notification_data(partial_line + notify_data)
+
+    def _read_available_notifications(self):
+        """This method reads all the data that is available from the notification node without blocking.
+        It returns None if the daemon has closed the notification node.
+        """
+
+        notify_data = []
+        while True:
+            try:
+                data = os.read(self.notify_fd, 65536)
+            except BlockingIOError:
+                # There is nothing more to read right now
+                break
+
+            if not data:
+                return None
+
+            notify_data.append(data)
+
+        return b"".join(notify_data)
+
+    def _handle_notification_data(self, notify_data: bytes):
+        """This method parses data read from the notification node and adds the lines and key events to the unread buffers.
+        It returns the last line if it doesn't end with a newline, it should be put in front of the next data that is read.
+        """
+
+        # We split the data into lines, and keep the last line if it doesn't end with a newline
+        lines = notify_data.split(b"\n")
+        partial_line = lines.pop()
+
+        # We parse the lines before we take the lock, so we hold it for as short as possible
+        timestamp = time.time()
+        notify_lines = [line.decode("utf-8", errors="replace").strip() for line in lines]
+        notify_lines = [line for line in notify_lines if line]
+        self.notification_lines_counter.inc(len(notify_lines))
+
+        # Key events look like "key +w" when w is pressed, and "key -w" when it's released
+        key_events = [(timestamp, line[5:], line[4] == "+") for line in notify_lines
+                      if line.startswith("key ") and line[4:5] in ("+", "-")]
+
+        # We acquire the lock for notifications and add the lines and events, counting the ones that push old ones out of the buffers
+        with self.notify_lock:
+            self.notification_overflows += max(0, len(self.unread_notifications) + len(notify_lines) - self.notification_buffer_size)
+            self.key_event_overflows += max(0, len(self.unread_key_events) + len(key_events) - self.notification_buffer_size)
+
+            self.unread_notifications.extend(notify_lines)
+            self.unread_key_events.extend(key_events)
+
+            # We wake up everyone that waits for a response
+            self.notify_condition.notify_all()
+
+        # We give the notifications to the listeners
+        for listener in self.notification_listeners:
+            listener(notify_lines, key_events)
+
+        # We give the key events to the subscribed handlers
+        if key_events and self.subscriptions:
+            self._dispatch_key_events(key_events)
+
+        return partial_line
+
+class Key_Event_Subscription(object):
+    """This class is a subscription to key events, it's created by Keyboard.subscribe_key_events.
+    It has its own bounded queue of events, that is handled by at most one thread at a time.
+    """
+
+    def __init__(self, handler, keys: list, pressed: bool, queue_size: int):
+        """This method creates a subscription for handler, keys and pressed are used to filter the events like subscribe_key_events describes."""
+
+        # We save the handler and the filters, the keys are stored as a set for fast lookups
+        self.handler = handler
+        self.keys = None if keys is None else set(keys)
+        self.pressed = pressed
+
+        # The lock, the queue of events that haven't been handled, and the number of events that were dropped because the queue was full
+        self.lock = threading.Lock()
+        self.queue = collections.deque(maxlen=queue_size)
+        self.overflows = 0
+
+        # A variable that tells if the subscription is running (or is about to run) in the thread pool
+        self.scheduled = False
+
+    def add_events(self, key_events: list):
+        """This method adds the matching events to the queue.
+        It returns True if the subscription needs to be scheduled to run, and marks it as scheduled.
+        """
+
+        # We filter the events
+        matching_events = [event for event in key_events
+                           if (self.keys is None or event[1] in self.keys) and (self.pressed is None or event[2] == self.pressed)]
+        if not matching_events:
+            return False
+
+        with self.lock:
+            self.overflows += max(0, len(self.queue) + len(matching_events) - self.queue.maxlen)
+            self.queue.extend(matching_events)
+
+            # We check if the subscription is already running, it will handle the new events too
+            if self.scheduled:
+                return False
+
+            self.scheduled = True
+            return True
+
+    def run(self):
+        """This method calls the handler for every queued event until the queue is empty, it's run in the dispatcher thread pool."""
+
+        while True:
+            with self.lock:
+                # We're done when the queue is empty, and we have to be scheduled again for new events
+                if not self.queue:
+                    self.scheduled = False
+                    return
+
+                event = self.queue.popleft()
+
+            # We call the handler, an exception in it shouldn't stop the other events from being handled
+            try:
+                self.handler(*event)
+            except Exception:
+                traceback.print_exc()
+
+    def get_stats(self):
+        """This method returns a dict with the number of queued events and the number of dropped events."""
+
+        with self.lock:
+            return {"queued_events": len(self.queue), "dropped_events": self.overflows}
+
+
+class Color_Transition(object):
+    """This class is a fade of a list of keys from their start colors to their end colors, it's created by Keyboard.fade_colors."""
+
+    # The easing functions, they map the fraction of the duration that has passed to the fraction of the way from the start colors to the end colors
+    easing_functions = {
+        "linear": lambda x: x,
+        "ease_in": lambda x: x * x,
+        "ease_out": lambda x: 1 - (1 - x) * (1 - x),
+        "ease_in_out": lambda x: x * x * (3 - 2 * x),
+    }
+
+    def __init__(self, slots: list, start_colors: bytes, end_colors: bytes, start_time: float, duration: float, easing: str):
+        """This method creates a transition of the keys in slots, the colors are 3 bytes per key in the same order."""
+
+        self.slots = slots
+        self.start_colors = start_colors
+        self.end_colors = end_colors
+        self.start_time = start_time
+        self.duration = duration
+        self.easing = self.easing_functions[easing]
+
+    def render(self, now: float):
+        """This method returns the colors of the keys at the time now, as 3 bytes per key."""
+
+        progress = min(1.0, max(0.0, (now - self.start_time) / self.duration))
+        if progress == 1.0:
+            return self.end_colors
+
+        amount = self.easing(progress)
+        return bytes([int(start + (end - start) * amount + 0.5) for start, end in zip(self.start_colors, self.end_colors)])
+
+    def is_finished(self, now: float):
+        """This method returns True if the transition has reached its end colors at the time now."""
+        return now >= self.start_time + self.duration
+
+    def remove_slots(self, slot_set: set):
+        """This method stops the transition of the keys in slot_set, the other keys keep fading."""
+
+        keep = [position for position, slot in enumerate(self.slots) if slot not in slot_set]
+        if len(keep) == len(self.slots):
+            return
+
+        self.slots = [self.slots[position] for position in keep]
+        self.start_colors = b"".join([self.start_colors[3 * position:3 * position + 3] for position in keep])
+        self.end_colors = b"".join([self.end_colors[3 * position:3 * position + 3] for position in keep])
+
+
+class Key_Color_Store(object):
+    """This class stores the colors of a fixed list of keys in a single bytearray, with 3 bytes (R, G, B) per key.
+    Every key has a slot, the index of the key in the keycodes list, so whole-keyboard operations work on the whole buffer at once.
+    Colors can be given as anything bytes() accepts, like a tuple of 3 ints or 3 bytes.
+    This class isn't thread-safe by itself, the Keyboard class uses it with its color lock.
+    """
+
+    def __init__(self, keycodes: list):
+        """This method creates a store where all the keys in keycodes are black."""
+
+        # The keycodes in slot order and the keycode to slot index table
+        self.keycodes = list(keycodes)
+        self.index = {key: slot for slot, key in enumerate(self.keycodes)}
+
+        # The buffer with all the colors
+        self.buffer = bytearray(3 * len(self.keycodes))
+
+        # The version of the colors, it's increased every time the colors are changed, but not when they're set to the colors they already have
+        self.version = 0
+
+    def __len__(self):
+        """This method returns the number of keys in the store."""
+        return len(self.keycodes)
+
+    def __contains__(self, key: str):
+        """This method returns True if the key has a slot in the store."""
+        return key in self.index
+
+    def get(self, key: str):
+        """This method returns the color of a key as a tuple of 3 ints, or None if the key isn't in the store."""
+
+        slot = self.index.get(key)
+        if slot is None:
+            return None
+
+        return tuple(self.buffer[3 * slot:3 * slot + 3])
+
+    def set(self, key: str, rgb):
+        """This method sets the color of a key, it returns False if the key isn't in the store."""
+
+        slot = self.index.get(key)
+        if slot is None:
+            return False
+
+        rgb = bytes(rgb)
+        if self.buffer[3 * slot:3 * slot + 3] != rgb:
+            self.buffer[3 * slot:3 * slot + 3] = rgb
+            self.version += 1
+
+        return True
+
+    def set_keys(self, keys: list, rgb):
+        """This method sets the color of all the keys in the keys list, keys that aren't in the store are ignored.
+        The key "all" means every key, like it does for ckb-daemon.
+        """
+
+        if "all" in keys:
+            self.fill(rgb)
+            return
+
+        # We only convert the color once, and compare the whole buffer once to find out if anything changed
+        rgb = bytes(rgb)
+        old_buffer = bytes(self.buffer)
+
+        for key in keys:
+            slot = self.index.get(key)
+            if slot is not None:
+                self.buffer[3 * slot:3 * slot + 3] = rgb
+
+        if self.buffer != old_buffer:
+            self.version += 1
+
+    def fill(self, rgb):
+        """This method sets all keys to the same color."""
+        self.set_buffer(bytes(rgb) * len(self.keycodes))
+
+    def get_slots(self, keys: list):
+        """This method returns the list of slot indices of the keys in keys, keys that aren't in the store are left out, and "all" means every slot."""
+
+        if "all" in keys:
+            return list(range(len(self.keycodes)))
+
+        index = self.index
+        return [index[key] for key in keys if key in index]
+
+    def set_slots(self, slots: list, colors):
+        """This method sets the colors of the keys in the slots list, colors has to be 3 bytes per slot in the same order."""
+
+        # We compare the whole buffer once to find out if anything changed
+        old_buffer = bytes(self.buffer)
+
+        buffer = memoryview(self.buffer)
+        for position, slot in enumerate(slots):
+            buffer[3 * slot:3 * slot + 3] = colors[3 * position:3 * position + 3]
+
+        if self.buffer != old_buffer:
+            self.version += 1
+
+    def group_slots(self, slots):
+        """This method returns the colors of the keys in slots in the form of [(comma_separated_keys, hex color), ...], with one entry per distinct color."""
+
+        # We group the slots by their 3 bytes
+        color_keys = {}
+        buffer = bytes(self.buffer)
+        for slot in slots:
+            color_keys.setdefault(buffer[3 * slot:3 * slot + 3], []).append(self.keycodes[slot])
+
+        return [(",".join(keys), color.hex()) for color, keys in color_keys.items()]
+
+    def get_buffer(self):
+        """This method returns a copy of the whole buffer as bytes."""
+        return bytes(self.buffer)
+
+    def set_buffer(self, data):
+        """This method replaces the whole buffer, data has to be 3 bytes per key in slot order."""
+
+        if len(data) != len(self.buffer):
+            raise ValueError
+
+        if self.buffer != data:
+            self.buffer[:] = data
+            self.version += 1
+
+    def copy(self):
+        """This method returns a new store with the same keys and colors, the keycode table is shared."""
+
+        store_copy = Key_Color_Store.__new__(Key_Color_Store)
+        store_copy.keycodes = self.keycodes
+        store_copy.index = self.index
+        store_copy.buffer = bytearray(self.buffer)
+        store_copy.version = self.version
+
+        return store_copy
+
+    def copy_from(self, other):
+        """This method copies all colors from another store with the same keys."""
+        self.set_buffer(other.buffer)
+
+    def to_dict(self):
+        """This method returns the colors in the form of {"key": (color_tuple)}."""
+
+        buffer = self.buffer
+        return {key: (buffer[3 * slot], buffer[3 * slot + 1], buffer[3 * slot + 2]) for slot, key in enumerate(self.keycodes)}
+
+    def diff(self, other):
+        """This method compares the colors to another store with the same keys.
+        It returns a dict of color (as 3 bytes) to the list of keys that have that color here but another color in the other store.
+        """
+
+        # We return early if nothing has changed, comparing the whole buffers is much faster than comparing every key
+        if self.buffer == other.buffer:
+            return {}
+
+        color_keys = {}
+        buffer, other_buffer = bytes(self.buffer), bytes(other.buffer)
+        for slot, key in enumerate(self.keycodes):
+            color = buffer[3 * slot:3 * slot + 3]
+            if color != other_buffer[3 * slot:3 * slot + 3]:
+                color_keys.setdefault(color, []).append(key)
+
+        return color_keys
+
+    def color_pairs(self):
+        """This method returns the colors in the form of [(comma_separated_keys, color tuple), ...], with one entry per distinct color."""
+
+        # We group the slots by their 3 bytes
+        color_keys = {}
+        buffer = bytes(self.buffer)
+        for slot, key in enumerate(self.keycodes):
+            color_keys.setdefault(buffer[3 * slot:3 * slot + 3], []).append(key)
+
+        return [(",".join(keys), tuple(color)) for color, keys in color_keys.items()]
+
+
 class Keyboard_Falcon_Api(object):
     """This class represents and handler the HTTP REST api for a keyboard object."""
 
-    def __init__(self, keyboard):
-        """This method initialises the API."""
+    def __init__(self, keyboard, enter_keyboard: bool = True):
+        """This method initialises the API, it opens keyboard unless enter_keyboard is False, which means the keyboard is already open."""
 
         # The list of dicts that describe what commands can be user via HTTP GET requests
         self.get_commands = [
-            dict(command="get_multiple_key_rgb", method=self.cmd_get_get_multiple_key_rgb)
+            dict(command="get_multiple_key_rgb", method=self.cmd_get_get_multiple_key_rgb),
+            dict(command="get_frame_scheduler_stats", method=self.cmd_get_frame_scheduler_stats)
         ]
 
         # The list of dicts that describe what commands can be used via HTTP POST requests
         self.post_commands = [
-            dict(command="set_rgb_single", method=self.cmd_post_rgb_change_single)
+            dict(command="set_rgb_single", method=self.cmd_post_rgb_change_single),
+            dict(command="set_rgb_multiple", method=self.cmd_post_rgb_change_multiple),
+            dict(command="fade_rgb", method=self.cmd_post_rgb_fade)
         ]
 
-        self.keyboard = keyboard.__enter__()
+        self.keyboard = keyboard.__enter__() if enter_keyboard else keyboard
+
+        # The lock and cache for get_multiple_key_rgb responses, the cache is only valid for one version of the key colors
+        # The encoded colors are a dict of color format to a dict of key to encoded color, and the responses are a dict of (color format, keys) to the JSON response
+        self.color_cache_lock = threading.Lock()
+        self.color_cache_version = None
+        self.color_cache_encoded_colors = {}
+        self.color_cache_responses = {}
+
+        # The maximum number of cached responses, there's one for every combination of color format and requested keys
+        self.color_cache_size = 64
+
+        # The versions restart when the server restarts, so the ETags include the time the server started to not be mistaken for old ones
+        self.etag_prefix = format(int(time.time() * 1000), "x")
 
     def on_get(self, req, resp):
         """This method handles all get requests to our API."""
@@ -525,32 +1946,15 @@ class Keyboard_Falcon_Api(object):
             else:
                 # We check if the user want/tries to use a command
                 try:
-                    # Store the request body
-                    req_body = req.stream.read().decode("utf-8")
+                    with tracing.span("parse_json"):
+                        # Store the request body
+                        req_body = req.stream.read().decode("utf-8")
 
-                    # We try to parse the request as json
-                    post_params = json.loads(req_body)
+                        # We try to parse the request as json
+                        post_params = json.loads(req_body)
 
-                    # We check that the arguments exist and are valid
-                    if post_params["command"]:
-                        # We check what command was used
-                        for command in self.get_commands:
-                            # We check if the current request matches the command
-                            if post_params["command"] == command["command"]:
-                                # We call the command method with the request object, response object, and the parsed request dictionary
-                                command["method"](req, resp, post_params)
-
-                                # No more than one command shall be executed per request
-                                break
-                        else:
-                            # If no command was found we return bad request
-                            resp.status = falcon.HTTP_400
-                            resp.body = json.dumps({"message": "Invalid command"})
-
-                    else:
-                        # Invalid arguments
-                        resp.status = falcon.HTTP_400
-                        resp.body = json.dumps({"message": "Invalid arguments"})
+                    # We execute the command
+                    self.run_command(self.get_commands, req, resp, post_params)
 
                     # We're done now
                     return
@@ -573,32 +1977,15 @@ class Keyboard_Falcon_Api(object):
                 if req.content_length in (0, None):
                     raise json.JSONDecodeError
 
-                # We store the request body
-                req_body = req.stream.read().decode("utf-8")
-
-                # We try to parse the request as json
-                post_params = json.loads(req_body)
-
-                # We check that the arguments exist and are valid
-                if post_params["command"]:
-                    # We check what command was used
-                    for command in self.post_commands:
-                        # We check if the current request matches the command
-                        if post_params["command"] == command["command"]:
-                            # We call the command method with the request object, response object, and the parsed request dictionary
-                            command["method"](req, resp, post_params)
+                with tracing.span("parse_json"):
+                    # We store the request body
+                    req_body = req.stream.read().decode("utf-8")
 
-                            # No more than one command shall be executed per request
-                            break
-                    else:
-                        # If no command was found we return bad request
-                        resp.status = falcon.HTTP_400
-                        resp.body = json.dumps({"message": "Invalid command"})
+                    # We try to parse the request as json
+                    post_params = json.loads(req_body)
 
-                else:
-                    # Invalid arguments
-                    resp.status = falcon.HTTP_400
-                    resp.body = json.dumps({"message": "Invalid arguments"})
+                # We execute the command
+                self.run_command(self.post_commands, req, resp, post_params)
 
                 # We're done now
                 return
@@ -611,6 +1998,51 @@ class Keyboard_Falcon_Api(object):
             # Fuck you user
             resp.status = falcon.HTTP_417
 
+    def run_command(self, commands: list, req, resp, post_params: dict):
+        """This method finds the command that post_params asks for in commands (self.get_commands or self.post_commands) and executes it."""
+
+        # We check that the arguments exist and are valid, every command gets its arguments as a dict
+        if type(post_params) == dict and type(post_params.get("arguments", {})) == dict and post_params.get("command"):
+            post_params.setdefault("arguments", {})
+
+            # We check what command was used
+            for command in commands:
+                # We check if the current request matches the command
+                if post_params["command"] == command["command"]:
+                    # We call the command method with the request object, response object, and the parsed request dictionary
+                    start_time = time.perf_counter()
+                    with tracing.span("command", command=command["command"]):
+                        command["method"](req, resp, post_params)
+                    self._observe_command(command["command"], resp, time.perf_counter() - start_time)
+
+                    # No more than one command shall be executed per request
+                    break
+            else:
+                # If no command was found we return bad request
+                resp.status = falcon.HTTP_400
+                resp.body = json.dumps({"message": "Invalid command"})
+
+        else:
+            # Invalid arguments
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": "Invalid arguments"})
+
+    def _observe_command(self, command_name: str, resp, duration: float):
+        """This method adds the time a command took and the status of its response to the metrics of the keyboard."""
+
+        self.keyboard.metrics.histogram("keyboard_api_command_seconds", "The time the API commands took.", {"command": command_name}).observe(duration)
+        self.keyboard.metrics.counter("keyboard_api_responses_total", "The number of responses of the API commands, by status code.",
+                                      {"command": command_name, "status": str(resp.status)[:3]}).inc()
+
+    def cmd_get_frame_scheduler_stats(self, req, resp, post_params):
+        """This method sends back the statistics of the keyboard's frame scheduler, as Keyboard.get_frame_scheduler_stats returns them.
+        The response includes "frame_scheduler" and "diff_rendering", which are true if the keyboard uses them, and a property called "stats".
+        """
+
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({"frame_scheduler": self.keyboard.frame_scheduler, "diff_rendering": self.keyboard.diff_rendering,
+                                "stats": self.keyboard.get_frame_scheduler_stats()})
+
     def cmd_get_get_multiple_key_rgb(self, req, resp, post_params):
         """This method handles getting and sending back the rgb colors of keys on the keyboard.
         The request arguments should include a list of keycodes as strings called "keys", and optionally a string called "color_format" that is either "hex" or "ints"
@@ -619,9 +2051,11 @@ class Keyboard_Falcon_Api(object):
         If the HTTP status code of the response is not 200, the response will include a "message" property with an error message.
         If the HTTP status code of the response is 200, the response will include a property called "keys", where all the valid keycodes (that exist on the server keyboard) that were specified in the request are names of properties.
         Those properties are either lists of ints, or lowercase hex strings, depending on the "color_format" request argument.
-        A keycode may be returned with a color of the background color of the keyboard, although this only happens when the whole server keyboard is the same color.
-        If the whole server keyboard is not the same color, keycodes that are not on the server keyboard will not have a property in the response.
+        Keycodes that are not on the server keyboard will not have a property in the response.
         This means that the response may be equal to json.dumps({"key": {}})
+        The colors are read from the server's copy of the keyboard colors, if the optional argument "sync" is true they are read from the daemon first.
+        The response has an ETag header that changes when the colors change, if the request has an If-None-Match header with the same ETag,
+        the response has the HTTP status code 304 and no body.
         """
 
         # We check if all arguments exist
@@ -629,45 +2063,33 @@ class Keyboard_Falcon_Api(object):
             if type(post_params["arguments"]["keys"]) == list:
                 # We loop through the keys list and check that all items are strings
                 if all([type(x) == str for x in post_params["arguments"]["keys"]]):
-                    # We get the dictionary of keys to color from the keyboard
-                    key_color_dict = self.keyboard.get_all_key_color_pairs()
-
-                    # The dict we're going to return
-                    requested_keys_dict = {"keys": {}}
+                    # We read the colors from the daemon first if the user wants that
+                    if post_params["arguments"].get("sync") is True:
+                        self.keyboard.sync_colors_from_daemon()
 
                     # We check if the user wanted the response colors to be hex or not
-                    if "color_format" in post_params["arguments"]:
-                        if post_params["arguments"]["color_format"] == "hex":
-                            # We do the same thing, but we add the color values as lists of ints
-                            for key in key_color_dict:
-                                if key in post_params["arguments"]["keys"]:
-                                    requested_keys_dict["keys"][key] = ("".join([str(format(int(x), "02x")) for x in key_color_dict[key]]))
-                                else:
-                                    # We check if the whole keyboard is one color
-                                    if "all" in key_color_dict:
-                                        requested_keys_dict["keys"][key] = ("".join([str(format(int(x), "02x")) for x in key_color_dict["all"]]))
-                        else:
-                            # We do the same thing, but we add the color values as lists of ints
-                            for key in key_color_dict:
-                                if key in post_params["arguments"]["keys"]:
-                                    requested_keys_dict["keys"][key] = key_color_dict[key]
-                                else:
-                                    # We check if the whole keyboard is one color
-                                    if "all" in key_color_dict:
-                                        requested_keys_dict["keys"][key] = key_color_dict["all"]
-                    else:
-                        # We do the same thing, but we add the color values as lists of ints
-                        for key in key_color_dict:
-                            if key in post_params["arguments"]["keys"]:
-                                requested_keys_dict["keys"][key] = key_color_dict[key]
-                            else:
-                                # We check if the whole keyboard is one color
-                                if "all" in key_color_dict:
-                                    requested_keys_dict["keys"][key] = key_color_dict["all"]
+                    color_format = "hex" if post_params["arguments"].get("color_format") == "hex" else "ints"
+
+                    # The requested keys without duplicates and in a fixed order, so the same keys always give the same cache entry and ETag
+                    requested_keys = tuple(sorted(set(post_params["arguments"]["keys"])))
+
+                    # We get the cached response for the current colors, or make it
+                    version, response_body = self._get_key_rgb_response(color_format, requested_keys)
+
+                    # The ETag identifies the colors, the color format, and the requested keys
+                    etag = '"{0:s}-{1:d}-{2:s}-{3:x}"'.format(self.etag_prefix, version, color_format,
+                                                             zlib.crc32(",".join(requested_keys).encode("utf-8")))
+                    resp.etag = etag
+
+                    # We check if the user already has this response
+                    if_none_match = req.get_header("If-None-Match")
+                    if if_none_match is not None and (if_none_match.strip() == "*" or etag in [x.strip() for x in if_none_match.split(",")]):
+                        resp.status = falcon.HTTP_304
+                        return
 
                     # We set the HTTP status code to 200 and the body of the response to the proper JSON response
                     resp.status = falcon.HTTP_200
-                    resp.body = json.dumps(requested_keys_dict)
+                    resp.body = response_body
 
                     # We're done, so we return
                     return
@@ -676,11 +2098,50 @@ class Keyboard_Falcon_Api(object):
         resp.status = falcon.HTTP_400
         resp.body = json.dumps({"message": "Invalid arguments"})
 
+    def _get_key_rgb_response(self, color_format: str, requested_keys: tuple):
+        """This method returns a tuple of the version of the key colors and the JSON get_multiple_key_rgb response for the requested keys.
+        The responses and the encoded colors are cached until the colors change.
+        """
+
+        # We check if we have a cached response for the current version
+        version = self.keyboard.get_color_version()
+        with self.color_cache_lock:
+            if version == self.color_cache_version and (color_format, requested_keys) in self.color_cache_responses:
+                return version, self.color_cache_responses[(color_format, requested_keys)]
+
+        # We get the colors together with their version, they might have changed since we checked
+        version, key_color_dict = self.keyboard.get_versioned_key_color_pairs()
+
+        with self.color_cache_lock:
+            # We clear the cache if it's for another version
+            if version != self.color_cache_version:
+                self.color_cache_version = version
+                self.color_cache_encoded_colors = {}
+                self.color_cache_responses = {}
+
+            # We encode the colors of all keys once per version and format
+            if color_format not in self.color_cache_encoded_colors:
+                if color_format == "hex":
+                    self.color_cache_encoded_colors[color_format] = {key: bytes(color).hex() for key, color in key_color_dict.items()}
+                else:
+                    self.color_cache_encoded_colors[color_format] = {key: list(color) for key, color in key_color_dict.items()}
+            encoded_colors = self.color_cache_encoded_colors[color_format]
+
+            # We make the response with the requested keys that are on the keyboard
+            response_body = json.dumps({"keys": {key: encoded_colors[key] for key in requested_keys if key in encoded_colors}})
+
+            # We cache the response, and forget an old one if the cache is full
+            if len(self.color_cache_responses) >= self.color_cache_size:
+                self.color_cache_responses.pop(next(iter(self.color_cache_responses)))
+            self.color_cache_responses[(color_format, requested_keys)] = response_body
+
+        return version, response_body
+
     def cmd_post_rgb_change_single(self, req, resp, post_params):
         """This method handles changing the keys of the keyboard to a single colour."""
 
         # We check if all arguments exist
-        if post_params["arguments"]["key"] and post_params["arguments"]["color"]:
+        if type(post_params["arguments"].get("key")) == str and type(post_params["arguments"].get("color")) == str and post_params["arguments"]["key"]:
             if self.is_hex_color(post_params["arguments"]["color"]):
 
                 # We check if the command executed successfully
@@ -709,6 +2170,85 @@ class Keyboard_Falcon_Api(object):
             resp.status = falcon.HTTP_400
             resp.body = json.dumps({"message": "Invalid arguments"})
 
+    def cmd_post_rgb_change_multiple(self, req, resp, post_params):
+        """This method handles changing many keys of the keyboard (and optionally the background) with a single daemon command.
+        The request arguments should include a list called "keys_and_colors" of [keys, color] pairs,
+        where keys is a keycode or comma separated keycodes (like "w,a,s,d") and color is a lowercase 6 char hex string.
+        The optional argument "background" is a hex color that every key that isn't in the list gets.
+        The whole request is validated before anything is changed, so either all colors are set or none are.
+        """
+
+        # We parse and validate the arguments
+        colors = self.parse_rgb_multiple_arguments(post_params["arguments"])
+
+        # We check that the arguments were valid, and that the command executed successfully
+        if colors is not None and self.keyboard.set_multiple_colors(*colors):
+            # Successfully executed the command
+            resp.status = falcon.HTTP_200
+            resp.body = json.dumps({"message": "Command successfully executed"})
+
+            return
+
+        # Invalid arguments
+        resp.status = falcon.HTTP_400
+        resp.body = json.dumps({"message": "Invalid arguments"})
+
+    def cmd_post_rgb_fade(self, req, resp, post_params):
+        """This method handles fading keys of the keyboard (and optionally the background) from their current colors to new colors on the server.
+        The request arguments are the same as for set_rgb_multiple, plus "duration", the number of milliseconds the fade takes,
+        and the optional "easing", which is "linear" (the default), "ease_in", "ease_out", or "ease_in_out".
+        The duration has to be a finite number from 0 to MAX_FADE_DURATION seconds, JSON numbers like Infinity and NaN are invalid.
+        The response is sent right away, the fade runs on the server.
+        """
+
+        # We parse and validate the arguments
+        colors = self.parse_rgb_multiple_arguments(post_params["arguments"])
+        duration = post_params["arguments"].get("duration")
+        easing = post_params["arguments"].get("easing", "linear")
+
+        # We check that the arguments were valid, and that the command executed successfully
+        if colors is not None and type(duration) in (int, float) and 0 <= duration <= MAX_FADE_DURATION * 1000 and type(easing) == str and \
+                self.keyboard.fade_colors(colors[0], duration / 1000, colors[1], easing):
+            # Successfully executed the command
+            resp.status = falcon.HTTP_200
+            resp.body = json.dumps({"message": "Command successfully executed"})
+
+            return
+
+        # Invalid arguments
+        resp.status = falcon.HTTP_400
+        resp.body = json.dumps({"message": "Invalid arguments"})
+
+    def parse_rgb_multiple_arguments(self, arguments: dict):
+        """This method validates the arguments of a set_rgb_multiple command, in one pass.
+        It returns a tuple of the keys and colors list and the background in the form that Keyboard.set_multiple_colors takes,
+        or None if the arguments are invalid or there's nothing to change.
+        """
+
+        if type(arguments) != dict:
+            return None
+
+        # We get the arguments, the background is optional
+        keys_and_colors = arguments.get("keys_and_colors", [])
+        background = arguments.get("background")
+
+        # We check that the pairs are lists of two strings where the second one is a hex color
+        if type(keys_and_colors) != list or not all(
+                [type(pair) == list and len(pair) == 2 and type(pair[0]) == str and type(pair[1]) == str and self.is_hex_color(pair[1])
+                 for pair in keys_and_colors]):
+            return None
+
+        # We check that the background is valid if it was specified
+        if background is not None and not (type(background) == str and self.is_hex_color(background)):
+            return None
+
+        # We check that there is something to change
+        if not keys_and_colors and background is None:
+            return None
+
+        return ([(keys, tuple(bytes.fromhex(color))) for keys, color in keys_and_colors],
+                None if background is None else tuple(bytes.fromhex(background)))
+
     def is_hex_color(self, string: str):
         """This method returns true if string is a properly formatted (lower case) hex color."""
 
@@ -0,0 +1,273 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import concurrent.futures
+import copy
+import json
+import threading
+
+import falcon
+
+from keyboard import Keyboard, Keyboard_Falcon_Api, find_supported_devices, get_device_prefix, load_config
+
+
+class Keyboard_Manager(object):
+    """This class opens all connected supported keyboards (or the ones with the given serial numbers) and drives them in parallel.
+    Every keyboard is a normal Keyboard, with its own command writer and notification reader, so a slow keyboard doesn't slow down the others.
+    Use it with a with statement, like a Keyboard.
+    """
+
+    def __init__(self, serials: list = None, **keyboard_options):
+        """This method stores the options for the manager, the keyboards are opened by __enter__.
+        serials is a list of serial numbers of the keyboards to use, None means all supported keyboards.
+        keyboard_options are passed to every Keyboard, like frame_scheduler=True, and device_prefix is also where the manager looks for the keyboards.
+        """
+
+        self.serials = serials
+        self.keyboard_options = keyboard_options
+
+        # The lock and dict of serial number to open keyboard, in the order of the device numbers
+        self.lock = threading.Lock()
+        self.keyboards = {}
+
+        # The thread pool that runs things on all keyboards at the same time
+        self.pool = None
+
+    def __enter__(self):
+        """This method finds and opens the keyboards, without asking the user anything. It exits if there are no keyboards to use."""
+
+        # We find the supported devices, and read the serial numbers of the ones we should use
+        config = load_config()
+        device_paths = find_supported_devices(get_device_prefix(self.keyboard_options.get("device_prefix")), config["supported_devices"])
+
+        device_serials = []
+        for device_path in device_paths:
+            with open(device_path + "serial") as serial_file:
+                serial = serial_file.read().strip()
+
+            if self.serials is None or serial in self.serials:
+                device_serials.append((device_path, serial))
+
+        if not device_serials:
+            print("None of the keyboards to use are connected, please connect a keyboard and try again.")
+            exit()
+
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(4, len(device_serials)))
+
+        # Opening a keyboard waits for the daemon, so we open all of them at the same time
+        futures = [self.pool.submit(lambda device: Keyboard(device_path=device[0], **self.keyboard_options).__enter__(), device) for device in device_serials]
+        concurrent.futures.wait(futures)
+
+        # If a keyboard failed to open (Keyboard.__enter__ exits, which the future keeps as a SystemExit) we close the ones that opened,
+        # as their threads would keep the program running, and then fail in the same way
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            list(self.pool.map(lambda keyboard: keyboard.__exit__(), [future.result() for future in futures if future.exception() is None]))
+            self.pool.shutdown(wait=True)
+            raise errors[0]
+
+        keyboards = [future.result() for future in futures]
+
+        with self.lock:
+            self.keyboards = {keyboard.serial: keyboard for keyboard in keyboards}
+
+        return self
+
+    def __exit__(self, *args):
+        """This method closes all the keyboards, at the same time."""
+
+        with self.lock:
+            keyboards, self.keyboards = list(self.keyboards.values()), {}
+
+        list(self.pool.map(lambda keyboard: keyboard.__exit__(), keyboards))
+        self.pool.shutdown(wait=True)
+
+    def open_keyboard(self, device_path: str):
+        """This method opens the keyboard at device_path and adds it to the keyboards, it's used when a keyboard is plugged in while the manager is open.
+        It returns the opened keyboard. If the keyboard fails to open it raises what Keyboard.__enter__ raised (a SystemExit if it exited),
+        after the keyboard has closed what it opened.
+        """
+
+        keyboard = Keyboard(device_path=device_path, **self.keyboard_options).__enter__()
+
+        with self.lock:
+            self.keyboards[keyboard.serial] = keyboard
+
+        return keyboard
+
+    def get_serials(self):
+        """This method returns the list of serial numbers of the open keyboards."""
+
+        with self.lock:
+            return list(self.keyboards)
+
+    def get_keyboard(self, serial: str):
+        """This method returns the open keyboard with the serial number, or None if there is none."""
+
+        with self.lock:
+            return self.keyboards.get(serial)
+
+    def get_keyboards(self):
+        """This method returns a dict of serial number to open keyboard."""
+
+        with self.lock:
+            return dict(self.keyboards)
+
+    def for_each(self, function, serials: list = None):
+        """This method calls function(keyboard) for the keyboards with the serial numbers in serials (None means all of them) at the same time.
+        It returns a dict of serial number to what the function returned, if the function raised an exception it's raised here.
+        """
+
+        with self.lock:
+            keyboards = {serial: keyboard for serial, keyboard in self.keyboards.items() if serials is None or serial in serials}
+
+        futures = {serial: self.pool.submit(function, keyboard) for serial, keyboard in keyboards.items()}
+        return {serial: future.result() for serial, future in futures.items()}
+
+
+class Keyboard_Manager_Api(object):
+    """This class is a falcon resource for the keyboards of a Keyboard_Manager, it should be added for both /keyboards and /keyboards/{serial}.
+    GET /keyboards returns the list of keyboards, /keyboards/<serial> is the normal /keyboard API for the keyboard with that serial number,
+    and /keyboards/all runs the command on all keyboards at the same time, and returns the response of every keyboard.
+    """
+
+    def __init__(self, manager: Keyboard_Manager, keyboard_apis: dict):
+        """This method creates the resource, keyboard_apis is a dict of serial number to the Keyboard_Falcon_Api of that keyboard."""
+
+        self.manager = manager
+        self.keyboard_apis = keyboard_apis
+
+    def on_get(self, req, resp, serial: str = None):
+        """This method handles the get requests, to the list of keyboards or to one or all keyboards."""
+
+        if serial is None:
+            # We list the keyboards
+            resp.status = falcon.HTTP_200
+            resp.body = json.dumps({"keyboards": [
+                {"serial": keyboard_serial, "model": keyboard.model_identifier, "name": keyboard.verbose_name.strip(), "path": keyboard.keyboard_path}
+                for keyboard_serial, keyboard in self.manager.get_keyboards().items()]})
+
+        elif serial == "all":
+            self._broadcast(req, resp, "get_commands")
+
+        elif serial in self.keyboard_apis:
+            self.keyboard_apis[serial].on_get(req, resp)
+
+        else:
+            resp.status = falcon.HTTP_404
+            resp.body = json.dumps({"message": "No keyboard with that serial number"})
+
+    def on_post(self, req, resp, serial: str = None):
+        """This method handles the post requests to one or all keyboards."""
+
+        if serial == "all":
+            self._broadcast(req, resp, "post_commands")
+
+        elif serial in self.keyboard_apis:
+            self.keyboard_apis[serial].on_post(req, resp)
+
+        else:
+            resp.status = falcon.HTTP_404
+            resp.body = json.dumps({"message": "No keyboard with that serial number"})
+
+    def _broadcast(self, req, resp, commands_name: str):
+        """This method runs the command of a request on all keyboards, commands_name is the name of the command list to use ("get_commands" or "post_commands").
+        The response has the status and response of every keyboard, and its status is 200 if the command succeeded on all of them.
+        """
+
+        # The requester has to be able to accept json
+        if not req.client_accepts_json:
+            resp.status = falcon.HTTP_417
+            resp.body = json.dumps({"message": "Client doesn't accept JSON"})
+            return
+
+        # We read and parse the body once for all the keyboards
+        try:
+            if req.content_length in (0, None):
+                raise ValueError
+
+            post_params = json.loads(req.stream.read().decode("utf-8"))
+            if type(post_params) != dict or "command" not in post_params:
+                raise ValueError
+
+        except ValueError:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": "Invalid JSON"})
+            return
+
+        def run_command(keyboard):
+            """This function runs the command on one keyboard, and returns the status code and parsed response.
+            It returns None if the keyboard has just been plugged in and doesn't have an API yet.
+            """
+
+            keyboard_api = self.keyboard_apis.get(keyboard.serial)
+            if keyboard_api is None:
+                return None
+
+            # Every keyboard gets its own copy of the parameters, as the commands may change them (like adding default arguments)
+            keyboard_resp = falcon.Response()
+            keyboard_api.run_command(getattr(keyboard_api, commands_name), req, keyboard_resp, copy.deepcopy(post_params))
+
+            return int(keyboard_resp.status[:3]), None if keyboard_resp.body is None else json.loads(keyboard_resp.body)
+
+        # We use the keyboards of the manager, which are read with its lock, as keyboards can be added while we run
+        results = {serial: result for serial, result in self.manager.for_each(run_command).items() if result is not None}
+
+        # We use the first error status if the command failed on any keyboard
+        failed_statuses = [status for status, _ in results.values() if status >= 400]
+        resp.status = falcon.HTTP_200 if not failed_statuses else getattr(falcon, "HTTP_" + str(failed_statuses[0]))
+        resp.body = json.dumps({"keyboards": {serial: {"status": status, "response": response} for serial, (status, response) in results.items()}})
+
+
+class Serial_Router(object):
+    """This class is a falcon resource that passes requests with a {serial} field in the route to the resource of the keyboard with that serial number."""
+
+    def __init__(self, resources: dict):
+        """This method creates the router, resources is a dict of serial number to the falcon resource of that keyboard."""
+        self.resources = resources
+
+    def on_get(self, req, resp, serial: str):
+        """This method passes a get request to the resource of the keyboard."""
+        self._route(serial).on_get(req, resp)
+
+    def on_post(self, req, resp, serial: str):
+        """This method passes a post request to the resource of the keyboard."""
+        self._route(serial).on_post(req, resp)
+
+    def _route(self, serial: str):
+        """This method returns the resource of the keyboard with the serial number, or a resource that responds with 404 if there is none."""
+
+        if serial in self.resources:
+            return self.resources[serial]
+
+        return Serial_Router._Not_Found()
+
+    class _Not_Found(object):
+        """This class is a resource that responds to everything with 404."""
+
+        def on_get(self, req, resp):
+            resp.status = falcon.HTTP_404
+            resp.body = json.dumps({"message": "No keyboard with that serial number"})
+
+        on_post = on_get
@@ -0,0 +1,291 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import bisect
+import collections
+import threading
+import time
+
+import falcon
+
+import tracing
+
+# The upper bounds (in seconds) of the buckets of the time histograms, from a microsecond for lock waits to seconds for slow requests
+TIME_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# The upper bounds of the buckets of the size histograms, like the number of commands in a write
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+
+def format_labels(labels: dict):
+    """This function returns labels in the Prometheus text format, like {serial="ABC",lock="cmd"}, or an empty string if there are none."""
+
+    if not labels:
+        return ""
+
+    return "{" + ",".join('{0:s}="{1:s}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                          for name, value in labels.items()) + "}"
+
+
+class Counter(object):
+    """This class is a metric that only goes up, like the number of requests."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: dict):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        """This method adds amount to the counter."""
+
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        """This method returns the lines of the metric in the Prometheus text format."""
+        return ["{0:s}{1:s} {2!r}".format(self.name, format_labels(self.labels), self.value)]
+
+
+class Histogram(object):
+    """This class is a metric that counts values in buckets, like the time requests take. Observing a value is a bisect and two additions."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: dict, buckets: tuple = TIME_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = threading.Lock()
+
+        # The number of values in every bucket (not cumulative, the last one is for the values above the last bound), and the sum of all values
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """This method adds a value to the histogram."""
+
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self):
+        """This method returns the lines of the metric in the Prometheus text format, the buckets are cumulative like Prometheus wants them."""
+
+        with self.lock:
+            counts = list(self.counts)
+            value_sum = self.sum
+
+        lines = []
+        total = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            total += count
+            lines.append("{0:s}_bucket{1:s} {2:d}".format(self.name, format_labels(dict(self.labels, le=str(bound))), total))
+        lines.append("{0:s}_sum{1:s} {2!r}".format(self.name, format_labels(self.labels), value_sum))
+        lines.append("{0:s}_count{1:s} {2:d}".format(self.name, format_labels(self.labels), total))
+
+        return lines
+
+
+class Function_Metric(object):
+    """This class is a metric whose value is read from a function when the metrics are collected, so it costs nothing until then.
+    It's used for values that are already counted somewhere, like the length of a queue.
+    """
+
+    def __init__(self, name: str, help_text: str, labels: dict, function, metric_type: str):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.function = function
+        self.metric_type = metric_type
+
+    def samples(self):
+        """This method returns the lines of the metric in the Prometheus text format."""
+        return ["{0:s}{1:s} {2!r}".format(self.name, format_labels(self.labels), float(self.function()))]
+
+
+class Metrics_Registry(object):
+    """This class holds the metrics of something (like a keyboard), every metric gets the labels of the registry, like the serial number of the keyboard.
+    Asking for a metric that already exists returns the existing one, so code can ask for its metrics where it uses them.
+    """
+
+    def __init__(self, labels: dict = None):
+        """This method creates an empty registry, labels are added to all of its metrics."""
+
+        self.labels = collections.OrderedDict(labels or {})
+
+        # The lock and ordered dict of (name, labels) to metric
+        self.lock = threading.Lock()
+        self.metrics = collections.OrderedDict()
+
+    def counter(self, name: str, help_text: str, labels: dict = None):
+        """This method returns the counter with the name and labels, it's created if it doesn't exist."""
+        return self._get_metric(name, labels, lambda all_labels: Counter(name, help_text, all_labels))
+
+    def histogram(self, name: str, help_text: str, labels: dict = None, buckets: tuple = TIME_BUCKETS):
+        """This method returns the histogram with the name and labels, it's created if it doesn't exist."""
+        return self._get_metric(name, labels, lambda all_labels: Histogram(name, help_text, all_labels, buckets))
+
+    def function(self, name: str, help_text: str, function, metric_type: str = "gauge", labels: dict = None):
+        """This method adds a metric whose value is function(), metric_type is "gauge" or "counter"."""
+        return self._get_metric(name, labels, lambda all_labels: Function_Metric(name, help_text, all_labels, function, metric_type))
+
+    def get_metrics(self):
+        """This method returns the list of metrics, in the order they were created."""
+
+        with self.lock:
+            return list(self.metrics.values())
+
+    def _get_metric(self, name: str, labels: dict, create):
+        """This method returns the metric with the name and labels, or adds the one that create(all labels) returns."""
+
+        key = (name, tuple(labels.items()) if labels else ())
+        metric = self.metrics.get(key)
+        if metric is not None:
+            return metric
+
+        with self.lock:
+            if key not in self.metrics:
+                self.metrics[key] = create(collections.OrderedDict(self.labels, **(labels or {})))
+
+            return self.metrics[key]
+
+
+def render_metrics(registries: list):
+    """This function returns the metrics of the registries in the Prometheus text format.
+    Metrics with the same name (like the same metric of two keyboards) are written together, with one HELP and TYPE line.
+    """
+
+    families = collections.OrderedDict()
+    for registry in registries:
+        for metric in registry.get_metrics():
+            if metric.name not in families:
+                families[metric.name] = ["# HELP {0:s} {1:s}".format(metric.name, metric.help_text),
+                                         "# TYPE {0:s} {1:s}".format(metric.name, metric.metric_type)]
+            families[metric.name].extend(metric.samples())
+
+    return "".join(line + "\n" for lines in families.values() for line in lines)
+
+
+class Timed_Lock(object):
+    """This class is a lock that measures how long it's waited for and how long it's held, it can be used like threading.Lock and by threading.Condition.
+    Only every sample_interval'th acquisition is measured, so a busy lock costs little more than a plain one.
+    The thread of a traced request (see tracing.py) also adds a span for every time it waits for the lock.
+    """
+
+    def __init__(self, wait_histogram: Histogram, hold_histogram: Histogram, sample_interval: int = 16, name: str = None):
+        """This method creates an unlocked lock that observes its wait times in wait_histogram and its hold times in hold_histogram."""
+
+        self.lock = threading.Lock()
+        self.wait_histogram = wait_histogram
+        self.hold_histogram = hold_histogram
+        self.sample_interval = sample_interval
+        self.name = name
+
+        # The number of acquisitions, and the time the lock was acquired if this acquisition is measured (else None)
+        # Only the thread that holds the lock uses the acquire time, the count may miss an acquisition now and then, which only moves the samples
+        self.acquire_count = 0
+        self.acquire_time = None
+
+    def acquire(self, blocking: bool = True, timeout: float = -1):
+        """This method acquires the lock, like threading.Lock.acquire."""
+
+        self.acquire_count += 1
+        sampled = not self.acquire_count % self.sample_interval
+        trace = tracing.current_trace()
+
+        if not sampled and trace is None:
+            if not self.lock.acquire(blocking, timeout):
+                return False
+
+            self.acquire_time = None
+            return True
+
+        start_time = time.perf_counter()
+        if not self.lock.acquire(blocking, timeout):
+            return False
+        acquire_time = time.perf_counter()
+
+        if trace is not None:
+            trace.add_span("lock_wait", start_time, acquire_time, {"lock": self.name})
+
+        if sampled:
+            self.wait_histogram.observe(acquire_time - start_time)
+            self.acquire_time = acquire_time
+        else:
+            self.acquire_time = None
+
+        return True
+
+    def release(self, *args):
+        """This method releases the lock, the hold time is observed after the lock is released so it doesn't make the lock held longer.
+        It's also the __exit__ of the lock, so it takes (and ignores) the exception arguments.
+        """
+
+        acquire_time = self.acquire_time
+        if acquire_time is None:
+            self.lock.release()
+            return
+
+        hold_time = time.perf_counter() - acquire_time
+        self.lock.release()
+        self.hold_histogram.observe(hold_time)
+
+    def locked(self):
+        """This method returns True if the lock is held."""
+        return self.lock.locked()
+
+    def _is_owned(self):
+        """This method is used by threading.Condition, it checks if the lock is held without measuring it, like Condition does for a plain lock."""
+
+        if self.lock.acquire(False):
+            self.lock.release()
+            return False
+
+        return True
+
+    # A with statement calls acquire and release directly, since an extra call for every use of a busy lock is noticeable
+    __enter__ = acquire
+    __exit__ = release
+
+
+class Metrics_Api(object):
+    """This class is a falcon resource that serves metrics in the Prometheus text format, add it as /metrics."""
+
+    def __init__(self, get_registries):
+        """This method creates the resource, get_registries() returns the list of registries to serve (like the registries of all open keyboards)."""
+        self.get_registries = get_registries
+
+    def on_get(self, req, resp):
+        """This method returns the metrics."""
+
+        resp.status = falcon.HTTP_200
+        resp.content_type = "text/plain; version=0.0.4; charset=utf-8"
+        resp.body = render_metrics(self.get_registries())
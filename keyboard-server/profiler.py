@@ -0,0 +1,161 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+import falcon
+
+# The functions that threads wait in when they're idle, as (file name, function name), samples of idle threads are left out of profiles
+IDLE_FUNCTIONS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+    ("queue.py", "get"),
+    ("socket.py", "readinto"),
+    ("socket.py", "accept"),
+    ("thread.py", "_worker"),
+}
+
+
+class Sampling_Profiler(object):
+    """This class profiles the running process by sampling the stacks of all threads at a fixed interval, it needs no setup and slows nothing down.
+    Blocking calls in C (like select or a read) don't show up in Python stacks, so the samples of a thread that waits in one count as time in the function that called it.
+    """
+
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        """This method creates the profiler, interval is the number of seconds between samples.
+        If include_idle is False the samples of threads that wait in one of IDLE_FUNCTIONS are left out.
+        """
+
+        self.interval = interval
+        self.include_idle = include_idle
+
+    def profile(self, duration: float):
+        """This method samples for duration seconds, and returns a dict with the sampled stacks in the folded format of flame graphs,
+        like "thread name;outer function (file:line);inner function (file:line)" to the number of samples, and the number of samples and CPU time.
+        """
+
+        stacks = collections.Counter()
+        sample_count = 0
+        profiler_thread_id = threading.get_ident()
+
+        # We remember the labels of the code objects, since the same functions are sampled over and over
+        labels = {}
+
+        start_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        next_sample_time = start_time
+
+        while time.perf_counter() - start_time < duration:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == profiler_thread_id:
+                    continue
+
+                code = frame.f_code
+                if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FUNCTIONS:
+                    continue
+
+                # We walk the stack from the innermost frame out, and label every function once
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = "{0:s} ({1:s}:{2:d})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+                    stack.append(label)
+                    frame = frame.f_back
+
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(stack))] += 1
+
+            sample_count += 1
+
+            # We sleep until the next sample, and skip the samples we're too late for
+            next_sample_time += self.interval
+            delay = next_sample_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample_time = time.perf_counter()
+
+        return {
+            "duration": time.perf_counter() - start_time,
+            "interval": self.interval,
+            "samples": sample_count,
+            "cpu_seconds": time.process_time() - start_cpu_time,
+            "stacks": dict(stacks.most_common()),
+        }
+
+
+class Profiler_Api(object):
+    """This class is a falcon resource that profiles the server on demand, add it as /debug/profile.
+    GET /debug/profile?seconds=10 samples the server for 10 seconds and returns the stacks in the folded format of flame graphs
+    (one "stack count" line per stack, for flamegraph.pl or https://www.speedscope.app), or as JSON with ?format=json.
+    ?interval is the number of milliseconds between samples (default 5), and ?idle=true keeps the samples of idle threads.
+    Only one profile runs at a time, and it uses a request thread until it's done.
+    """
+
+    # The longest profile that can be asked for, in seconds
+    max_duration = 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def on_get(self, req, resp):
+        """This method profiles the server, and returns the profile."""
+
+        try:
+            duration = float(req.get_param("seconds") or 5)
+            interval = float(req.get_param("interval") or 5) / 1000
+            if not 0 < duration <= self.max_duration or not 0.001 <= interval <= 1:
+                raise ValueError
+        except ValueError:
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({"message": "seconds must be between 0 and {0:d}, and interval between 1 and 1000 ms".format(self.max_duration)})
+            return
+
+        if not self.lock.acquire(blocking=False):
+            resp.status = falcon.HTTP_409
+            resp.body = json.dumps({"message": "A profile is already running"})
+            return
+
+        try:
+            profile = Sampling_Profiler(interval, include_idle=req.get_param_as_bool("idle") or False).profile(duration)
+        finally:
+            self.lock.release()
+
+        resp.status = falcon.HTTP_200
+        if req.get_param("format") == "json":
+            resp.body = json.dumps(profile)
+        else:
+            resp.content_type = "text/plain; charset=utf-8"
+            resp.body = "".join("{0:s} {1:d}\n".format(stack, count) for stack, count in profile["stacks"].items())
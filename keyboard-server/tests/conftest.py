@@ -0,0 +1,85 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+# The modules of the server aren't a package, so we import them like __init__.py does
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIRECTORY)
+
+from ckb_daemon_emulator import Ckb_Daemon_Emulator
+from keyboard import Keyboard
+
+
+def wait_until(condition, timeout: float = 2):
+    """This function waits until condition() is true, and returns if it became true before timeout seconds had passed."""
+
+    end_time = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > end_time:
+            return False
+        time.sleep(0.005)
+
+    return True
+
+
+@pytest.fixture(autouse=True)
+def server_directory(monkeypatch):
+    """This fixture runs every test in the directory of the server, as keyboard_server_config.json is read from the working directory."""
+    monkeypatch.chdir(SERVER_DIRECTORY)
+
+
+@pytest.fixture
+def commands():
+    """This fixture is the list of the command lines that the emulated devices read, in order."""
+    return []
+
+
+@pytest.fixture
+def emulator(commands):
+    """This fixture is a Ckb_Daemon_Emulator with one keyboard, that adds every command it reads to commands."""
+
+    with Ckb_Daemon_Emulator(on_command=lambda device, line, timestamp: commands.append(line)) as emulator:
+        yield emulator
+
+
+@pytest.fixture
+def open_keyboard(emulator):
+    """This fixture is a function that opens a Keyboard on the emulator with the options it's given, the keyboards are closed after the test."""
+
+    keyboards = []
+
+    def open_keyboard(**options):
+        keyboard = Keyboard(device_prefix=emulator.prefix, **options).__enter__()
+        keyboards.append(keyboard)
+        return keyboard
+
+    yield open_keyboard
+
+    for keyboard in keyboards:
+        keyboard.__exit__()
@@ -0,0 +1,165 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+
+import falcon
+import falcon.testing
+import pytest
+
+from conftest import wait_until
+from effects import Effect_Engine
+from event_stream import Keyboard_Event_Stream_Api, Stream_Limit
+from keyboard import Keyboard_Falcon_Api
+
+
+@pytest.fixture
+def keyboard_api(open_keyboard):
+    """This fixture is the API of a keyboard on the emulator, with the effect commands."""
+
+    keyboard = open_keyboard()
+    keyboard_api = Keyboard_Falcon_Api(keyboard, enter_keyboard=False)
+    effect_engine = Effect_Engine(keyboard)
+    effect_engine.add_api_commands(keyboard_api)
+
+    yield keyboard_api
+
+    effect_engine.close()
+
+
+def create_request(headers: dict, body: str = ""):
+    """This function creates a falcon request like the server does.
+    The resources are called directly, as falcon's test client checks that request bodies are read with a size, which the server doesn't need.
+    """
+
+    return falcon.Request(falcon.testing.create_environ(headers=headers, body=body))
+
+
+def send_command(keyboard_api, method: str, command: str, arguments: dict, headers: dict = None):
+    """This function sends a command to the API, and returns the status code and the response."""
+
+    req = create_request(dict({"Accept": "application/json", "Content-Type": "application/json"}, **(headers or {})),
+                         json.dumps({"command": command, "arguments": arguments}))
+    resp = falcon.Response()
+    getattr(keyboard_api, "on_" + method.lower())(req, resp)
+
+    return int(resp.status[:3]), resp
+
+
+def test_get_multiple_key_rgb_etag(keyboard_api):
+    status, resp = send_command(keyboard_api, "GET", "get_multiple_key_rgb", {"keys": ["w"], "color_format": "hex"})
+    assert status == 200
+    etag = resp.get_header("ETag")
+
+    status, resp = send_command(keyboard_api, "GET", "get_multiple_key_rgb", {"keys": ["w"], "color_format": "hex"}, {"If-None-Match": etag})
+    assert status == 304
+    assert not resp.body
+
+    # A changed color changes the ETag
+    assert send_command(keyboard_api, "POST", "set_rgb_single", {"key": "w", "color": "ff0000"})[0] == 200
+    status, resp = send_command(keyboard_api, "GET", "get_multiple_key_rgb", {"keys": ["w"], "color_format": "hex"}, {"If-None-Match": etag})
+    assert status == 200
+    assert json.loads(resp.body) == {"keys": {"w": "ff0000"}}
+    assert resp.get_header("ETag") != etag
+
+
+@pytest.mark.parametrize("duration", [-1, 1e12, "Infinity", "NaN", "100", None])
+def test_invalid_fade_duration(keyboard_api, duration):
+    # json.dumps writes float("inf") as Infinity, which the server's json.loads accepts
+    duration = {"Infinity": float("inf"), "NaN": float("nan")}.get(duration, duration)
+
+    assert send_command(keyboard_api, "POST", "fade_rgb", {"keys_and_colors": [["w", "ff0000"]], "duration": duration})[0] == 400
+
+
+def test_valid_fade(keyboard_api):
+    assert send_command(keyboard_api, "POST", "fade_rgb", {"keys_and_colors": [["w", "ff0000"]], "duration": 0})[0] == 200
+    assert send_command(keyboard_api, "POST", "fade_rgb", {"keys_and_colors": [["w", "00ff00"]], "duration": 50})[0] == 200
+
+
+@pytest.mark.parametrize("arguments", [
+    {"effect": "wave", "parameters": {"speed": float("inf")}},
+    {"effect": "wave", "parameters": {"speed": 1e300}},
+    {"effect": "wave", "parameters": {"speed": -1}},
+    {"effect": "wave", "parameters": {"direction": []}},
+    {"effect": "wave", "parameters": {"direction": "up_and_away"}},
+    {"effect": "gradient_sweep", "parameters": {"width": float("nan")}},
+    {"effect": 5},
+    {"effect": "not_an_effect"},
+    {"effect": "wave", "keys": "w"},
+])
+def test_invalid_effect_parameters(keyboard_api, arguments):
+    assert send_command(keyboard_api, "POST", "start_effect", arguments)[0] == 400
+
+
+def test_start_effect(keyboard_api):
+    status, resp = send_command(keyboard_api, "POST", "start_effect", {"effect": "wave", "parameters": {"speed": 2}})
+    assert status == 200
+
+    effect_id = json.loads(resp.body)["effect_id"]
+    assert send_command(keyboard_api, "POST", "stop_effect", {"effect_id": effect_id})[0] == 200
+
+
+def open_stream(event_api, headers: dict = None):
+    """This function requests an event stream from event_api, and returns the response."""
+
+    req = create_request(dict({"Accept": "text/event-stream"}, **(headers or {})))
+    resp = falcon.Response()
+    event_api.on_get(req, resp)
+
+    return resp
+
+
+def test_event_stream_replays_missed_events(emulator, open_keyboard):
+    keyboard = open_keyboard()
+    device = emulator.get_devices()[0]
+    stream_limit = Stream_Limit(2)
+    event_api = Keyboard_Event_Stream_Api(keyboard, stream_limit, keep_alive_interval=0.05)
+
+    # The first stream enables the notifications, so the key events reach the history
+    first_response = open_stream(event_api)
+    assert wait_until(lambda: {"w", "a"} <= set(device.notify_keys.get(keyboard.notify_node_nr, ())))
+
+    device.press_key("w")
+    device.press_key("a")
+    assert wait_until(lambda: len(event_api.history) == 2)
+    first_event_id = event_api.id_prefix + str(event_api.history[0][0])
+
+    # A reconnecting client only gets the events after the last one it got
+    second_response = open_stream(event_api, {"Last-Event-ID": first_event_id})
+    chunks = iter(second_response.stream)
+    assert next(chunks) == b"retry: 1000\n\n"
+
+    events = next(chunks).decode("utf-8")
+    assert "event: key" in events
+    assert '"key": "a"' in events
+    assert '"key": "w"' not in events
+    assert "id: " + event_api.id_prefix + str(event_api.history[1][0]) in events
+
+    # Closing the bodies, even one that was never sent, gives back the slots and the notifications
+    first_response.stream.close()
+    second_response.stream.close()
+    assert stream_limit.open_streams == 0
+    assert not keyboard.notification_users
+
+    event_api.close()
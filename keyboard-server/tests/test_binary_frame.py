@@ -0,0 +1,72 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import pytest
+
+from binary_frame import FRAME_FLAG_KEY_MASK, FRAME_FLAG_PADDING, FRAME_HEADER_SIZE, decode_frame, encode_frame
+
+KEYCODES = ["key" + str(slot) for slot in range(24)]
+
+
+def test_frame_without_header():
+    frame = encode_frame(KEYCODES, {"key1": (1, 2, 3)}, background=(0, 0, 255))
+
+    colors, slots = decode_frame(frame, len(KEYCODES))
+    assert slots is None
+    assert bytes(colors[3:6]) == b"\x01\x02\x03"
+    assert bytes(colors[6:9]) == b"\x00\x00\xff"
+
+
+def test_frame_with_key_mask():
+    frame = encode_frame(KEYCODES, {"key0": (1, 2, 3), "key9": (4, 5, 6)})
+    assert frame[FRAME_HEADER_SIZE - 1] == FRAME_FLAG_KEY_MASK
+
+    colors, slots = decode_frame(frame, len(KEYCODES))
+    assert slots == [0, 9]
+    assert bytes(colors) == b"\x01\x02\x03\x04\x05\x06"
+
+
+def test_frame_that_looks_like_a_frame_without_header_is_padded():
+    # A header, a 3 byte mask, and 21 colors are exactly 3 bytes per key, so the frame needs the padding byte
+    key_colors = {key: (slot, slot, slot) for slot, key in enumerate(KEYCODES[:21])}
+    frame = encode_frame(KEYCODES, key_colors)
+    assert frame[FRAME_HEADER_SIZE - 1] == FRAME_FLAG_KEY_MASK | FRAME_FLAG_PADDING
+    assert len(frame) == 3 * len(KEYCODES) + 1
+
+    colors, slots = decode_frame(frame, len(KEYCODES))
+    assert slots == list(range(21))
+    assert bytes(colors) == b"".join([bytes((slot, slot, slot)) for slot in range(21)])
+
+
+@pytest.mark.parametrize("frame", [
+    b"",
+    b"\x00" * 10,
+    b"CKBF\x02\x00",
+    b"CKBF\x01\x01\xff",
+    b"CKBF\x01\x03\x01\x00\x00",
+    b"CKBF\x01\x01\x01\x00\x00\x01\x02",
+])
+def test_invalid_frames(frame):
+    with pytest.raises(ValueError):
+        decode_frame(frame, len(KEYCODES))
@@ -0,0 +1,56 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+from conftest import wait_until
+from hotplug import Hotplug_Watcher
+from keyboard_manager import Keyboard_Manager
+
+
+def test_unplugged_keyboard_is_reattached(emulator):
+    device = emulator.get_devices()[0]
+
+    with Keyboard_Manager(device_prefix=emulator.prefix) as manager:
+        keyboard = manager.get_keyboard(device.serial)
+        keyboard.set_key_color("w", (255, 0, 0))
+        assert wait_until(lambda: device.get_colors()["w"] == "ff0000")
+
+        attached = []
+        watcher = Hotplug_Watcher(manager, poll_interval=0.1, on_attach=lambda serial, keyboard: attached.append(serial))
+        watcher.start()
+
+        try:
+            emulator.remove_device(device)
+            assert wait_until(lambda: not keyboard.device_connected)
+
+            # Colors set while the keyboard is unplugged are kept, and sent when it's plugged back in
+            keyboard.set_key_color("a", (0, 255, 0))
+
+            new_device = emulator.add_device(serial=device.serial)
+            assert wait_until(lambda: attached == [device.serial])
+            assert keyboard.device_connected
+
+            assert wait_until(lambda: new_device.get_colors()["w"] == "ff0000" and new_device.get_colors()["a"] == "00ff00")
+
+        finally:
+            watcher.stop()
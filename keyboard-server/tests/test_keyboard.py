@@ -0,0 +1,98 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import math
+
+from conftest import wait_until
+
+
+def test_commands_are_batched(emulator, open_keyboard):
+    keyboard = open_keyboard(cmd_flush_interval=0.05)
+    device = emulator.get_devices()[0]
+    commands_before = device.get_stats()["commands"]
+
+    command_numbers = [keyboard.execute_command("rgb w:{0:06x}".format(i), wait=False) for i in range(100)]
+    keyboard._wait_for_command(command_numbers[-1])
+
+    # The commands are written in far fewer writes than there are commands, and all of them arrive in order
+    assert keyboard.cmd_write_count < 50
+    assert wait_until(lambda: device.get_stats()["commands"] - commands_before == 100)
+    assert device.get_colors()["w"] == "{0:06x}".format(99)
+
+
+def test_frame_scheduler_keeps_the_last_color(emulator, open_keyboard, commands):
+    keyboard = open_keyboard(frame_scheduler=True)
+    device = emulator.get_devices()[0]
+    keyboard.cmd_set_fps(1)
+
+    keyboard.set_key_color("w", (255, 0, 0))
+    keyboard.set_key_color("w", (0, 255, 0))
+    keyboard.set_key_color("w", (0, 0, 255))
+
+    assert wait_until(lambda: device.get_colors()["w"] == "0000ff")
+    assert not any("00ff00" in line for line in commands if line.startswith("rgb"))
+    assert keyboard.get_frame_scheduler_stats()["color_writes"] == 3
+
+
+def test_frame_scheduler_treats_all_as_a_background(emulator, open_keyboard, commands):
+    keyboard = open_keyboard(frame_scheduler=True)
+    device = emulator.get_devices()[0]
+    keyboard.cmd_set_fps(1)
+
+    keyboard.set_multiple_colors([("all", (255, 0, 0))])
+    keyboard.set_multiple_colors([("w", (0, 255, 0))])
+    keyboard.set_multiple_colors([("all", (255, 0, 0))])
+
+    assert wait_until(lambda: "rgb ff0000" in commands)
+    assert set(device.get_colors().values()) == {"ff0000"}
+
+
+def test_diff_rendering_sends_nothing_when_unchanged(emulator, open_keyboard):
+    keyboard = open_keyboard(diff_rendering=True)
+    device = emulator.get_devices()[0]
+
+    keyboard.set_key_color("w", (255, 0, 0))
+    assert wait_until(lambda: device.get_colors()["w"] == "ff0000")
+    rgb_commands = device.get_stats()["rgb_commands"]
+
+    # Setting the same colors again, also as a whole frame, doesn't send anything
+    keyboard.set_key_color("w", (255, 0, 0))
+    keyboard.set_frame(bytes(keyboard.key_colors.buffer))
+    keyboard.execute_command("fps 30")
+
+    assert wait_until(lambda: device.get_stats()["fps"] == 30)
+    assert device.get_stats()["rgb_commands"] == rgb_commands
+
+    # Keys that aren't in the layout are invalid
+    assert not keyboard.set_key_color("not_a_key", (255, 0, 0))
+
+
+def test_fade_duration_is_validated(open_keyboard):
+    keyboard = open_keyboard()
+
+    for duration in (-1, math.inf, math.nan, 1e12):
+        assert not keyboard.fade_colors([("w", (255, 0, 0))], duration)
+
+    assert keyboard.fade_colors([("w", (255, 0, 0))], 0)
+    assert keyboard.fade_colors([("w", (0, 255, 0))], 0.05)
@@ -0,0 +1,382 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import concurrent.futures
+import selectors
+import socket
+import threading
+import time
+from wsgiref import simple_server
+
+
+class Bounded_Input(object):
+    """This class wraps the input stream of a request so the application can't read past the request body.
+    That's needed for keep-alive, as the next request is read from the same stream.
+    """
+
+    def __init__(self, stream, length: int):
+        """This method creates a wrapper that allows length bytes to be read from stream."""
+
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size: int = -1):
+        """This method reads at most size bytes (or the rest of the body if size is negative)."""
+
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size: int = -1):
+        """This method reads a line from the body."""
+
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.stream.readline(size)
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint: int = -1):
+        """This method reads all the lines of the body."""
+        return list(iter(self.readline, b""))
+
+    def __iter__(self):
+        """This method iterates over the lines of the body."""
+        return iter(self.readline, b"")
+
+    def discard_rest(self):
+        """This method reads and throws away the part of the body the application didn't read."""
+
+        while self.remaining > 0 and self.read(65536):
+            pass
+
+
+class Keep_Alive_Server_Handler(simple_server.ServerHandler):
+    """This class is the wsgiref handler for one request, it answers with HTTP/1.1 so the connection can be kept alive."""
+
+    http_version = "1.1"
+
+    def cleanup_headers(self):
+        """This method adds the Content-Length if it can, and a "Connection: close" header if the connection won't be kept alive."""
+
+        super().cleanup_headers()
+
+        # A response without a Content-Length ends when the connection is closed, so we have to close it
+        request_handler = self.request_handler
+        if "Content-Length" not in self.headers or request_handler.close_connection or request_handler.server.shutting_down:
+            request_handler.close_connection = True
+            self.headers["Connection"] = "close"
+
+    def handle_error(self):
+        """This method sends an error response (if nothing has been sent yet), the connection is closed as the response might be incomplete."""
+
+        self.request_handler.close_connection = True
+        super().handle_error()
+
+
+class Keep_Alive_WSGI_Request_Handler(simple_server.WSGIRequestHandler):
+    """This class handles a connection to the server, it handles requests on it until the client or the server closes it.
+    A connection is only kept alive if the response had a Content-Length, streamed responses close it.
+    Unlike other request handlers, creating it doesn't handle the connection, Thread_Pool_WSGI_Server calls handle every time a request arrives.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    # wsgiref writes the headers and the body of a response separately, with Nagle's algorithm the body of a response on a kept alive connection
+    # waits for the client to acknowledge the headers, which it delays by up to 40 ms, so we send everything right away
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        """This method sets the socket timeout, it's both the time a request may take to arrive and the time an idle connection is kept open."""
+
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def __init__(self, request, client_address, server):
+        """This method sets up the handler for a connection, without handling any requests on it."""
+
+        self.request = request
+        self.client_address = client_address
+        self.server = server
+        self.setup()
+
+    def handle(self):
+        """This method handles the requests that have arrived on the connection.
+        It returns True if the connection is kept alive and is waiting for its next request, and False if it should be closed.
+        """
+
+        while True:
+            self.close_connection = True
+            self.handle_one_request()
+
+            if self.close_connection or self.server.shutting_down:
+                return False
+
+            # The client may have sent the next request already, and we may have read it into our buffer, where the server can't see it arrive
+            if not self.has_buffered_data():
+                return True
+
+    def has_buffered_data(self):
+        """This method returns True if there is data to read from the connection, without waiting for it."""
+
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def handle_one_request(self):
+        """This method handles a single HTTP request, it's like WSGIRequestHandler.handle but it doesn't assume the connection is closed after it."""
+
+        # The connection is idle while we wait for the request line, so the server may close it when it shuts down
+        self.server.set_connection_idle(self.connection, True)
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (socket.timeout, ConnectionError):
+            # The client was too slow or is gone, so we close the connection
+            self.close_connection = True
+            return
+        finally:
+            self.server.set_connection_idle(self.connection, False)
+
+        # We close the connection if the client has closed it
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            self.close_connection = True
+            return
+
+        # parse_request decides if the connection can be kept alive from the HTTP version and the Connection header
+        if not self.parse_request():
+            # An error code has been sent, just exit
+            return
+
+        # We don't support chunked request bodies, so a request without a Content-Length has no body
+        environ = self.get_environ()
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            self.close_connection = True
+        request_body = Bounded_Input(self.rfile, int(environ.get("CONTENT_LENGTH") or 0))
+
+        # The handler uses the request body as wsgi.input
+        handler = Keep_Alive_Server_Handler(request_body, self.wfile, self.get_stderr(), environ, multithread=True)
+        handler.request_handler = self  # backpointer for logging
+        handler.run(self.server.get_app())
+
+        # We throw away the part of the request body the application didn't read, so the next request can be read
+        try:
+            request_body.discard_rest()
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+
+
+class Thread_Pool_WSGI_Server(simple_server.WSGIServer):
+    """This class is a WSGI server that handles requests concurrently on a fixed size thread pool.
+    Connections are kept alive between requests, and both requests and idle connections time out after request_timeout seconds.
+    A pool thread is only used while a request is handled, idle connections wait for their next request in a selector on one thread of their own,
+    so idle clients can't keep the pool busy.
+    Use shutdown_gracefully (from another thread than the one running serve_forever) to stop it after the requests that are being handled are done.
+    """
+
+    # We reuse the address so a restarted server doesn't have to wait for the old sockets to time out
+    allow_reuse_address = True
+
+    # The number of connections that may wait to be accepted
+    request_queue_size = 128
+
+    def __init__(self, server_address: tuple, app, threads: int = 16, request_timeout: float = 10):
+        """This method creates a server that listens on server_address and serves app with threads threads."""
+
+        super().__init__(server_address, Keep_Alive_WSGI_Request_Handler)
+        self.set_app(app)
+
+        # We save the timeout, and create the thread pool
+        self.request_timeout = request_timeout
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
+        # A variable that tells the connections to close after their current request
+        self.shutting_down = False
+
+        # The lock and set of idle connections (connections that are waiting for their next request), so they can be closed when we shut down
+        self.connection_lock = threading.Lock()
+        self.idle_connections = set()
+
+        # The handlers of the connections that have been kept alive and should be added to the selector of the idle connection thread,
+        # and the socket pair that wakes that thread up
+        self.parked_handlers = []
+        self.wake_reader, self.wake_writer = socket.socketpair()
+
+        # We start the thread that waits for the next request of the kept alive connections
+        self.idle_thread = threading.Thread(target=self._idle_connection_thread, daemon=True)
+        self.idle_thread.start()
+
+    def set_connection_idle(self, connection, idle: bool):
+        """This method marks a connection as idle or not, idle connections are closed right away when the server shuts down."""
+
+        with self.connection_lock:
+            if not idle:
+                self.idle_connections.discard(connection)
+            elif self.shutting_down:
+                # We're shutting down, so the connection shouldn't wait for another request
+                try:
+                    connection.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+            else:
+                self.idle_connections.add(connection)
+
+    def process_request(self, request, client_address):
+        """This method is called by serve_forever for every new connection, it hands the connection to the thread pool."""
+        self.pool.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        """This method sets up a new connection and handles its first requests in a pool thread."""
+
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            return
+
+        self._handle_connection(handler)
+
+    def _handle_connection(self, handler):
+        """This method handles the requests that have arrived on a connection in a pool thread, and then keeps the connection alive or closes it."""
+
+        try:
+            if handler.handle():
+                self._park_connection(handler)
+                return
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+
+        self._close_connection(handler)
+
+    def _park_connection(self, handler):
+        """This method hands a kept alive connection to the idle connection thread, which gives it back to the pool when its next request arrives."""
+
+        with self.connection_lock:
+            if not self.shutting_down:
+                self.parked_handlers.append(handler)
+                self.wake_writer.send(b"\0")
+                return
+
+        # We're shutting down, so the connection shouldn't wait for another request
+        self._close_connection(handler)
+
+    def _close_connection(self, handler):
+        """This method flushes and closes a connection."""
+
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(handler.request)
+
+    def _idle_connection_thread(self):
+        """This method waits for the next requests of the kept alive connections, and hands every connection that gets one to the pool.
+        It closes connections that have been idle for request_timeout seconds, and all of them when the server shuts down.
+        """
+
+        selector = selectors.DefaultSelector()
+        selector.register(self.wake_reader, selectors.EVENT_READ)
+
+        # The time every idle connection times out, by handler
+        deadlines = {}
+
+        while True:
+            # We add the connections that were parked since the last time, only this thread uses the selector
+            with self.connection_lock:
+                parked_handlers, self.parked_handlers = self.parked_handlers, []
+                shutting_down = self.shutting_down
+
+            for handler in parked_handlers:
+                selector.register(handler.connection, selectors.EVENT_READ, handler)
+                deadlines[handler] = time.monotonic() + self.request_timeout
+
+            if shutting_down:
+                for handler in deadlines:
+                    self._close_connection(handler)
+                selector.close()
+                return
+
+            timeout = max(0.0, min(deadlines.values()) - time.monotonic()) if deadlines else None
+            for key, _ in selector.select(timeout):
+                if key.fileobj is self.wake_reader:
+                    self.wake_reader.recv(4096)
+                    continue
+
+                # The next request has arrived (or the client closed the connection), so a pool thread handles it
+                selector.unregister(key.fileobj)
+                del deadlines[key.data]
+                self.pool.submit(self._handle_connection, key.data)
+
+            # We close the connections that have been idle for too long
+            now = time.monotonic()
+            for handler in [handler for handler, deadline in deadlines.items() if deadline <= now]:
+                selector.unregister(handler.connection)
+                del deadlines[handler]
+                self._close_connection(handler)
+
+    def shutdown_gracefully(self):
+        """This method stops accepting connections, lets the requests that are being handled finish, and closes all connections.
+        It returns when everything is done, it must not be called from the thread that runs serve_forever.
+        """
+
+        # We stop serve_forever
+        self.shutdown()
+        self.server_close()
+
+        # We tell the connections to close after their current request
+        # Idle connections are waiting for a request that may never come, so we stop them from waiting
+        with self.connection_lock:
+            self.shutting_down = True
+
+            for connection in self.idle_connections:
+                try:
+                    connection.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+
+        # We close the kept alive connections, they're waiting in the idle connection thread
+        self.wake_writer.send(b"\0")
+        self.idle_thread.join()
+        self.wake_reader.close()
+        self.wake_writer.close()
+
+        # We wait for the requests that are being handled to finish
+        self.pool.shutdown(wait=True)
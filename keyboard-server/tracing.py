@@ -0,0 +1,207 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+# The tracer that traces are sampled by, it's None until configure is called, so tracing costs nothing unless it's turned on
+tracer = None
+
+# The trace of the request that the current thread is handling, if it's sampled
+_local = threading.local()
+
+
+def configure(path: str, sample_rate: float = 0.01):
+    """This function turns on tracing, sample_rate of the requests are traced and their spans are written to path in the Chrome trace format.
+    It returns the tracer, which should be closed when the server stops.
+    """
+
+    global tracer
+    tracer = Tracer(path, sample_rate)
+    return tracer
+
+
+def current_trace():
+    """This function returns the trace of the request that the current thread is handling, or None if it isn't traced."""
+    return getattr(_local, "trace", None)
+
+
+def span(name: str, **args):
+    """This function returns a context manager that records a span with the name and args in the trace of the current thread.
+    If the current thread isn't tracing it does nothing, so it can be used on hot paths.
+    """
+
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return _NULL_SPAN
+
+    return Span(trace, name, args)
+
+
+class Trace(object):
+    """This class is a sampled trace of a request, the spans of all threads that work on the request are added to it."""
+
+    def __init__(self, tracer, trace_id: int):
+        self.tracer = tracer
+        self.trace_id = trace_id
+
+    def add_span(self, name: str, start_time: float, end_time: float, args: dict = None):
+        """This method adds a span that the current thread spent from start_time to end_time (time.perf_counter() values)."""
+
+        self.tracer.add_event({"name": name, "ph": "X", "ts": start_time * 1e6, "dur": (end_time - start_time) * 1e6,
+                               "pid": self.tracer.pid, "tid": threading.get_ident(), "args": dict(args or {}, trace_id=self.trace_id)})
+
+
+class Span(object):
+    """This class is a context manager that adds a span to a trace for the time its with statement takes."""
+
+    def __init__(self, trace: Trace, name: str, args: dict):
+        self.trace = trace
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.trace.add_span(self.name, self.start_time, time.perf_counter(), self.args)
+
+
+class _Null_Span(object):
+    """This class is the context manager that span returns when the current thread isn't tracing, it does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_NULL_SPAN = _Null_Span()
+
+
+class Tracer(object):
+    """This class samples traces and writes their spans to a file in the Chrome trace format (open it in chrome://tracing or https://ui.perfetto.dev).
+    The spans are written by a background thread every flush_interval seconds, the file can be opened while the server runs.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 0.01, flush_interval: float = 1.0):
+        """This method opens the trace file, sample_rate is the fraction of the requests that are traced."""
+
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self.trace_ids = itertools.count(1)
+
+        # The lock and list of events that haven't been written yet, and the threads that have been named in the file
+        self.lock = threading.Lock()
+        self.events = []
+        self.named_threads = set()
+
+        # A file in the JSON array format may end without the closing bracket, so every event can be written as soon as we have it
+        self.trace_file = open(path, "w")
+        self.trace_file.write("[\n")
+
+        self.exiting = threading.Event()
+        self.flush_thread = threading.Thread(target=self._flush_thread, daemon=True)
+        self.flush_thread.start()
+
+    def trace(self, name: str, **args):
+        """This method starts a trace of the request that the current thread handles if it's sampled, the trace is ended by end_trace.
+        The trace has a span called name for the time until it's ended.
+        """
+
+        if random.random() >= self.sample_rate:
+            return
+
+        _local.trace = Trace(self, next(self.trace_ids))
+        _local.trace_start = (name, args, time.perf_counter())
+
+    def end_trace(self, **args):
+        """This method ends the trace of the current thread (if it has one), args are added to the span of the trace."""
+
+        trace = getattr(_local, "trace", None)
+        if trace is None:
+            return
+
+        name, start_args, start_time = _local.trace_start
+        trace.add_span(name, start_time, time.perf_counter(), dict(start_args, **args))
+        _local.trace = None
+
+    def add_event(self, event: dict):
+        """This method queues an event to be written to the file."""
+
+        with self.lock:
+            self.events.append(event)
+
+    def close(self):
+        """This method writes the events that are left, and ends the file with a closing bracket."""
+
+        self.exiting.set()
+        self.flush_thread.join()
+        self._flush()
+
+        self.trace_file.write(json.dumps({"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "keyboard-server"}}) + "\n]\n")
+        self.trace_file.close()
+
+    def _flush(self):
+        """This method writes the queued events, and the names of the threads they're from."""
+
+        with self.lock:
+            events, self.events = self.events, []
+
+            # We name the threads that we haven't named yet, so the trace viewer shows which thread is the command writer
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id in {event["tid"] for event in events} - self.named_threads:
+                self.named_threads.add(thread_id)
+                events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread_id,
+                               "args": {"name": thread_names.get(thread_id, str(thread_id))}})
+
+        # Only the flush thread writes until it has exited, so we write without the lock
+        if events:
+            self.trace_file.write("".join(json.dumps(event) + ",\n" for event in events))
+            self.trace_file.flush()
+
+    def _flush_thread(self):
+        """This method is the thread that writes the events every flush_interval seconds."""
+
+        while not self.exiting.wait(self.flush_interval):
+            self._flush()
+
+
+class Tracing_Middleware(object):
+    """This class is falcon middleware that samples the requests to trace, every traced request gets a span for its whole time."""
+
+    def process_request(self, req, resp):
+        if tracer is not None:
+            tracer.trace(req.method + " " + req.path)
+
+    def process_response(self, req, resp, resource, req_succeeded=True):
+        if tracer is not None:
+            tracer.end_trace(status=str(resp.status)[:3])
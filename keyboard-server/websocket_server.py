@@ -0,0 +1,207 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import asyncio
+import json
+import threading
+
+import websockets
+
+
+class Keyboard_WebSocket_Server(object):
+    """This class serves a WebSocket API for a keyboard, so a client can stream color updates and key events over one connection.
+    It runs its own event loop on its own thread, next to the HTTP server, and uses the same Keyboard_Falcon_Api and Keyboard objects.
+
+    Every message from the client is a JSON object like the HTTP API POST bodies, {"command": ..., "arguments": {...}}, with these commands:
+    "set_rgb_single" and "set_rgb_multiple" take the same arguments as in the HTTP API, a full frame is a set_rgb_multiple with a background.
+    "subscribe_key_events" takes the optional arguments "keys" (a list of keycodes) and "pressed" (true or false), and starts streaming key events.
+    "unsubscribe_key_events" stops streaming key events.
+    Color updates are only answered if they fail, with {"message": ...}. Key events are sent as {"event": "key", "key": ..., "pressed": ..., "timestamp": ...}.
+
+    Messages from a connection are applied one at a time, and the connection isn't read while one is being applied,
+    so a client that sends faster than the keyboard can keep up is slowed down by TCP instead of filling the server's memory.
+    """
+
+    def __init__(self, keyboard_api, host: str = "", port: int = 42070, path: str = "/keyboard/stream", event_queue_size: int = 256):
+        """This method creates a server for the keyboard of keyboard_api, it starts serving when start is called.
+        event_queue_size is the number of key events that may wait to be sent to a client, the oldest ones are dropped when a client is too slow.
+        """
+
+        self.keyboard_api = keyboard_api
+        self.keyboard = keyboard_api.keyboard
+        self.host = host
+        self.port = port
+        self.path = path
+        self.event_queue_size = event_queue_size
+
+        # The event loop and thread of the server, they're created by start
+        self.loop = None
+        self.thread = None
+        self.stop_event = None
+
+    def start(self):
+        """This method starts the server on a new thread, it returns when the server is listening."""
+
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait()
+
+    def stop(self):
+        """This method stops the server and closes all connections, it returns when the server has stopped."""
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+            self.thread.join()
+
+    def _run(self, started: threading.Event):
+        """This method is the thread target that runs the event loop of the server."""
+
+        async def serve():
+            self.loop = asyncio.get_running_loop()
+            self.stop_event = asyncio.Event()
+
+            async with websockets.serve(self.handle_connection, self.host, self.port, max_size=2 ** 20):
+                started.set()
+                await self.stop_event.wait()
+
+        asyncio.run(serve())
+
+    async def handle_connection(self, websocket):
+        """This method handles a WebSocket connection until it's closed."""
+
+        # We only accept connections to our path
+        if websocket.request.path != self.path:
+            await websocket.close(code=1008, reason="Unknown path")
+            return
+
+        # The queue of key events that should be sent, and the key event subscription if the client has one (a tuple of its id and the keys it enabled notifications of)
+        event_queue = asyncio.Queue(maxsize=self.event_queue_size)
+        subscription = None
+
+        # We send the key events from another task, so they're sent while we're applying colors
+        sender_task = asyncio.ensure_future(self._send_key_events(websocket, event_queue))
+
+        try:
+            async for message in websocket:
+                # We parse the message
+                try:
+                    message = json.loads(message)
+                    command = message["command"]
+                    arguments = message.get("arguments", {})
+                    if type(arguments) != dict:
+                        raise TypeError
+                except (ValueError, KeyError, TypeError):
+                    await websocket.send(json.dumps({"message": "Invalid JSON"}))
+                    continue
+
+                if command == "subscribe_key_events":
+                    keys = arguments.get("keys")
+                    pressed = arguments.get("pressed")
+                    if (keys is not None and (type(keys) != list or not all([type(x) == str for x in keys]))) or pressed not in (None, True, False):
+                        await websocket.send(json.dumps({"message": "Invalid arguments"}))
+                        continue
+
+                    # We replace the old subscription if there is one, the new one is made first so the keys both use stay enabled
+                    old_subscription = subscription
+                    subscription = await self.loop.run_in_executor(None, self._subscribe, event_queue, keys, pressed)
+                    if old_subscription is not None:
+                        await self.loop.run_in_executor(None, self._unsubscribe, old_subscription)
+
+                elif command == "unsubscribe_key_events":
+                    if subscription is not None:
+                        await self.loop.run_in_executor(None, self._unsubscribe, subscription)
+                        subscription = None
+
+                elif command in ("set_rgb_single", "set_rgb_multiple"):
+                    # We apply the colors on another thread, as the keyboard waits for the command to be written
+                    if not await self.loop.run_in_executor(None, self._apply_colors, command, arguments):
+                        await websocket.send(json.dumps({"message": "Invalid arguments"}))
+
+                else:
+                    await websocket.send(json.dumps({"message": "Invalid command"}))
+
+        except websockets.ConnectionClosed:
+            pass
+
+        finally:
+            # We stop streaming key events to this client, without waiting as the connection may be closed because the server is stopping
+            if subscription is not None:
+                self.loop.run_in_executor(None, self._unsubscribe, subscription)
+            sender_task.cancel()
+
+    def _subscribe(self, event_queue: asyncio.Queue, keys: list, pressed: bool):
+        """This method enables notifications of the keys (None means all keys) and subscribes to their key events, it's run on another thread
+        as the keyboard waits for the notify command to be written. It returns the subscription, a tuple of its id and the keys it enabled notifications of.
+        """
+
+        # The daemon only sends key events of the keys that notifications are enabled for
+        key_layout = self.keyboard.get_key_layout()
+        notification_keys = key_layout if keys is None else [key for key in key_layout if key in keys]
+        self.keyboard.enable_notifications(notification_keys)
+
+        subscription_id = self.keyboard.subscribe_key_events(
+            lambda timestamp, key, pressed: self.loop.call_soon_threadsafe(self._queue_key_event, event_queue, timestamp, key, pressed),
+            keys, pressed)
+
+        return subscription_id, notification_keys
+
+    def _unsubscribe(self, subscription: tuple):
+        """This method removes a subscription made by _subscribe and disables the notifications it enabled, if nothing else uses them."""
+
+        subscription_id, notification_keys = subscription
+        self.keyboard.unsubscribe_key_events(subscription_id)
+        self.keyboard.disable_notifications(notification_keys)
+
+    def _apply_colors(self, command: str, arguments: dict):
+        """This method applies a set_rgb_single or set_rgb_multiple command, it returns False if the arguments are invalid."""
+
+        if command == "set_rgb_single":
+            # We check that the key and color are valid
+            key, color = arguments.get("key"), arguments.get("color")
+            if type(key) != str or type(color) != str or not self.keyboard_api.is_hex_color(color):
+                return False
+
+            return self.keyboard.set_key_color(key, tuple(bytes.fromhex(color)))
+
+        # We parse and validate the arguments in the same way as the HTTP API
+        colors = self.keyboard_api.parse_rgb_multiple_arguments(arguments)
+        return colors is not None and self.keyboard.set_multiple_colors(*colors)
+
+    def _queue_key_event(self, event_queue: asyncio.Queue, timestamp: float, key: str, pressed: bool):
+        """This method adds a key event to a client's queue, it's called on the event loop. The oldest event is dropped if the queue is full."""
+
+        if event_queue.full():
+            event_queue.get_nowait()
+
+        event_queue.put_nowait({"event": "key", "key": key, "pressed": pressed, "timestamp": timestamp})
+
+    async def _send_key_events(self, websocket, event_queue: asyncio.Queue):
+        """This method sends the key events in the queue to the client until the task is cancelled."""
+
+        try:
+            while True:
+                await websocket.send(json.dumps(await event_queue.get()))
+        except websockets.ConnectionClosed:
+            pass
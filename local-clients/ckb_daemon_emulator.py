@@ -0,0 +1 @@
+../keyboard-server/ckb_daemon_emulator.py
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import threading
+import time
+
+import keyboard as keyboard_file
+
+
+def measure_commands_per_second(execute, num_threads: int, num_commands: int):
+    """This function sends num_commands commands per thread through the execute function from num_threads threads at the same time.
+    It returns the number of commands per second that were sustained.
+    """
+
+    def send_commands():
+        """This function is the thread target that sends the commands."""
+        for i in range(num_commands):
+            # We alternate between two colors so the keyboard visibly does something
+            execute("rgb w:" + ("ffffff" if i % 2 else "000000"))
+
+    threads = [threading.Thread(target=send_commands) for _ in range(num_threads)]
+
+    start_time = time.time()
+
+    # We start all the threads and wait for them to finish
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return (num_threads * num_commands) / (time.time() - start_time)
+
+
+def main():
+    """This script measures how many commands per second the batched command writer sustains compared to opening the cmd node for every command."""
+
+    with keyboard_file.Keyboard() as keyboard:
+
+        # We print information about the keyboard object
+        print(keyboard)
+
+        for num_threads in (1, 4, 16):
+            # We measure the old path and the batched path with the same load
+            unbatched = measure_commands_per_second(keyboard.execute_command_unbatched, num_threads, 500)
+            batched = measure_commands_per_second(keyboard.execute_command, num_threads, 500)
+
+            print("{0:d} threads: unbatched {1:.0f} commands/s, batched {2:.0f} commands/s ({3:.1f}x)".format(
+                num_threads, unbatched, batched, batched / unbatched))
+
+        # We print the statistics of the batched writer
+        print(keyboard.get_command_stats())
+
+if __name__ == "__main__":
+    main()
@@ -1 +1 @@
-/home/hugo_dev/Desktop/Git Repos/ckb-water-vapor/keyboard-server/keyboard.py
\ No newline at end of file
+../keyboard-server/keyboard.py
\ No newline at end of file
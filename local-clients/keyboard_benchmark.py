@@ -0,0 +1,221 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import ckb_daemon_emulator
+import keyboard as keyboard_file
+
+
+def start_emulator(prefix: str):
+    """This function starts ckb_daemon_emulator.py in another process with its nodes in prefix, and returns the process once the keyboard exists.
+    The emulator runs in its own process so its work isn't timed or counted as allocations of the keyboard.
+    """
+
+    emulator_process = subprocess.Popen([sys.executable, ckb_daemon_emulator.__file__, "--prefix", prefix], stdout=subprocess.DEVNULL)
+
+    # We wait for the emulator to write the connected node
+    timeout = time.time() + 10
+    while time.time() < timeout:
+        if os.path.exists(os.path.join(prefix, "ckb0", "connected")) and os.path.getsize(os.path.join(prefix, "ckb0", "connected")):
+            return emulator_process
+        time.sleep(0.01)
+
+    emulator_process.kill()
+    raise OSError("The emulator didn't start")
+
+
+def make_colors(layout: list, iteration: int):
+    """This function returns a different color for every key of the layout, that also changes every iteration, so no command is ever a no-op."""
+    return [(key, ((index * 7 + iteration) % 256, (index * 13) % 256, iteration % 256)) for index, key in enumerate(layout)]
+
+
+def create_scenarios(keyboard, burst_size: int):
+    """This function returns the benchmark scenarios for an open keyboard, as a list of (name, ops per iteration, operation).
+    The operation is called with the iteration number, and every call is one timed iteration.
+    """
+
+    layout = keyboard.get_key_layout()
+
+    def set_key_color(iteration):
+        keyboard.set_key_color("w", (iteration % 256, 0, 0))
+
+    def set_multiple_colors_frame(iteration):
+        keyboard.set_multiple_colors([(key, color) for key, color in make_colors(layout, iteration)])
+
+    def execute_command_burst(iteration):
+        # We queue the whole burst without waiting, and then wait for the last command like a caller that wants everything written
+        command_number = None
+        for index in range(burst_size):
+            command_number = keyboard.execute_command("rgb w:{0:06x}".format((iteration + index) % 0xffffff), wait=False)
+        keyboard._wait_for_command(command_number)
+
+    def get_all_color_pairs(iteration):
+        keyboard.get_all_color_pairs()
+
+    # A reply to get :rgb where every key has its own color, which is as long as a reply gets
+    large_rgb_reply = ("mode 1 rgb " + " ".join(key + ":" + "{0:02x}{1:02x}{2:02x}".format(*color) for key, color in make_colors(layout, 0))).split(" ")
+
+    def parse_large_rgb_reply(iteration):
+        keyboard._parse_color_pairs(large_rgb_reply)
+
+    def get_all_key_color_pairs(iteration):
+        keyboard.get_all_key_color_pairs()
+
+    return [
+        ("set_key_color", 1, set_key_color),
+        ("set_multiple_colors_frame", 1, set_multiple_colors_frame),
+        ("execute_command_burst", burst_size, execute_command_burst),
+        ("get_all_color_pairs", 1, get_all_color_pairs),
+        ("parse_large_rgb_reply", 1, parse_large_rgb_reply),
+        ("get_all_key_color_pairs", 1, get_all_key_color_pairs),
+    ]
+
+
+def run_scenario(operation, ops_per_iteration: int, iterations: int, warmup: int):
+    """This function runs a scenario and returns its results: ops/s, the p50 and p99 latency of an iteration, and the allocations per op.
+    The allocations are measured in a separate run with tracemalloc, since tracing makes everything slower.
+    """
+
+    for iteration in range(warmup):
+        operation(iteration)
+
+    # We time every iteration
+    timings = []
+    start_time = time.perf_counter()
+    for iteration in range(iterations):
+        iteration_start = time.perf_counter()
+        operation(iteration)
+        timings.append(time.perf_counter() - iteration_start)
+    total_time = time.perf_counter() - start_time
+
+    timings.sort()
+
+    # We measure the memory that every iteration allocates at its peak, and the number of memory blocks that are still allocated afterwards
+    # The other threads of the keyboard (like the command writer) are traced too, so the allocations they make for us are counted
+    allocation_iterations = max(1, iterations // 10)
+    peak_sizes = []
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    for iteration in range(allocation_iterations):
+        tracemalloc.reset_peak()
+        size_before = tracemalloc.get_traced_memory()[0]
+        operation(iteration)
+        peak_sizes.append(tracemalloc.get_traced_memory()[1] - size_before)
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained_blocks = sum(statistic.count_diff for statistic in snapshot_after.compare_to(snapshot_before, "filename"))
+
+    return {
+        "iterations": iterations,
+        "ops_per_iteration": ops_per_iteration,
+        "ops_per_second": iterations * ops_per_iteration / total_time,
+        "p50_us": timings[len(timings) // 2] * 1e6,
+        "p99_us": timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e6,
+        "mean_us": statistics.mean(timings) * 1e6,
+        "peak_bytes_per_op": statistics.mean(peak_sizes) / ops_per_iteration,
+        "retained_blocks_per_op": retained_blocks / (allocation_iterations * ops_per_iteration),
+    }
+
+
+def print_results(results: dict, previous_results: dict = None):
+    """This function prints the results as a table, with the change in ops/s from the previous results if there are any."""
+
+    print("{0:<28s}{1:>14s}{2:>12s}{3:>12s}{4:>16s}{5:>12s}".format("scenario", "ops/s", "p50 us", "p99 us", "peak B/op", "vs previous"))
+    for name, result in results.items():
+        change = ""
+        if previous_results is not None and name in previous_results:
+            change = "{0:+.1f}%".format((result["ops_per_second"] / previous_results[name]["ops_per_second"] - 1) * 100)
+
+        print("{0:<28s}{1:>14.0f}{2:>12.1f}{3:>12.1f}{4:>16.0f}{5:>12s}".format(
+            name, result["ops_per_second"], result["p50_us"], result["p99_us"], result["peak_bytes_per_op"], change))
+
+
+def main():
+    """This script benchmarks the command and parse paths of keyboard.Keyboard against an emulated ckb-daemon, and saves the results as JSON."""
+
+    parser = argparse.ArgumentParser(description="Benchmarks keyboard.Keyboard against an emulated ckb-daemon.")
+    parser.add_argument("--iterations", type=int, default=1000, help="the number of timed iterations of every scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="the number of untimed iterations before the timed ones")
+    parser.add_argument("--burst-size", type=int, default=10000, help="the number of commands in an execute_command burst")
+    parser.add_argument("--burst-iterations", type=int, default=20, help="the number of timed bursts")
+    parser.add_argument("--scenario", action="append", help="the name of a scenario to run, can be used several times (default: all of them)")
+    parser.add_argument("--diff-rendering", action="store_true", help="benchmark a keyboard with diff rendering")
+    parser.add_argument("--frame-scheduler", action="store_true", help="benchmark a keyboard with the frame scheduler")
+    parser.add_argument("--output", help="the file to save the results in as JSON")
+    parser.add_argument("--compare", help="a JSON file from an earlier run to compare the results with")
+    args = parser.parse_args()
+
+    results = {}
+
+    prefix = tempfile.mkdtemp(prefix="ckb-benchmark-")
+    emulator_process = start_emulator(prefix)
+
+    try:
+        with keyboard_file.Keyboard(device_prefix=prefix, diff_rendering=args.diff_rendering, frame_scheduler=args.frame_scheduler) as keyboard:
+            for name, ops_per_iteration, operation in create_scenarios(keyboard, args.burst_size):
+                if args.scenario is not None and name not in args.scenario:
+                    continue
+
+                # Bursts are a lot longer than the other iterations, so they have their own number of iterations
+                iterations = args.burst_iterations if name == "execute_command_burst" else args.iterations
+                warmup = min(args.warmup, iterations)
+
+                results[name] = run_scenario(operation, ops_per_iteration, iterations, warmup)
+
+    finally:
+        emulator_process.terminate()
+        emulator_process.wait()
+        shutil.rmtree(prefix, ignore_errors=True)
+
+    previous_results = None
+    if args.compare is not None:
+        with open(args.compare) as compare_file:
+            previous_results = json.load(compare_file)["results"]
+
+    print_results(results, previous_results)
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump({
+                "time": time.time(),
+                "python": sys.version,
+                "platform": platform.platform(),
+                "options": {"diff_rendering": args.diff_rendering, "frame_scheduler": args.frame_scheduler, "burst_size": args.burst_size},
+                "results": results,
+            }, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+../keyboard-server/metrics.py
\ No newline at end of file
@@ -29,7 +29,8 @@ def main():
     """The main method of the project."""
 
     # We get the keyboard, if there aren't any keyboards connected, the program will exit here
-    with keyboard_file.Keyboard() as keyboard:
+    # We use diff rendering as we set the same colors over and over again
+    with keyboard_file.Keyboard(diff_rendering=True) as keyboard:
 
         # We print information about the keyboard object
         print(keyboard)
@@ -42,15 +43,18 @@ def main():
 
         keyboard.cmd_set_notification(["all"])
 
+        # We print every key event, the keyboard calls our handler so we don't have to poll for notifications
+        keyboard.subscribe_key_events(print_key_event)
+
+        # We keep setting the colors, the key events are printed by the handler when they arrive
         while True:
             time.sleep(1 / 10)
-            start_time = time.time()
             keyboard.set_multiple_colors([("w,a,s,d,up,left,down,right", (255, 255, 255))], (255, 0, 0))
-            notifs = keyboard.get_notifications()
 
-            if notifs:
-                print(notifs)
-                print("Time taken for color change and notification request:", time.time() - start_time)
+
+def print_key_event(timestamp, key, pressed):
+    """This function prints a key event and how long ago it was read from the notification node."""
+    print("Key", key, "pressed" if pressed else "released", "({0:.2f} ms ago)".format((time.time() - timestamp) * 1000))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1 @@
+../keyboard-server/tracing.py
\ No newline at end of file
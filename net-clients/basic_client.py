@@ -22,22 +22,23 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
-import json
 import string
 import threading
 import time
 
 import requests
 
+from keyboard_client import Keyboard_Client
+
 
 def __init__():
     """This method starts a simple client that lights all the (alphanumeric + some more) keys that correspond to the text the user inputs."""
 
     # We make some variables global so the request thread can access them
-    global char_list, char_lock, mc, fg, should_exit, activation_time, server_url, special_dict
+    global char_list, char_lock, fg, should_exit, activation_time, client, special_dict
 
-    # We get the server ip/url
-    server_url = "http://" + input("Please input url or IP to the keyboard server:") + ":42069/keyboard"
+    # We get the server ip/url, all requests are sent over the keep-alive connections of the client
+    client = Keyboard_Client("http://" + input("Please input url or IP to the keyboard server:") + ":42069")
 
     # A dictionary that maps the result of pressing a key in input() to the keycode for ckb-daemon and a boolean indicating if this input is generated by pressing the shift (assumed leftshift)
     special_dict = {
@@ -75,17 +76,12 @@ def __init__():
         "½": ("grave", True),
     }
 
-    # The background, foreground, and middle (a mix between the two) colors
+    # The background and foreground colors
     bg = "000000"
     fg = get_average_color()
 
     print("Using average color " + fg)
 
-    # We calculate the middle color via conversions and simple math
-    mc = "".join([str(format(int(x), "02x")) for x in (
-    int((int(fg[:2], base=16) + int(bg[:2], base=16)) / 2), int((int(fg[2:4], base=16) + int(bg[2:4], base=16)) / 2),
-    int((int(fg[4:6], base=16) + int(bg[4:6], base=16)) / 2))])
-
     # The list of chars that we're going to output to the keyboard
     char_list = []
 
@@ -111,6 +107,7 @@ def __init__():
             print("Exiting")
             # IDK if this will ever be needed, but maybe some edge-case somewhere will use this
             request_thread.join()
+            client.close()
             exit()
 
         # We get text from the user
@@ -119,13 +116,11 @@ def __init__():
         # If the user just pressed enter we make the whole keyboard the background color
         if raw_input == "_clear":
             # We send a request to the server to make the whole keyboard the background color
-            requests.post(server_url,
-                          data=json.dumps({"command": "set_rgb_single", "arguments": {"key": "all", "color": bg}}))
+            client.set_rgb_single("all", bg)
 
         elif raw_input == "_fill":
             # We send a request to the keyboard server to make the whole keyboard the foreground color
-            requests.post(server_url,
-                          data=json.dumps({"command": "set_rgb_single", "arguments": {"key": "all", "color": fg}}))
+            client.set_rgb_single("all", fg)
 
         elif raw_input == "_exit":
             # We exit
@@ -134,6 +129,7 @@ def __init__():
             should_exit = True
             # We wait for the thread to exit
             request_thread.join()
+            client.close()
             exit()
 
         elif raw_input.startswith("_act_time"):
@@ -187,9 +183,8 @@ def output_colors():
 
             # Try except block to catch connection errors
             try:
-                # We send a request to the server to make the char (as they will match to the keycodes) to the middle colour
-                requests.post(server_url,
-                              data=json.dumps({"command": "set_rgb_single", "arguments": {"key": char, "color": mc}}))
+                # We send a request to the server to fade the char (as they will match to the keycodes) to the foreground color, the server does the fading
+                client.fade_rgb([(char, fg)], activation_time, easing="ease_in_out")
             except requests.exceptions.ConnectionError:
                 print(
                     "Error when connecting to keyboard server, are you sure the server url is correct? (Press return to exit)")
@@ -197,20 +192,7 @@ def output_colors():
                 should_exit = True
                 return
 
-            time.sleep(activation_time / 2)
-
-            # Try except block to catch connection errors
-            try:
-                # We send a request to the server to make the char (as they will match to the keycodes) to the foreground color
-                requests.post(server_url,
-                              data=json.dumps({"command": "set_rgb_single", "arguments": {"key": char, "color": fg}}))
-            except requests.exceptions.ConnectionError:
-                print("Error when connecting to keyboard server, are you sure the server is up? (Press return to exit)")
-                # We signal to the main thread should exit
-                should_exit = True
-                return
-
-            time.sleep(activation_time / 2)
+            time.sleep(activation_time)
 
         # We check if we should exit
         if should_exit:
@@ -230,24 +212,22 @@ def get_average_color():
                       + [special_dict[key][0] for _, key in enumerate(special_dict) if not special_dict[key][1]]\
                       + ["lshift"]
 
-    # We make a GET request with the supported chars as the keys list and parse the response as JSON (requests does this for us)
-    key_data = requests.get(server_url, data=json.dumps(
-        {"command": "get_multiple_key_rgb", "arguments": {"keys": supported_chars, "color_format": "ints"}})).json()
-
-    # We check if the API request failed
-    if "message" in key_data:
-        # We return a default color
+    # We get the colors of the supported chars as tuples of ints
+    try:
+        key_data = client.get_multiple_key_rgb(supported_chars)
+    except requests.exceptions.HTTPError:
+        # The API request failed, so we return a default color
         return "ffffff"
 
-    # The request didn't fail in that way, so we check if it failed and didn't give us any data
-    if key_data["keys"] == {}:
+    # The request didn't fail, so we check if it didn't give us any data
+    if key_data == {}:
         # We return a default color
         return "ffffff"
 
     # We didn't fail, and we got data back, so we make an average of the colors (separately)
     # We do all of this by abusing list comprehensions
     avg_color = tuple(
-        [int(sum([key_data["keys"][t][x] for t in key_data["keys"]]) / len([key_data["keys"][t][x] for t in key_data["keys"]])) for x in range(3)])
+        [int(sum([key_data[t][x] for t in key_data]) / len([key_data[t][x] for t in key_data])) for x in range(3)])
 
     # We return a hex representation of the color
     return "".join([str(format(int(x), "02x")) for x in avg_color])
@@ -0,0 +1,109 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import colorsys
+import time
+
+import requests
+
+# The binary frame format of the keyboard server (see keyboard-server/binary_frame.py), it's repeated here so the client doesn't need the server code
+FRAME_MAGIC = b"CKBF"
+FRAME_FORMAT_VERSION = 1
+FRAME_FLAG_KEY_MASK = 1
+FRAME_FLAG_PADDING = 2
+
+
+class Frame_Client(object):
+    """This class sends binary frames to the /keyboard/frame API of a keyboard server, over one keep-alive connection."""
+
+    def __init__(self, server_url: str):
+        """This method connects to the server at server_url (like "http://localhost:42069") and gets the key layout of its keyboard."""
+
+        self.frame_url = server_url + "/keyboard/frame"
+
+        # We use a session so every frame is sent over the same connection
+        self.session = requests.Session()
+
+        layout = self.session.get(self.frame_url, headers={"Accept": "application/json"}).json()
+        if layout["format_version"] != FRAME_FORMAT_VERSION:
+            raise ValueError("The server uses an unsupported frame format")
+
+        # The keycodes in frame order, and the keycode to frame index table
+        self.keycodes = layout["keycodes"]
+        self.index = {key: slot for slot, key in enumerate(self.keycodes)}
+
+    def send_frame(self, key_colors: dict, background: tuple = (0, 0, 0)):
+        """This method sets the color of every key, key_colors is a dict of keycode to color (as a tuple of 3 ints), and the other keys get the background."""
+
+        background = bytes(background)
+        self._send(b"".join([bytes(key_colors[key]) if key in key_colors else background for key in self.keycodes]))
+
+    def send_colors(self, colors: list):
+        """This method sets the color of every key, colors is a list with a color (as a tuple of 3 ints) for every key in the order of self.keycodes."""
+        self._send(b"".join([bytes(color) for color in colors]))
+
+    def send_keys(self, key_colors: dict):
+        """This method only sets the colors of the keys in key_colors, a dict of keycode to color (as a tuple of 3 ints). Keys the keyboard doesn't have are ignored."""
+
+        # We set the bits of the keys that we send colors for, the colors have to be in frame order
+        mask = bytearray((len(self.keycodes) + 7) // 8)
+        slots = sorted([self.index[key] for key in key_colors if key in self.index])
+        for slot in slots:
+            mask[slot // 8] |= 1 << (slot % 8)
+
+        # A frame with exactly 3 bytes per key is read as a frame without a header, so we add a padding byte if this one would have that length
+        flags, padding = FRAME_FLAG_KEY_MASK, b""
+        if len(FRAME_MAGIC) + 2 + len(mask) + 3 * len(slots) == 3 * len(self.keycodes):
+            flags, padding = flags | FRAME_FLAG_PADDING, b"\x00"
+
+        self._send(FRAME_MAGIC + bytes((FRAME_FORMAT_VERSION, flags)) + bytes(mask) + padding
+                   + b"".join([bytes(key_colors[self.keycodes[slot]]) for slot in slots]))
+
+    def _send(self, frame: bytes):
+        """This method posts a frame to the server, it raises an exception if the server doesn't accept it."""
+
+        response = self.session.post(self.frame_url, data=frame,
+                                     headers={"Content-Type": "application/octet-stream", "Accept": "application/json"})
+        response.raise_for_status()
+
+
+def __init__():
+    """This method starts a simple client that shows a moving rainbow on the keyboard, rendered here and streamed to the server at 60 fps."""
+
+    client = Frame_Client("http://" + input("Please input url or IP to the keyboard server:") + ":42069")
+
+    start_time = time.time()
+    while True:
+        frame_start_time = time.time()
+
+        # Every key gets a hue from its position in the layout, that moves over time
+        offset = (frame_start_time - start_time) / 4
+        client.send_colors([tuple([int(255 * x) for x in colorsys.hsv_to_rgb((offset + slot / len(client.keycodes)) % 1, 1, 1)])
+                            for slot in range(len(client.keycodes))])
+
+        time.sleep(max(0.0, 1 / 60 - (time.time() - frame_start_time)))
+
+
+if __name__ == "__main__":
+    __init__()
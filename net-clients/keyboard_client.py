@@ -0,0 +1,341 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+
+import requests
+import requests.adapters
+
+
+def format_color(color):
+    """This function returns color, a tuple of 3 ints or a hex string, as the lowercase 6 char hex string the API takes."""
+
+    if type(color) == str:
+        color = color.lower()
+        if len(color) != 6 or not all(c in "0123456789abcdef" for c in color):
+            raise ValueError("Invalid hex color: " + color)
+        return color
+
+    if len(color) != 3 or not all(type(x) == int and 0 <= x <= 255 for x in color):
+        raise ValueError("Invalid color: " + repr(color))
+    return bytes(color).hex()
+
+
+class Keyboard_Client(object):
+    """This class uses the /keyboard API of a keyboard server over a pool of keep-alive connections.
+    Its methods send one command each and wait for the response, except queue_color, which only stores the color.
+    Queued colors are sent together as one set_rgb_multiple request by a background thread, when flush_interval seconds have passed since the first
+    one was queued or when max_batch_keys keys are waiting, whichever comes first. A key that is queued again before it's sent only sends its last color.
+    Requests that fail because of the connection or a 5xx response are retried up to retries times, with exponential backoff starting at backoff seconds.
+    Other failed requests raise requests.HTTPError.
+    The methods can be called from many threads at the same time, use it with a with statement or call close() when you're done.
+    """
+
+    def __init__(self, server_url: str, flush_interval: float = 0.02, max_batch_keys: int = 64, retries: int = 3, backoff: float = 0.05,
+                 timeout: float = 5, pool_size: int = 4):
+        """This method creates the client, server_url is like "http://localhost:42069".
+        pool_size is the number of keep-alive connections that are kept open, and the most requests that are sent at the same time without waiting for a connection.
+        """
+
+        self.keyboard_url = server_url + "/keyboard"
+        self.flush_interval = flush_interval
+        self.max_batch_keys = max_batch_keys
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # We use one session for all requests so they reuse the connections in its pool, we do the retries ourselves
+        self.session = requests.Session()
+        self.session.mount(server_url, requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0))
+        self.session.headers.update({"Accept": "application/json"})
+
+        # The queued colors, a dict of keycode to hex color in the order they were queued, and the queued background (None means there is none)
+        self.pending_colors = {}
+        self.pending_background = None
+        self.pending_since = None
+
+        # The condition the flush thread waits on, it also guards the queued colors
+        self.pending_condition = threading.Condition()
+
+        # The lock that makes sure color changes reach the server in the order they were made
+        self.send_lock = threading.Lock()
+
+        # The exception that the last background flush raised, it's raised by the next call to queue_color or flush
+        self.flush_error = None
+
+        # The last get_multiple_key_rgb responses and their ETags, so unchanged colors aren't sent again
+        self.key_rgb_cache = {}
+        self.key_rgb_cache_lock = threading.Lock()
+
+        # We start the thread that sends the queued colors
+        self.should_exit = False
+        self.flush_thread = threading.Thread(target=self._flush_thread, daemon=True)
+        self.flush_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """This method sends the queued colors, stops the flush thread, and closes the connections."""
+
+        with self.pending_condition:
+            self.should_exit = True
+            self.pending_condition.notify()
+        self.flush_thread.join()
+
+        try:
+            self.flush()
+        finally:
+            self.session.close()
+
+    def set_rgb_single(self, key: str, color):
+        """This method sets key (a keycode, or "all") to color (a tuple of 3 ints or a hex string), after the queued colors have been sent."""
+
+        self._send_color_command({"command": "set_rgb_single", "arguments": {"key": key, "color": format_color(color)}})
+
+    def set_rgb_multiple(self, keys_and_colors: list, background=None):
+        """This method sets many keys with one request, keys_and_colors is a list of (keys, color) pairs where keys is a keycode or comma separated keycodes.
+        background, if it's not None, is the color of every key that isn't in the list. The queued colors are sent first.
+        """
+
+        arguments = {"keys_and_colors": [[keys, format_color(color)] for keys, color in keys_and_colors]}
+        if background is not None:
+            arguments["background"] = format_color(background)
+
+        self._send_color_command({"command": "set_rgb_multiple", "arguments": arguments})
+
+    def fade_rgb(self, keys_and_colors: list, duration: float, background=None, easing: str = "linear"):
+        """This method fades keys to new colors on the server over duration seconds, the arguments are the same as for set_rgb_multiple.
+        easing is "linear", "ease_in", "ease_out", or "ease_in_out". It returns when the server has started the fade. The queued colors are sent first.
+        """
+
+        arguments = {"keys_and_colors": [[keys, format_color(color)] for keys, color in keys_and_colors], "duration": duration * 1000, "easing": easing}
+        if background is not None:
+            arguments["background"] = format_color(background)
+
+        self._send_color_command({"command": "fade_rgb", "arguments": arguments})
+
+    def get_multiple_key_rgb(self, keys: list, color_format: str = "ints", sync: bool = False):
+        """This method returns a dict of keycode to color for the keys in keys that are on the server keyboard.
+        The colors are tuples of 3 ints, or hex strings if color_format is "hex". If sync is true the server reads the colors from the daemon first.
+        The colors are read from the server, the queued colors that haven't been sent yet aren't in them.
+        """
+
+        color_format = "hex" if color_format == "hex" else "ints"
+        cache_key = (tuple(sorted(set(keys))), color_format)
+        with self.key_rgb_cache_lock:
+            etag, key_colors = self.key_rgb_cache.get(cache_key, (None, None))
+
+        # We send the ETag of the last response for the same keys, if the colors haven't changed the server answers with 304 and no body
+        response = self._request(self.session.get, {"command": "get_multiple_key_rgb", "arguments": {"keys": list(cache_key[0]), "color_format": color_format, "sync": sync}},
+                                 {} if etag is None else {"If-None-Match": etag})
+        if response.status_code == 304:
+            return dict(key_colors)
+
+        key_colors = response.json()["keys"]
+        if color_format == "ints":
+            key_colors = {key: tuple(color) for key, color in key_colors.items()}
+
+        if "ETag" in response.headers:
+            with self.key_rgb_cache_lock:
+                self.key_rgb_cache[cache_key] = (response.headers["ETag"], key_colors)
+
+        return dict(key_colors)
+
+    def queue_color(self, keys: str, color):
+        """This method queues keys (a keycode, comma separated keycodes, or "all") to be set to color (a tuple of 3 ints or a hex string) by the next flush.
+        It doesn't wait for anything, it raises the exception of the last background flush if that failed.
+        """
+
+        color = format_color(color)
+
+        with self.pending_condition:
+            self._raise_flush_error()
+
+            if keys == "all":
+                # Every key gets the color, so the keys that were queued before don't need to be sent
+                self.pending_colors = {}
+                self.pending_background = color
+            else:
+                for key in keys.split(","):
+                    # We move the key last, so the order of the keys is the order they were last changed in
+                    self.pending_colors.pop(key, None)
+                    self.pending_colors[key] = color
+
+            # We wake the flush thread if this is the first queued color, so it starts its timer, or if the batch is full
+            if self.pending_since is None or len(self.pending_colors) >= self.max_batch_keys or keys == "all":
+                self.pending_since = self.pending_since or time.perf_counter()
+                self.pending_condition.notify()
+
+    def flush(self):
+        """This method sends the queued colors now, and returns when the server has set them."""
+
+        with self.send_lock:
+            with self.pending_condition:
+                self._raise_flush_error()
+            self._send_pending()
+
+    def _send_color_command(self, body: dict):
+        """This method sends the queued colors and then a command that changes colors, so the colors are set in the order they were changed in."""
+
+        with self.send_lock:
+            self._send_pending()
+            self._request(self.session.post, body)
+
+    def _send_pending(self):
+        """This method sends the queued colors as one set_rgb_multiple request, the send lock must be held."""
+
+        with self.pending_condition:
+            pending_colors, background = self.pending_colors, self.pending_background
+            self.pending_colors, self.pending_background, self.pending_since = {}, None, None
+
+        if not pending_colors and background is None:
+            return
+
+        # We send the keys that get the same color as one comma separated pair, the keys are all different so their order doesn't matter
+        keys_by_color = {}
+        for key, color in pending_colors.items():
+            keys_by_color.setdefault(color, []).append(key)
+
+        arguments = {"keys_and_colors": [[",".join(keys), color] for color, keys in keys_by_color.items()]}
+        if background is not None:
+            arguments["background"] = background
+
+        self._request(self.session.post, {"command": "set_rgb_multiple", "arguments": arguments})
+
+    def _flush_thread(self):
+        """This method is the flush thread, it sends the queued colors when they've waited flush_interval seconds or the batch is full."""
+
+        while True:
+            with self.pending_condition:
+                while not self.should_exit:
+                    if self.pending_since is not None:
+                        # We wait until the first queued color has waited flush_interval, or the batch is full
+                        remaining = self.pending_since + self.flush_interval - time.perf_counter()
+                        if remaining <= 0 or len(self.pending_colors) >= self.max_batch_keys or self.pending_background is not None:
+                            break
+                        self.pending_condition.wait(remaining)
+                    else:
+                        self.pending_condition.wait()
+
+                if self.should_exit:
+                    return
+
+            try:
+                with self.send_lock:
+                    self._send_pending()
+            except requests.exceptions.RequestException as e:
+                with self.pending_condition:
+                    self.flush_error = e
+
+    def _raise_flush_error(self):
+        """This method raises the exception of the last background flush if it failed, the pending condition must be held."""
+
+        if self.flush_error is not None:
+            error, self.flush_error = self.flush_error, None
+            raise error
+
+    def _request(self, method, body: dict, headers: dict = {}):
+        """This method sends a request to the API and returns the response, retrying it if the connection failed or the server returned a 5xx.
+        It raises requests.HTTPError if the server returned any other error, or the last exception if all the tries failed.
+        """
+
+        data = json.dumps(body).encode("utf-8")
+
+        for attempt in range(self.retries + 1):
+            try:
+                response = method(self.keyboard_url, data=data, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code < 500 or attempt == self.retries:
+                    response.raise_for_status()
+                    return response
+
+            # We wait longer after every failed try, so a restarting server isn't flooded
+            time.sleep(self.backoff * 2 ** attempt)
+
+
+class Async_Keyboard_Client(object):
+    """This class is Keyboard_Client for use with asyncio, the requests are sent from a thread pool with one thread per pooled connection.
+    Use it with an async with statement, and await its methods, except queue_color, which doesn't wait for anything.
+    """
+
+    def __init__(self, server_url: str, flush_interval: float = 0.02, max_batch_keys: int = 64, retries: int = 3, backoff: float = 0.05,
+                 timeout: float = 5, pool_size: int = 4):
+        """This method creates the client, the arguments mean the same as for Keyboard_Client."""
+
+        self.client = Keyboard_Client(server_url, flush_interval=flush_interval, max_batch_keys=max_batch_keys, retries=retries, backoff=backoff,
+                                      timeout=timeout, pool_size=pool_size)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """This method sends the queued colors, and closes the connections and the thread pool."""
+
+        try:
+            await self._run(self.client.close)
+        finally:
+            self.executor.shutdown(wait=False)
+
+    async def set_rgb_single(self, key: str, color):
+        """This method does the same as Keyboard_Client.set_rgb_single."""
+        await self._run(self.client.set_rgb_single, key, color)
+
+    async def set_rgb_multiple(self, keys_and_colors: list, background=None):
+        """This method does the same as Keyboard_Client.set_rgb_multiple."""
+        await self._run(self.client.set_rgb_multiple, keys_and_colors, background)
+
+    async def fade_rgb(self, keys_and_colors: list, duration: float, background=None, easing: str = "linear"):
+        """This method does the same as Keyboard_Client.fade_rgb."""
+        await self._run(self.client.fade_rgb, keys_and_colors, duration, background, easing)
+
+    async def get_multiple_key_rgb(self, keys: list, color_format: str = "ints", sync: bool = False):
+        """This method does the same as Keyboard_Client.get_multiple_key_rgb."""
+        return await self._run(self.client.get_multiple_key_rgb, keys, color_format, sync)
+
+    def queue_color(self, keys: str, color):
+        """This method does the same as Keyboard_Client.queue_color, it doesn't block the event loop."""
+        self.client.queue_color(keys, color)
+
+    async def flush(self):
+        """This method does the same as Keyboard_Client.flush."""
+        await self._run(self.client.flush)
+
+    async def _run(self, function, *args):
+        """This method runs function with args in the thread pool and returns what it returns."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
@@ -0,0 +1,254 @@
+"""
+The MIT License (MIT)
+
+Copyright (c) 2016 Hugo Berg
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+# The keys that set_rgb_single requests change, and that get_multiple_key_rgb requests read
+LOAD_KEYS = ["esc", "w", "a", "s", "d", "q", "e", "r", "f", "space", "lshift", "lctrl", "tab", "1", "2", "3", "4", "enter", "up", "down", "left", "right"]
+
+
+class Load_Generator(object):
+    """This class sends a mix of set_rgb_single POSTs and get_multiple_key_rgb GETs to a keyboard server and records how long they take.
+    With a rate it sends requests at that fixed rate (an open loop, a slow server makes the latencies grow instead of the rate drop),
+    without one every worker sends its next request as soon as the last one is answered (a closed loop).
+    """
+
+    def __init__(self, server_url: str, concurrency: int = 8, rate: float = None, set_fraction: float = 0.8, keys_per_get: int = 8):
+        """This method creates the generator, server_url is like "http://localhost:42069".
+        concurrency is the number of workers (every worker has its own keep-alive connection), and the most requests that are sent at the same time.
+        rate is the number of requests per second for an open loop, None means a closed loop.
+        set_fraction is the fraction of the requests that are set_rgb_single, the rest are get_multiple_key_rgb with keys_per_get keys.
+        """
+
+        self.keyboard_url = server_url + "/keyboard"
+        self.concurrency = concurrency
+        self.rate = rate
+        self.set_fraction = set_fraction
+        self.keys_per_get = keys_per_get
+
+        # The lock of the request counter and the results
+        self.lock = threading.Lock()
+        self.request_count = 0
+
+        # The latencies of the successful requests of every command, the number of failed requests, and the send time of every color that was set
+        self.latencies = {"set_rgb_single": [], "get_multiple_key_rgb": []}
+        self.error_counts = {"set_rgb_single": 0, "get_multiple_key_rgb": 0}
+        self.color_send_times = {}
+
+    def run(self, duration: float):
+        """This method sends requests for duration seconds, and returns the number of seconds it took until every request was answered."""
+
+        start_time = time.perf_counter()
+        end_time = start_time + duration
+
+        workers = [threading.Thread(target=self._worker, args=(start_time, end_time)) for _ in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        return time.perf_counter() - start_time
+
+    def _worker(self, start_time: float, end_time: float):
+        """This method is a worker thread, it sends requests until end_time."""
+
+        session = requests.Session()
+
+        while True:
+            with self.lock:
+                request_number = self.request_count
+                self.request_count += 1
+
+            if self.rate is None:
+                scheduled_time = time.perf_counter()
+            else:
+                # We wait until it's time for the request, and measure from that time so the time it waited for a worker counts as latency
+                scheduled_time = start_time + request_number / self.rate
+                delay = scheduled_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if scheduled_time >= end_time:
+                return
+
+            # We spread the commands evenly over the requests, with the same mix in every part of the run
+            if int((request_number + 1) * self.set_fraction) != int(request_number * self.set_fraction):
+                self._set_rgb_single(session, request_number, scheduled_time)
+            else:
+                self._get_multiple_key_rgb(session, request_number, scheduled_time)
+
+    def _set_rgb_single(self, session, request_number: int, scheduled_time: float):
+        """This method sends a set_rgb_single request, every request sets a different color so it can be found at the cmd node of the daemon."""
+
+        color = "{0:06x}".format(request_number % 0x1000000)
+        with self.lock:
+            self.color_send_times[color] = scheduled_time
+
+        self._send(session, session.post, "set_rgb_single", scheduled_time,
+                   {"command": "set_rgb_single", "arguments": {"key": LOAD_KEYS[request_number % len(LOAD_KEYS)], "color": color}})
+
+    def _get_multiple_key_rgb(self, session, request_number: int, scheduled_time: float):
+        """This method sends a get_multiple_key_rgb request for keys_per_get keys."""
+
+        keys = [LOAD_KEYS[(request_number + index) % len(LOAD_KEYS)] for index in range(self.keys_per_get)]
+        self._send(session, session.get, "get_multiple_key_rgb", scheduled_time,
+                   {"command": "get_multiple_key_rgb", "arguments": {"keys": keys, "color_format": "hex"}})
+
+    def _send(self, session, method, command: str, scheduled_time: float, body: dict):
+        """This method sends a request and records its latency, or that it failed."""
+
+        try:
+            response = method(self.keyboard_url, data=json.dumps(body).encode("utf-8"), headers={"Accept": "application/json"}, timeout=10)
+            succeeded = response.status_code == 200
+        except requests.exceptions.RequestException:
+            succeeded = False
+
+        latency = time.perf_counter() - scheduled_time
+        with self.lock:
+            if succeeded:
+                self.latencies[command].append(latency)
+            else:
+                self.error_counts[command] += 1
+
+
+def percentiles(values: list):
+    """This function returns the count, p50, p90, p99, and max of a list of seconds, in milliseconds."""
+
+    if not values:
+        return {"count": 0}
+
+    values = sorted(values)
+    return {"count": len(values), "p50_ms": values[len(values) // 2] * 1000, "p90_ms": values[int(len(values) * 0.9)] * 1000,
+            "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, "max_ms": values[-1] * 1000}
+
+
+def start_emulated_server(server_directory: str, on_command):
+    """This function starts a ckb-daemon emulator in this process, and the keyboard server in another process that uses it.
+    It returns the emulator and the server process, on_command(device, line, timestamp) is called for every command the server writes.
+    """
+
+    # The emulator is part of the server code, and reads the server config from the working directory
+    sys.path.insert(0, server_directory)
+    os.chdir(server_directory)
+    from ckb_daemon_emulator import Ckb_Daemon_Emulator
+
+    emulator = Ckb_Daemon_Emulator(on_command=on_command).__enter__()
+    server_process = subprocess.Popen([sys.executable, "__init__.py", "--device-prefix", emulator.prefix, "--websocket-port", "0"],
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # We wait for the server to answer
+    timeout = time.time() + 15
+    while time.time() < timeout:
+        try:
+            requests.get("http://localhost:42069/keyboard", timeout=1)
+            return emulator, server_process
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+
+    server_process.kill()
+    emulator.__exit__()
+    raise OSError("The keyboard server didn't start")
+
+
+def __init__():
+    """This method runs a load test against a keyboard server, and prints the throughput, latencies, and errors."""
+
+    parser = argparse.ArgumentParser(description="Sends a mix of set_rgb_single and get_multiple_key_rgb requests to a keyboard server and measures them.")
+    parser.add_argument("--server", default="http://localhost:42069", help="the url of the keyboard server")
+    parser.add_argument("--duration", type=float, default=10, help="the number of seconds to send requests for")
+    parser.add_argument("--concurrency", type=int, default=8, help="the number of connections that send requests at the same time")
+    parser.add_argument("--rate", type=float, help="the number of requests per second to send (default: as many as the server answers, with --concurrency requests at a time)")
+    parser.add_argument("--set-fraction", type=float, default=0.8, help="the fraction of the requests that are set_rgb_single, the rest are get_multiple_key_rgb")
+    parser.add_argument("--keys-per-get", type=int, default=8, help="the number of keys that every get_multiple_key_rgb request reads")
+    parser.add_argument("--emulated-server", action="store_true",
+                        help="start a keyboard server against a ckb-daemon emulator, and measure when the commands reach the daemon")
+    parser.add_argument("--server-directory", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "keyboard-server"),
+                        help="the directory of the keyboard server, for --emulated-server")
+    parser.add_argument("--output", help="the file to save the results in as JSON")
+    args = parser.parse_args()
+
+    generator = Load_Generator(args.server, concurrency=args.concurrency, rate=args.rate, set_fraction=args.set_fraction, keys_per_get=args.keys_per_get)
+
+    # The times from sending a set_rgb_single request until its color was written to the cmd node
+    daemon_latencies = []
+
+    def record_command(device, line, timestamp):
+        """This function finds the request that a command at the cmd node came from, and records how long it took to get there."""
+
+        words = line.split(" ")
+        if words[0] != "rgb":
+            return
+
+        for word in words[1:]:
+            with generator.lock:
+                send_time = generator.color_send_times.pop(word.rpartition(":")[2], None)
+            if send_time is not None:
+                daemon_latencies.append(timestamp - send_time)
+
+    emulator = server_process = None
+    if args.emulated_server:
+        emulator, server_process = start_emulated_server(os.path.abspath(args.server_directory), record_command)
+
+    try:
+        run_time = generator.run(args.duration)
+    finally:
+        if server_process is not None:
+            server_process.send_signal(signal.SIGTERM)
+            server_process.wait()
+            emulator.__exit__()
+
+    request_count = sum(len(latencies) for latencies in generator.latencies.values()) + sum(generator.error_counts.values())
+    results = {
+        "requests": request_count,
+        "requests_per_second": request_count / run_time,
+        "error_rate": sum(generator.error_counts.values()) / max(1, request_count),
+        "errors": generator.error_counts,
+        "latency": {command: percentiles(latencies) for command, latencies in generator.latencies.items()},
+    }
+    if args.emulated_server:
+        results["request_to_daemon_write"] = percentiles(daemon_latencies)
+
+    print("{0:d} requests in {1:.1f} s, {2:.0f} requests/s, {3:.2%} errors".format(
+        request_count, run_time, results["requests_per_second"], results["error_rate"]))
+    for name, latency in list(results["latency"].items()) + [("request_to_daemon_write", results.get("request_to_daemon_write", {"count": 0}))]:
+        if latency["count"]:
+            print("{0:<26s}{1:>8d} p50 {2:7.2f} ms  p90 {3:7.2f} ms  p99 {4:7.2f} ms  max {5:7.2f} ms".format(
+                name, latency["count"], latency["p50_ms"], latency["p90_ms"], latency["p99_ms"], latency["max_ms"]))
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4)
+
+
+if __name__ == "__main__":
+    __init__()